@@ -0,0 +1,482 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Throughput benchmark for the registration pipeline.
+
+A synthetic Butler repository is populated with generated files, and
+each stage of registration is timed in isolation against Rucio clients
+which inject a fixed latency instead of talking to a server.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import click
+import pydantic
+from rucio.client.didclient import DIDClient
+from rucio.client.replicaclient import ReplicaClient
+
+from lsst.daf.butler import Butler, DatasetRef, DatasetType, FileDataset
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.fake_rucio import FakeRucioServer
+from lsst.rucio.register.resource_bundle import ResourceBundle
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.sidecar import SIDECAR_ENCODINGS
+
+__all__ = [
+    "STAGES",
+    "LatencyDIDClient",
+    "LatencyReplicaClient",
+    "LatencyRuleClient",
+    "StageResult",
+    "compare_to_baseline",
+    "make_synthetic_repo",
+    "run_benchmark",
+]
+
+STAGES = ["ref_query", "uri_lookup", "hashing", "did_build", "did_batch", "add_replicas", "attach"]
+
+_INSTRUMENT = "BenchCam"
+_DATASET_TYPE = "rucio_register_bench"
+_RUN = "bench/run"
+_FORMATTER = "lsst.daf.butler.formatters.json.JsonFormatter"
+
+
+class LatencyReplicaClient:
+    """Stand-in for `rucio.client.replicaclient.ReplicaClient` which
+    sleeps instead of contacting a server.
+
+    Parameters
+    ----------
+    latency : `float`
+        Seconds to sleep for every request.
+    per_file_latency : `float`
+        Additional seconds to sleep for every file in a request.
+    """
+
+    def __init__(self, latency: float = 0.0, per_file_latency: float = 0.0):
+        self.latency = latency
+        self.per_file_latency = per_file_latency
+        self.requests = 0
+        self.replicas = 0
+        self.payload_bytes = 0
+        self._lock = threading.Lock()
+
+    def _wait(self, num_files: int) -> None:
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency + self.per_file_latency * num_files)
+
+    def add_replicas(self, rse: str, files: list[dict], ignore_availability: bool = True) -> bool:
+        self._wait(len(files))
+        with self._lock:
+            self.replicas += len(files)
+            self.payload_bytes += len(json.dumps(files))
+        return True
+
+
+class LatencyDIDClient(LatencyReplicaClient):
+    """Stand-in for `rucio.client.didclient.DIDClient` which sleeps
+    instead of contacting a server.
+
+    Parameters
+    ----------
+    latency : `float`
+        Seconds to sleep for every request.
+    per_file_latency : `float`
+        Additional seconds to sleep for every file in a request.
+    """
+
+    def __init__(self, latency: float = 0.0, per_file_latency: float = 0.0):
+        super().__init__(latency, per_file_latency)
+        self.attached = 0
+        # Datasets and containers created, by name, with their type, and
+        # the contents of the containers.
+        self.dids: dict[str, str] = {}
+        self.children: dict[str, list[str]] = {}
+        self.closed: set[str] = set()
+
+    def add_files_to_dataset(self, scope: str, name: str, files: list[dict], rse: str = None) -> bool:
+        self._wait(len(files))
+        with self._lock:
+            self.attached += len(files)
+        return True
+
+    def attach_dids_to_dids(self, attachments: list[dict], ignore_duplicate: bool = False) -> bool:
+        num_files = sum(len(attachment["dids"]) for attachment in attachments)
+        self._wait(num_files)
+        with self._lock:
+            for attachment in attachments:
+                if self.dids.get(attachment["name"]) == "CONTAINER":
+                    self.children.setdefault(attachment["name"], []).extend(
+                        did["name"] for did in attachment["dids"]
+                    )
+                else:
+                    self.attached += len(attachment["dids"])
+        return True
+
+    def add_dataset(self, scope: str, name: str, statuses: dict = None, rse: str = None, **kwargs) -> bool:
+        self._wait(0)
+        with self._lock:
+            self.dids[name] = "DATASET"
+        return True
+
+    def add_dids(self, dids: list[dict]) -> bool:
+        self._wait(0)
+        with self._lock:
+            self.dids.update((did["name"], did["type"]) for did in dids)
+        return True
+
+    def get_metadata_bulk(self, dids: list[dict], inherit: bool = False, plugin: str = "DID_COLUMN") -> list:
+        self._wait(0)
+        with self._lock:
+            return [
+                {"scope": did["scope"], "name": did["name"], "did_type": self.dids[did["name"]]}
+                for did in dids
+                if did["name"] in self.dids
+            ]
+
+    def close(self, scope: str, name: str) -> bool:
+        self._wait(0)
+        with self._lock:
+            self.closed.add(name)
+        return True
+
+
+class LatencyRuleClient(LatencyReplicaClient):
+    """Stand-in for `rucio.client.ruleclient.RuleClient` which sleeps
+    instead of contacting a server.
+
+    Parameters
+    ----------
+    latency : `float`
+        Seconds to sleep for every request.
+    per_file_latency : `float`
+        Additional seconds to sleep for every DID in a request.
+    """
+
+    def __init__(self, latency: float = 0.0, per_file_latency: float = 0.0):
+        super().__init__(latency, per_file_latency)
+        # DID names and arguments of each rule added.
+        self.rules: list[tuple[str, dict]] = []
+
+    def add_replication_rule(self, dids: list[dict], copies: int, rse_expression: str, **kwargs) -> list:
+        self._wait(len(dids))
+        with self._lock:
+            self.rules.extend(
+                (did["name"], dict(kwargs, copies=copies, rse_expression=rse_expression)) for did in dids
+            )
+        return [f"rule-{len(self.rules) - i}" for i in range(len(dids))]
+
+
+class StageResult(pydantic.BaseModel):
+    """Timing of one stage of the benchmark
+
+    Parameters
+    ----------
+    seconds : `float`
+        Wall clock time spent in the stage.
+    files : `int`
+        Number of files processed by the stage.
+    bytes : `int`
+        Number of bytes of file content processed by the stage.
+    """
+
+    seconds: float
+    files: int
+    bytes: int
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else float("inf")
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds > 0 else float("inf")
+
+
+def make_synthetic_repo(root: str, scope: str, num_files: int, file_size: int) -> Butler:
+    """Create a Butler repository with generated files below an RSE tree.
+
+    Parameters
+    ----------
+    root : `str`
+        Directory used as the RSE root.
+    scope : `str`
+        Rucio scope; files are written below ``root/scope``.
+    num_files : `int`
+        Number of files to generate and ingest.
+    file_size : `int`
+        Size of each generated file, in bytes.
+
+    Returns
+    -------
+    butler : `lsst.daf.butler.Butler`
+        Writeable Butler for the new repository.
+    """
+    repo = os.path.join(root, scope, "repo")
+    data_dir = os.path.join(root, scope, "bench")
+    os.makedirs(data_dir, exist_ok=True)
+
+    Butler.makeRepo(repo)
+    butler = Butler(repo, writeable=True)
+    butler.registry.insertDimensionData(
+        "instrument",
+        {
+            "name": _INSTRUMENT,
+            "detector_max": num_files,
+            "visit_max": 1,
+            "exposure_max": 1,
+            "visit_system": 0,
+            "class_name": _INSTRUMENT,
+        },
+    )
+    butler.registry.insertDimensionData(
+        "detector",
+        *[{"instrument": _INSTRUMENT, "id": i, "full_name": f"D{i:06d}"} for i in range(num_files)],
+    )
+    dataset_type = DatasetType(
+        _DATASET_TYPE, ["instrument", "detector"], "StructuredDataDict", universe=butler.dimensions
+    )
+    butler.registry.registerDatasetType(dataset_type)
+    butler.registry.registerRun(_RUN)
+
+    file_datasets = []
+    for i in range(num_files):
+        path = os.path.join(data_dir, f"{_DATASET_TYPE}_{i:06d}.json")
+        with open(path, "wb") as f:
+            f.write(os.urandom(file_size))
+        ref = DatasetRef(dataset_type, {"instrument": _INSTRUMENT, "detector": i}, run=_RUN)
+        file_datasets.append(FileDataset(path=path, refs=[ref], formatter=_FORMATTER))
+    butler.ingest(*file_datasets, transfer="direct")
+    return butler
+
+
+def _chunked(items: list, chunk_size: int):
+    for i in range(0, len(items), chunk_size):
+        yield items[i : i + chunk_size]
+
+
+def run_benchmark(
+    ri: RucioInterface, butler: Butler, rucio_dataset: str, chunk_size: int
+) -> dict[str, StageResult]:
+    """Time each registration stage over every dataset in the synthetic
+    repository.
+
+    Parameters
+    ----------
+    ri : `RucioInterface`
+        Interface to register with; normally built on latency clients.
+    butler : `lsst.daf.butler.Butler`
+        Butler created by `make_synthetic_repo`.
+    rucio_dataset : `str`
+        Rucio dataset to attach files to.
+    chunk_size : `int`
+        Number of files per add_replicas and attach request.
+
+    Returns
+    -------
+    results : `dict` [`str`, `StageResult`]
+        Timing of each stage, keyed by the names in `STAGES`.
+    """
+    results = {}
+
+    start = time.perf_counter()
+    refs = butler.query_datasets(_DATASET_TYPE, collections=_RUN, with_dimension_records=True, limit=None)
+    results["ref_query"] = StageResult(seconds=time.perf_counter() - start, files=len(refs), bytes=0)
+
+    start = time.perf_counter()
+    uris = [butler.getURI(ref) for ref in refs]
+    results["uri_lookup"] = StageResult(seconds=time.perf_counter() - start, files=len(uris), bytes=0)
+
+    start = time.perf_counter()
+    hashes = {uri: ri.compute_hashes(uri) for uri in uris}
+    total_bytes = sum(size for size, _ in hashes.values())
+    results["hashing"] = StageResult(seconds=time.perf_counter() - start, files=len(uris), bytes=total_bytes)
+
+    # Reuse the hashes computed above so this stage only measures the
+    # construction of the DIDs themselves.
+    start = time.perf_counter()
+    bundles = []
+    for ref, uri in zip(refs, uris):
+        did = ri._make_did(uri, ref.to_json(), hashes=hashes[uri])
+        bundles.append(ResourceBundle(dataset_id=rucio_dataset, did=did))
+    results["did_build"] = StageResult(
+        seconds=time.perf_counter() - start, files=len(bundles), bytes=total_bytes
+    )
+
+    # The same DIDs built in one batch from columns; the sidecars are
+    # serialized beforehand, as they would be read from a manifest.
+    paths = [uri.unquoted_path for uri in uris]
+    sizes = [hashes[uri][0] for uri in uris]
+    adler32s = [hashes[uri][1] for uri in uris]
+    sidecars = [bundle.did.meta.rubin_sidecar for bundle in bundles]
+    start = time.perf_counter()
+    dids = ri.make_dids(paths, sizes, adler32s, sidecars)
+    results["did_batch"] = StageResult(
+        seconds=time.perf_counter() - start, files=len(dids), bytes=total_bytes
+    )
+
+    start = time.perf_counter()
+    for chunk in _chunked(bundles, chunk_size):
+        ri._add_replicas(chunk)
+    results["add_replicas"] = StageResult(
+        seconds=time.perf_counter() - start, files=len(bundles), bytes=total_bytes
+    )
+
+    start = time.perf_counter()
+    for chunk in _chunked(bundles, chunk_size):
+        ri.register_to_dataset(chunk)
+    results["attach"] = StageResult(
+        seconds=time.perf_counter() - start, files=len(bundles), bytes=total_bytes
+    )
+
+    return results
+
+
+def compare_to_baseline(
+    results: dict[str, StageResult], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    """Find stages whose throughput dropped below a previous run.
+
+    Parameters
+    ----------
+    results : `dict` [`str`, `StageResult`]
+        Results of the current run.
+    baseline : `dict` [`str`, `dict`]
+        Results of a previous run, as written by ``--output``.
+    tolerance : `float`
+        Allowed fractional drop in files/sec before a stage is reported.
+
+    Returns
+    -------
+    regressions : `list` [`str`]
+        Description of every stage that regressed.
+    """
+    regressions = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        previous = StageResult(**baseline[stage])
+        if result.files_per_sec < previous.files_per_sec * (1.0 - tolerance):
+            regressions.append(
+                f"{stage}: {result.files_per_sec:.1f} files/sec, "
+                f"baseline {previous.files_per_sec:.1f} files/sec"
+            )
+    return regressions
+
+
+@click.command(short_help="Measure throughput of the registration pipeline.")
+@click.option("--num-files", type=int, default=1000, help="number of files in the synthetic repo")
+@click.option("--file-size", type=int, default=1024 * 1024, help="size of each file in bytes")
+@click.option("--chunk-size", type=int, default=30, help="number of replica requests to make at once")
+@click.option("--latency", type=float, default=0.05, help="seconds of latency per Rucio request")
+@click.option("--per-file-latency", type=float, default=0.0, help="seconds of latency per file in a request")
+@click.option("--workdir", type=str, default=None, help="directory for the synthetic repo (default: temp)")
+@click.option("--output", type=str, default=None, help="write results as JSON to this file")
+@click.option("--baseline", type=str, default=None, help="JSON results of a previous run to compare to")
+@click.option("--tolerance", type=float, default=0.2, help="allowed fractional slowdown against baseline")
+@click.option(
+    "--sidecar-encoding",
+    type=click.Choice(SIDECAR_ENCODINGS),
+    default="json",
+    help="encoding of the rubin_sidecar metadata",
+)
+@click.option(
+    "--fake-server",
+    is_flag=True,
+    default=False,
+    help="use the Rucio clients over HTTP against a local fake Rucio server, with the same latency",
+)
+def main(
+    num_files,
+    file_size,
+    chunk_size,
+    latency,
+    per_file_latency,
+    workdir,
+    output,
+    baseline,
+    tolerance,
+    sidecar_encoding,
+    fake_server,
+):
+    """Run the registration pipeline against a synthetic Butler repository
+    and a latency-injecting fake Rucio, reporting throughput per stage.
+    """
+    scope = "bench"
+    root = tempfile.mkdtemp(dir=workdir)
+    server = None
+    try:
+        print(f"Creating {num_files} files of {file_size} bytes in {root}")
+        butler = make_synthetic_repo(root, scope, num_files, file_size)
+        if fake_server:
+            server = FakeRucioServer(latency=latency, per_item_latency=per_file_latency).start()
+            print(f"Fake Rucio server listening on {server.url}")
+            replica_client = ReplicaClient(**server.client_kwargs())
+            did_client = DIDClient(**server.client_kwargs())
+        else:
+            replica_client = LatencyReplicaClient(latency, per_file_latency)
+            did_client = LatencyDIDClient(latency, per_file_latency)
+        ri = RucioInterface(
+            butler=butler,
+            rucio_rse="BENCH",
+            scope=scope,
+            rse_root=root,
+            dtn_url="root://bench:1094//rucio",
+            rubin_butler_type=DataType.DATA_PRODUCT,
+            replica_client=replica_client,
+            did_client=did_client,
+            sidecar_encoding=sidecar_encoding,
+        )
+        results = run_benchmark(ri, butler, "bench_dataset", chunk_size)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{'stage':<15}{'seconds':>10}{'files/sec':>14}{'MB/sec':>12}")
+    for stage in STAGES:
+        r = results[stage]
+        print(f"{stage:<15}{r.seconds:>10.3f}{r.files_per_sec:>14.1f}{r.mb_per_sec:>12.2f}")
+    if server is not None:
+        print(f"Rucio requests: {dict(server.requests)}; {server.payload_bytes} bytes received")
+    elif replica_client.replicas:
+        print(
+            f"add_replicas payload: {replica_client.payload_bytes / replica_client.replicas:.0f} bytes/file"
+        )
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({stage: r.model_dump() for stage, r in results.items()}, f, indent=2)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
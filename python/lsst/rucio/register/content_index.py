@@ -0,0 +1,166 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sqlite3
+import threading
+
+__all__ = ["ContentIndex"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    adler32 TEXT NOT NULL,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS contents (
+    size INTEGER NOT NULL,
+    adler32 TEXT NOT NULL,
+    sha256 TEXT,
+    scope TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (scope, name)
+);
+CREATE INDEX IF NOT EXISTS contents_checksum ON contents (size, adler32);
+"""
+
+
+class ContentIndex:
+    """Local SQLite index of file checksums and registered file contents.
+
+    The index remembers the checksums of local files, keyed by path and
+    valid as long as their size and modification time are unchanged, and
+    the Rucio file DIDs registered with each content, so that identical
+    files can be attached as the existing DID rather than registered
+    again. Files are only considered identical if their SHA-256 digests
+    match, as Adler32 checksums collide too easily to be trusted alone.
+    It may be shared between runs, threads and processes.
+
+    Parameters
+    ----------
+    path : `str`
+        SQLite database file, created if it does not exist.
+    sha256 : `bool`, optional
+        Compute the SHA-256 digest of each file. If `False`, only Adler32
+        checksums are cached and identical files are not looked for.
+    """
+
+    def __init__(self, path: str, sha256: bool = True):
+        self.path = path
+        self.sha256 = sha256
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+    def checksums(self, path: str, size: int, mtime_ns: int) -> tuple[str, str | None] | None:
+        """Return the checksums of a file, if it is unchanged since they
+        were stored.
+
+        Parameters
+        ----------
+        path : `str`
+            Local path of the file.
+        size : `int`
+            Current size of the file in bytes.
+        mtime_ns : `int`
+            Current modification time of the file, in nanoseconds.
+
+        Returns
+        -------
+        checksums : `tuple` [`str`, `str` or `None`] or `None`
+            Adler32 and SHA-256 digests, the latter `None` if it was not
+            computed, or `None` if the file is not known.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT adler32, sha256 FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns),
+            ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def add_checksums(
+        self, path: str, size: int, mtime_ns: int, adler32: str, sha256: str | None = None
+    ) -> None:
+        """Store the checksums of a file.
+
+        Parameters
+        ----------
+        path : `str`
+            Local path of the file.
+        size : `int`
+            Size of the file in bytes.
+        mtime_ns : `int`
+            Modification time of the file, in nanoseconds.
+        adler32 : `str`
+            Adler32 checksum of the file.
+        sha256 : `str`, optional
+            SHA-256 digest of the file.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, adler32, sha256),
+            )
+
+    def find(self, size: int, adler32: str, sha256: str) -> tuple[str, str] | None:
+        """Return the first registered Rucio file DID with some content.
+
+        Parameters
+        ----------
+        size : `int`
+            Size of the content in bytes.
+        adler32 : `str`
+            Adler32 checksum of the content.
+        sha256 : `str`
+            SHA-256 digest of the content.
+
+        Returns
+        -------
+        did : `tuple` [`str`, `str`] or `None`
+            Scope and name of the DID, in any scope, or `None` if there is
+            none.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT scope, name FROM contents WHERE size = ? AND adler32 = ? AND sha256 = ?"
+                " ORDER BY rowid LIMIT 1",
+                (size, adler32, sha256),
+            ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def add(self, contents: list[tuple[int, str, str, str, str]]) -> None:
+        """Record registered Rucio file DIDs with their content.
+
+        Parameters
+        ----------
+        contents : `list` [`tuple`]
+            Size, Adler32 checksum, SHA-256 digest, scope and name of each
+            DID.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO contents VALUES (?, ?, ?, ?, ?)", contents)
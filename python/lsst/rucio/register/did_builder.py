@@ -0,0 +1,107 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections.abc import Iterable
+from typing import Any
+
+__all__ = ["make_file_dids"]
+
+
+def _to_list(column: Any) -> list:
+    # pyarrow arrays and chunked arrays, and numpy arrays, convert to
+    # Python objects in one call; anything else is just iterated.
+    if hasattr(column, "to_pylist"):
+        return column.to_pylist()
+    if hasattr(column, "tolist"):
+        return column.tolist()
+    return list(column)
+
+
+def make_file_dids(
+    paths: Iterable[str],
+    sizes: Iterable[int],
+    adler32s: Iterable[str],
+    *,
+    scope: str,
+    rse_root: str,
+    pfn_base: str,
+    rubin_butler_type: str,
+    sidecars: Iterable[str | None] | None = None,
+) -> list[dict]:
+    """Make Rucio file DIDs for a batch of files given as columns.
+
+    The result is the same as dumping a `RucioDID` for each file, but
+    built directly as dictionaries, without validating a model per file.
+
+    Parameters
+    ----------
+    paths : `~collections.abc.Iterable` [`str`]
+        Local paths of the files, below ``rse_root``. May be a list, or a
+        pyarrow or numpy array.
+    sizes : `~collections.abc.Iterable` [`int`]
+        Size of each file in bytes.
+    adler32s : `~collections.abc.Iterable` [`str`]
+        Adler32 checksum of each file, as 8 hex digits.
+    scope : `str`
+        Rucio scope of the files.
+    rse_root : `str`
+        Root directory of the RSE, removed from each path.
+    pfn_base : `str`
+        Base URL prepended to the remainder of each path to form its PFN.
+    rubin_butler_type : `str`
+        Value of the ``rubin_butler`` metadata of every file.
+    sidecars : `~collections.abc.Iterable` [`str` or `None`], optional
+        Value of the ``rubin_sidecar`` metadata of each file; empty if not
+        given.
+
+    Returns
+    -------
+    dids : `list` [`dict`]
+        Rucio file DIDs, in the order of ``paths``.
+
+    Raises
+    ------
+    ValueError
+        Raised if the columns are not all the same length.
+    """
+    paths = _to_list(paths)
+    sizes = _to_list(sizes)
+    adler32s = _to_list(adler32s)
+    sidecars = [""] * len(paths) if sidecars is None else _to_list(sidecars)
+    if not len(paths) == len(sizes) == len(adler32s) == len(sidecars):
+        raise ValueError(
+            f"Columns differ in length: {len(paths)} paths, {len(sizes)} sizes, "
+            f"{len(adler32s)} checksums, {len(sidecars)} sidecars"
+        )
+
+    relative = [path.removeprefix(rse_root) for path in paths]
+    scope_prefix = f"/{scope}/"
+    return [
+        {
+            "pfn": pfn_base + rel,
+            "bytes": int(size),
+            "adler32": adler32,
+            "name": rel.removeprefix(scope_prefix),
+            "scope": scope,
+            "meta": {"rubin_butler": rubin_butler_type, "rubin_sidecar": sidecar or ""},
+        }
+        for rel, size, adler32, sidecar in zip(relative, sizes, adler32s, sidecars)
+    ]
@@ -20,24 +20,551 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import abc
+import contextlib
+import gzip
+import itertools
+import json
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import astropy.time
 import click
+import pydantic
+import yaml
 
-from lsst.daf.butler import Butler, CollectionType, FileDataset
+from lsst.daf.butler import (
+    Butler,
+    CollectionType,
+    DatasetRef,
+    DimensionUniverse,
+    FileDataset,
+    SerializedDatasetRef,
+    YamlRepoExportBackend,
+)
 from lsst.daf.butler.cli.opt import query_datasets_options
+from lsst.resources import ResourcePath
+from lsst.rucio.register.profiling import profile_options
+from lsst.rucio.register.query import batched, iter_datasets
+
+logger = logging.getLogger(__name__)
+
+# Number of query results handed to the export at once.
+_BATCH_SIZE = 10_000
+
+FORMATS = ["yaml", "jsonl.gz"]
+
+
+def _suffixed(filename: str, suffix: str) -> str:
+    """Insert a suffix before the extension(s) of a filename, e.g.
+    ``export.yaml`` becomes ``export-0003.yaml`` or ``export-raw.yaml``.
+    """
+    directory, base = os.path.split(filename)
+    stem, dot, ext = base.partition(".")
+    return os.path.join(directory, f"{stem}-{suffix}{dot}{ext}")
+
+
+class _Watermark(pydantic.BaseModel):
+    """Record of a previous export, used to export only what is new
+
+    Parameters
+    ----------
+    ingest_date : `str`
+        Time (TAI, ISOT format) at which the previous export started.
+    collections : `list` [`str`]
+        RUN collections searched by all previous exports.
+    filenames : `list` [`str`]
+        Files written by all previous exports.
+    """
+
+    ingest_date: str
+    collections: list[str]
+    filenames: list[str] = []
+
+    @classmethod
+    def read(cls, path: str) -> "_Watermark | None":
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls.model_validate_json(f.read())
+
+    def write(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.model_dump_json(indent=2))
+        os.replace(tmp, path)
+
+
+def _and_where(where: str | None, clause: str) -> str:
+    return f"({where}) AND {clause}" if where else clause
+
+
+def _iter_queries(butler: Butler, ds_type: str, queries: list[dict[str, Any]]) -> Iterator[DatasetRef]:
+    """Yield the datasets of one type matched by each of ``queries``."""
+    for query in queries:
+        yield from iter_datasets(butler, ds_type, with_dimension_records=True, **query)
+
+
+def _query_parallel(
+    butler: Butler, ds_types: list[str], jobs: int, queries: dict[str, list[dict[str, Any]]]
+) -> Iterator[tuple[str, list[DatasetRef]]]:
+    """Query several dataset types concurrently, with the query arguments
+    for each type given by ``queries``.
+
+    Results are yielded in the order of ``ds_types``, so output is
+    deterministic, and at most ``jobs`` queries are in flight or waiting to
+    be consumed at once.
+    """
+    local = threading.local()
+
+    def query(ds_type: str) -> list[DatasetRef]:
+        # Butler instances are not thread-safe; give each worker its own.
+        if not hasattr(local, "butler"):
+            local.butler = butler.clone()
+        return list(_iter_queries(local.butler, ds_type, queries[ds_type]))
+
+    remaining = iter(ds_types)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = deque(
+            (ds_type, pool.submit(query, ds_type)) for ds_type in itertools.islice(remaining, jobs)
+        )
+        while pending:
+            ds_type, future = pending.popleft()
+            refs = future.result()
+            if (next_ds_type := next(remaining, None)) is not None:
+                pending.append((next_ds_type, pool.submit(query, next_ds_type)))
+            yield ds_type, refs
+
+
+class _ExportWriter(abc.ABC):
+    """Write exported datasets to one file, or to a sequence of numbered
+    files of at most ``chunk_size`` datasets each.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler the datasets are exported from.
+    filename : `str`
+        Output filename; numbered if ``chunk_size`` is set.
+    chunk_size : `int`
+        Maximum number of datasets per file, or 0 for a single file.
+    rewrite : `~collections.abc.Callable`, optional
+        Function applied to each `FileDataset` before it is written.
+    """
+
+    def __init__(
+        self,
+        butler: Butler,
+        filename: str,
+        chunk_size: int,
+        rewrite: Callable[[FileDataset], FileDataset] | None,
+    ):
+        self.butler = butler
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.rewrite = rewrite
+        self.filenames: list[str] = []
+        self._stack: contextlib.ExitStack | None = None
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            if not self.filenames:
+                # Always write a file, even if nothing matched.
+                self._open()
+            self._close()
+        elif self._stack is not None:
+            self._stack.__exit__(*exc_info)
+
+    def _open(self) -> None:
+        if self.chunk_size:
+            filename = _suffixed(self.filename, f"{len(self.filenames):04d}")
+        else:
+            filename = self.filename
+        print(f"Output to: {filename}")
+        self.filenames.append(filename)
+        self._stack = contextlib.ExitStack()
+        self._start(self._stack, filename)
+        self._count = 0
+
+    def _close(self) -> None:
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+
+    def write(self, refs: list[DatasetRef]) -> None:
+        """Export datasets, starting a new file whenever the current one
+        is full.
+        """
+        while refs:
+            if self._stack is None:
+                self._open()
+            n = len(refs)
+            if self.chunk_size:
+                n = min(n, self.chunk_size - self._count)
+            self._write(refs[:n])
+            self._count += n
+            refs = refs[n:]
+            if self.chunk_size and self._count >= self.chunk_size:
+                self._close()
+
+    @abc.abstractmethod
+    def _start(self, stack: contextlib.ExitStack, filename: str) -> None:
+        """Open a new output file, registering its cleanup with ``stack``."""
+
+    @abc.abstractmethod
+    def _write(self, refs: list[DatasetRef]) -> None:
+        """Write datasets to the current output file."""
+
+
+class _YamlExportWriter(_ExportWriter):
+    """Write datasets, their dimension records and collections as Butler
+    YAML export files, which can be imported with ``butler import``.
+
+    Parameters
+    ----------
+    calibration_collections : `list` [`str`]
+        CALIBRATION collections whose associations are saved in every file.
+    """
+
+    def __init__(self, *args, calibration_collections: list[str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calibration_collections = calibration_collections
+
+    def _start(self, stack, filename):
+        self._export = stack.enter_context(
+            self.butler.export(filename=filename, format="yaml", transfer=None)
+        )
+        for collection in self.calibration_collections:
+            self._export.saveCollection(collection)
+
+    def _write(self, refs):
+        self._export.saveDatasets(refs, rewrite=self.rewrite)
+
+
+class _JsonLinesExportWriter(_ExportWriter):
+    """Write datasets as gzip-compressed JSON Lines, one dataset per line,
+    streaming each batch straight to disk.
+
+    Each line holds the file URI, ``path``, and the serialized ``ref``,
+    including its dimension records; see `read_jsonl_export`. Collection
+    associations and formatters are not written.
+    """
+
+    def _start(self, stack, filename):
+        self._stream = stack.enter_context(gzip.open(filename, "wt"))
+
+    def _write(self, refs):
+        uris = self.butler.get_many_uris(refs)
+        for ref in refs:
+            primary = uris[ref].primaryURI
+            if primary is None:
+                logger.warning("Not exporting %s, whose components are stored in separate files", ref)
+                continue
+            file_dataset = FileDataset(path=str(primary), refs=[ref])
+            if self.rewrite is not None:
+                file_dataset = self.rewrite(file_dataset)
+            self._stream.write(f'{{"path": {json.dumps(str(file_dataset.path))}, "ref": {ref.to_json()}}}\n')
+
+
+class YamlExportStream:
+    """Write a Butler YAML export file a chunk of datasets at a time,
+    flushing each chunk to disk as it is written.
+
+    Unlike `lsst.daf.butler.Butler.export`, nothing is held until the file
+    is closed, and the location of each dataset is given by the caller
+    rather than looked up in the datastore again. Only the datasets, their
+    dataset types, RUN collections and dimension records are written;
+    records shared between chunks are written once. Formatters are not
+    written, so imports use the formatters configured in the repository.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler the datasets are exported from.
+    filename : `str`
+        Output filename.
+    """
+
+    def __init__(self, butler: Butler, filename: str):
+        self.butler = butler
+        self.filename = filename
+        self._roots = [root for root in butler.get_datastore_roots().values() if root is not None]
+        self._stream = None
+        self._started = False
+        self._data_ids: set = set()
+        self._records: set = set()
+        self._dataset_types: set[str] = set()
+        self._runs: set[str] = set()
+
+    def __enter__(self):
+        self._stream = open(self.filename, "w")
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if exc_info[0] is None and not self._started:
+                # Always write a valid file, even if nothing was exported.
+                self._flush([])
+        finally:
+            self._stream.close()
+
+    def _path(self, uri: ResourcePath) -> str:
+        # Paths in the datastore are written relative to its root, as
+        # the datastore's own export does.
+        for root in self._roots:
+            relative = uri.relative_to(root)
+            if relative is not None:
+                return relative
+        return str(uri)
+
+    def _flush(self, data: list[dict[str, Any]]) -> None:
+        if self._started:
+            # A block sequence at the start of a line continues ``data``.
+            yaml.dump(data, stream=self._stream, sort_keys=False)
+        else:
+            backend = YamlRepoExportBackend(self._stream, self.butler.dimensions)
+            backend.data = data
+            backend.finish()
+            self._started = True
+        self._stream.flush()
+
+    def write(self, refs: list[DatasetRef], uris: list[ResourcePath]) -> None:
+        """Write a chunk of datasets, and flush it to disk.
+
+        Parameters
+        ----------
+        refs : `list` [`lsst.daf.butler.DatasetRef`]
+            Datasets to write.
+        uris : `list` [`lsst.resources.ResourcePath`]
+            Location of each dataset.
+        """
+        records: dict = defaultdict(dict)
+        datasets: dict[tuple, list[dict[str, Any]]] = defaultdict(list)
+        for ref, uri in zip(refs, uris, strict=True):
+            data_id = ref.dataId
+            if data_id not in self._data_ids:
+                self._data_ids.add(data_id)
+                if not data_id.hasRecords():
+                    data_id = self.butler.registry.expandDataId(data_id)
+                for name in data_id.dimensions.elements:
+                    record = data_id.records[name]
+                    if record is None or (name, record.dataId) in self._records:
+                        continue
+                    self._records.add((name, record.dataId))
+                    records[self.butler.dimensions[name]][record.dataId] = record
+            datasets[ref.datasetType, ref.run].append(
+                {"dataset_id": [ref.id], "data_id": [dict(ref.dataId.required)], "path": self._path(uri)}
+            )
+
+        data: list[dict[str, Any]] = []
+        for element in self.butler.dimensions.sorted(records):
+            if element.has_own_table:
+                data.append(
+                    {
+                        "type": "dimension",
+                        "element": element.name,
+                        "records": [
+                            record.toDict(splitTimespan=True) for record in records[element].values()
+                        ],
+                    }
+                )
+        for (dataset_type, run), dataset_records in datasets.items():
+            if run not in self._runs:
+                self._runs.add(run)
+                data.append({"type": "run", "name": run})
+            if dataset_type.name not in self._dataset_types:
+                self._dataset_types.add(dataset_type.name)
+                data.append(
+                    {
+                        "type": "dataset_type",
+                        "name": dataset_type.name,
+                        "dimensions": list(dataset_type.dimensions.names),
+                        "storage_class": dataset_type.storageClass_name,
+                        "is_calibration": dataset_type.isCalibration(),
+                    }
+                )
+            data.append(
+                {"type": "dataset", "dataset_type": dataset_type.name, "run": run, "records": dataset_records}
+            )
+        if data:
+            self._flush(data)
+
+
+def read_jsonl_export(
+    filename: str, universe: DimensionUniverse, directory: str | None = None
+) -> Iterator[FileDataset]:
+    """Read the datasets of a JSON Lines export file.
+
+    Parameters
+    ----------
+    filename : `str`
+        File written by ``export-datasets --format jsonl.gz``.
+    universe : `lsst.daf.butler.DimensionUniverse`
+        Dimensions of the repository the datasets are read for.
+    directory : `str`, optional
+        Directory relative paths are resolved against, for files exported
+        with ``--root``.
+
+    Yields
+    ------
+    file_dataset : `lsst.daf.butler.FileDataset`
+        File and dataset of each line, with its dimension records and no
+        formatter.
+    """
+    with gzip.open(filename, "rt") as f:
+        for line in f:
+            record = json.loads(line)
+            ref = DatasetRef.from_simple(SerializedDatasetRef.model_validate(record["ref"]), universe)
+            yield FileDataset(path=ResourcePath(record["path"], root=directory), refs=[ref])
+
+
+def import_jsonl_export(
+    butler: Butler,
+    filename: str,
+    directory: str | None = None,
+    transfer: str | None = "direct",
+    batch_size: int = _BATCH_SIZE,
+) -> int:
+    """Ingest the datasets of a JSON Lines export file into a repository.
+
+    Dataset types, RUN collections and dimension records missing from the
+    repository are registered from the serialized refs first. Files are
+    ingested with the formatters configured in the repository.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Writeable Butler of the repository to import into.
+    filename : `str`
+        File written by ``export-datasets --format jsonl.gz``.
+    directory : `str`, optional
+        Directory relative paths are resolved against.
+    transfer : `str`, optional
+        Transfer mode for `lsst.daf.butler.Butler.ingest`.
+    batch_size : `int`, optional
+        Number of datasets ingested at once.
+
+    Returns
+    -------
+    count : `int`
+        Number of datasets ingested.
+    """
+    count = 0
+    dataset_types: set[str] = set()
+    runs: set[str] = set()
+    for batch in batched(read_jsonl_export(filename, butler.dimensions, directory), batch_size):
+        records: dict[str, dict] = {}
+        for file_dataset in batch:
+            for ref in file_dataset.refs:
+                if ref.datasetType.name not in dataset_types:
+                    butler.registry.registerDatasetType(ref.datasetType)
+                    dataset_types.add(ref.datasetType.name)
+                if ref.run not in runs:
+                    butler.registry.registerRun(ref.run)
+                    runs.add(ref.run)
+                for element in ref.dataId.dimensions.elements:
+                    record = ref.dataId.records[element]
+                    if record is not None:
+                        records.setdefault(element, {})[record.dataId] = record
+        for element in butler.dimensions.sorted(records):
+            butler.registry.insertDimensionData(element, *records[element.name].values(), skip_existing=True)
+        butler.ingest(*batch, transfer=transfer)
+        count += len(batch)
+    return count
 
 
 @click.command(short_help="Export registry information about datasets.")
+@profile_options
 @click.option("--root", help="URI root for existing direct ingests to be stripped.")
 @click.option("--filename", default="export.yaml", help="Output filename (default=export.yaml).")
+@click.option(
+    "--chunk-size",
+    type=int,
+    default=0,
+    help="Maximum number of datasets per output file; files are numbered (default=0, a single file).",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(FORMATS),
+    default="yaml",
+    help="Butler YAML export, or gzip-compressed JSON Lines streamed to disk (default=yaml).",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of dataset types to query concurrently; each type's results are then held in memory "
+    "(default=1, streamed).",
+)
+@click.option(
+    "--split-by-type",
+    is_flag=True,
+    default=False,
+    help="Write one output file per dataset type, e.g. export-raw.yaml.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only export datasets ingested since the previous incremental export to the same --filename, "
+    "to a new timestamped file; progress is kept in FILENAME.watermark.json.",
+)
 @query_datasets_options(repo=True, useArguments=True, use_order_by=False, showUri=False)
-def main(repo: str, glob: Any, filename: str, root: str | None = None, **kwargs: Any) -> None:
+def main(
+    repo: str,
+    glob: Any,
+    filename: str,
+    chunk_size: int,
+    output_format: str,
+    jobs: int,
+    split_by_type: bool,
+    incremental: bool,
+    root: str | None = None,
+    **kwargs: Any,
+) -> None:
     """Export the registry information about datasets selected by collection,
     dataset type, and where clause to an export.yaml file.
+
+    Query results are streamed page by page; with ``--chunk-size`` or
+    ``--format jsonl.gz`` memory use is bounded regardless of the number
+    of datasets. With ``--jobs`` dataset types are queried concurrently,
+    but written in sorted order; dimension records shared between types
+    are written only once to a YAML file.
+
+    With ``--incremental``, RUN collections that were searched by the
+    previous incremental export are only searched for datasets ingested
+    since it started; other collections are exported in full. It cannot be
+    combined with ``--find-first``.
     """
     if "collections" not in kwargs:
         raise RuntimeError("Collection(s) option is required.")
+    if incremental and kwargs.get("find_first"):
+        # The ingest_date filter would apply before the find-first search,
+        # and each part of the collection path would be searched on its
+        # own, so datasets shadowed by the full path could be exported.
+        raise click.UsageError("--incremental cannot be used with --find-first")
+
+    # The watermark is the time before anything is queried, so datasets
+    # ingested while this export runs are exported again by the next one
+    # rather than skipped.
+    start = astropy.time.Time.now()
+    watermark = None
+    if incremental:
+        watermark_file = f"{filename}.watermark.json"
+        watermark = _Watermark.read(watermark_file)
+        if watermark is not None:
+            print(f"Exporting datasets ingested since {watermark.ingest_date} TAI")
+        filename = _suffixed(filename, start.utc.strftime("%Y%m%dT%H%M%S%fZ"))
 
     butler = Butler(repo)
     ds_types = set([ds.name for ds in butler.registry.queryDatasetTypes(glob)])
@@ -55,28 +582,115 @@ def main(repo: str, glob: Any, filename: str, root: str | None = None, **kwargs:
     else:
         rewrite = None
 
-    print(f"Output to: {filename}")
-    with butler.export(filename=filename, format="yaml", transfer=None) as export:
-        actual_ds_types = set()
-
-        # We only save calibration and run collections, not complete chains.
-        # This is expected to be more useful for DRP.
-        for collection_info in butler.collections.query_info(
-            kwargs["collections"],
-            flatten_chains=True,
-            include_summary=True,
-            summary_datasets=ds_types,
-        ):
-            present_ds_types = ds_types & collection_info.dataset_types
-            if present_ds_types:
-                if collection_info.type == CollectionType.CALIBRATION:
-                    print(f"Saving collection associations: {collection_info.name}")
-                    export.saveCollection(collection_info.name)
-                actual_ds_types |= present_ds_types
-
-        for ds_type in actual_ds_types:
-            print(f"Saving dataset type: {ds_type}")
-            export.saveDatasets(
-                butler.query_datasets(ds_type, with_dimension_records=True, **kwargs),
-                rewrite=rewrite,
+    # Collections, in search order, that may hold each dataset type.
+    ds_type_collections: dict[str, list[str]] = {}
+    calibration_collections = []
+    run_collections = set()
+
+    # We only save calibration and run collections, not complete chains.
+    # This is expected to be more useful for DRP.
+    for collection_info in butler.collections.query_info(
+        kwargs["collections"],
+        flatten_chains=True,
+        include_summary=True,
+        summary_datasets=ds_types,
+    ):
+        present_ds_types = ds_types & collection_info.dataset_types
+        if present_ds_types:
+            if collection_info.type == CollectionType.CALIBRATION:
+                print(f"Saving collection associations: {collection_info.name}")
+                calibration_collections.append(collection_info.name)
+            if collection_info.type == CollectionType.RUN:
+                run_collections.add(collection_info.name)
+            for ds_type in present_ds_types:
+                ds_type_collections.setdefault(ds_type, []).append(collection_info.name)
+
+    def make_writer(name: str) -> _ExportWriter:
+        if output_format == "jsonl.gz":
+            return _JsonLinesExportWriter(butler, name, chunk_size, rewrite)
+        return _YamlExportWriter(
+            butler, name, chunk_size, rewrite, calibration_collections=calibration_collections
+        )
+
+    # Only search the collections whose summaries say they hold each
+    # dataset type, rather than every run under the original collections.
+    # Their relative order is kept, so find-first searches are unchanged.
+    queries: dict[str, list[dict[str, Any]]] = {}
+    for ds_type, collections in sorted(ds_type_collections.items()):
+        logger.debug("Searching %d collection(s) for %s", len(collections), ds_type)
+        if watermark is None:
+            queries[ds_type] = [kwargs | {"collections": collections}]
+            continue
+        # Datasets in previously exported runs were exported already if
+        # ingested before the watermark. Other collections, including
+        # CALIBRATION collections whose associations may have changed,
+        # are exported in full.
+        seen = set(watermark.collections)
+        old = [c for c in collections if c in seen]
+        new = [c for c in collections if c not in seen]
+        queries[ds_type] = []
+        if old:
+            since = {"export_since": astropy.time.Time(watermark.ingest_date, scale="tai")}
+            queries[ds_type].append(
+                kwargs
+                | {
+                    "collections": old,
+                    "where": _and_where(kwargs.get("where"), f"{ds_type}.ingest_date > export_since"),
+                    "bind": (kwargs.get("bind") or {}) | since,
+                }
             )
+        if new:
+            queries[ds_type].append(kwargs | {"collections": new})
+
+    ordered_ds_types = sorted(queries)
+    if jobs > 1:
+        results = _query_parallel(butler, ordered_ds_types, jobs, queries)
+    else:
+        results = (
+            (ds_type, _iter_queries(butler, ds_type, queries[ds_type])) for ds_type in ordered_ds_types
+        )
+
+    filenames: list[str] = []
+    with contextlib.ExitStack() as stack:
+        if not split_by_type:
+            writer = stack.enter_context(make_writer(filename))
+        for ds_type, refs in results:
+            print(f"Saving dataset type: {ds_type}")
+            with contextlib.ExitStack() as type_stack:
+                if split_by_type:
+                    writer = type_stack.enter_context(make_writer(_suffixed(filename, ds_type)))
+                for batch in batched(refs, _BATCH_SIZE):
+                    writer.write(batch)
+            # Writers name their last file on exit if nothing was written.
+            if split_by_type:
+                filenames.extend(writer.filenames)
+    if not split_by_type:
+        filenames.extend(writer.filenames)
+
+    if incremental:
+        if watermark is not None:
+            run_collections.update(watermark.collections)
+            filenames = watermark.filenames + filenames
+        _Watermark(
+            ingest_date=start.tai.isot, collections=sorted(run_collections), filenames=filenames
+        ).write(watermark_file)
+        print(f"Watermark written to: {watermark_file}")
+
+
+@click.command(short_help="Import datasets from a JSON Lines export.")
+@click.argument("repo")
+@click.argument("filenames", nargs=-1, required=True)
+@click.option("--directory", help="Directory relative paths in the export are resolved against.")
+@click.option(
+    "--transfer",
+    default="direct",
+    help="Transfer mode for ingesting the files (default=direct, leaving them in place).",
+)
+def import_main(repo: str, filenames: tuple[str, ...], directory: str | None, transfer: str) -> None:
+    """Ingest the datasets of files written by ``export-datasets --format
+    jsonl.gz`` into a repository.
+    """
+    butler = Butler(repo, writeable=True)
+    for filename in filenames:
+        count = import_jsonl_export(butler, filename, directory, transfer)
+        print(f"Imported {count} datasets from {filename}")
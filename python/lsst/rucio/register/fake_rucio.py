@@ -0,0 +1,612 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A fake Rucio server, for testing registration with the real Rucio
+clients over HTTP but without a Rucio deployment.
+
+Only the REST endpoints used by `RucioInterface` are implemented: userpass
+authentication, adding replicas, creating, attaching, looking up and
+closing datasets and containers, and adding replication rules. Errors are
+reported the way the Rucio server reports them, so that the clients raise
+the same exceptions, such as ``FileAlreadyExists`` for files already in a
+dataset. Latency, failures and throughput limits can be injected.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus, urlsplit
+
+import click
+import pydantic
+
+__all__ = ["FakeRucioServer", "Fault", "main"]
+
+logger = logging.getLogger(__name__)
+
+# HTTP status of each exception raised by the fake server, as sent by the
+# Rucio server; anything else is a 500.
+_STATUS = {
+    "InvalidObject": 400,
+    "CannotAuthenticate": 401,
+    "DataIdentifierNotFound": 404,
+    "RSENotFound": 404,
+    "DataIdentifierAlreadyExists": 409,
+    "Duplicate": 409,
+    "DuplicateRule": 409,
+    "FileAlreadyExists": 409,
+    "FileConsistencyMismatch": 409,
+    "UnsupportedOperation": 409,
+}
+
+
+class _RucioError(Exception):
+    def __init__(self, exception_class: str | None, message: str, status: int | None = None):
+        super().__init__(message)
+        self.exception_class = exception_class
+        self.message = message
+        self.status = status or _STATUS.get(exception_class, 500)
+
+
+class Fault(pydantic.BaseModel):
+    """Failure injected into requests made to a `FakeRucioServer`
+
+    Parameters
+    ----------
+    exception_class : `str` or `None`
+        Name of the `rucio.common.exception` class raised by the client;
+        `None` to answer without Rucio error details, as a proxy in front
+        of the server would.
+    message : `str`, optional
+        Message of the exception.
+    path : `str`, optional
+        Only requests whose path starts with this fail, e.g. ``/replicas``.
+    method : `str`, optional
+        Only requests with this HTTP method fail.
+    count : `int`, optional
+        Number of requests that fail; `None` for all of them.
+    probability : `float`, optional
+        Chance that each matching request fails.
+    status : `int`, optional
+        HTTP status of the failure; by default, the status the Rucio server
+        uses for ``exception_class``.
+    """
+
+    exception_class: str | None = "RucioException"
+    message: str = "injected failure"
+    path: str = ""
+    method: str | None = None
+    count: int | None = 1
+    probability: float = 1.0
+    status: int | None = None
+
+
+class FakeRucioServer:
+    """Rucio REST server holding its catalog in memory, serving each
+    request on its own thread.
+
+    Parameters
+    ----------
+    host : `str`, optional
+        Address to listen on.
+    port : `int`, optional
+        Port to listen on; a free port is chosen if 0.
+    latency : `float`, optional
+        Seconds every request takes.
+    per_item_latency : `float`, optional
+        Additional seconds per file or DID in a request.
+    max_requests_per_sec : `float`, optional
+        Requests accepted per second; more are rejected with HTTP 429.
+    max_files_per_sec : `float`, optional
+        Files and DIDs accepted per second, across requests; requests
+        exceeding it are rejected with HTTP 429.
+    rses : `list` [`str`], optional
+        Known RSEs; replicas on others are refused. Any RSE is accepted
+        if not given.
+    username, password, account : `str`, optional
+        Credentials accepted by userpass authentication.
+
+    Notes
+    -----
+    The catalog is available, for inspection, as `files` (file DIDs, with
+    their size and checksum), `replicas` (the RSEs of each file), `dids`
+    (datasets and containers, with their contents) and `rules`. `requests`
+    counts requests by endpoint, and `payload_bytes` the bytes received.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        per_item_latency: float = 0.0,
+        max_requests_per_sec: float | None = None,
+        max_files_per_sec: float | None = None,
+        rses: list[str] | None = None,
+        username: str = "fake",
+        password: str = "secret",
+        account: str = "fake",
+    ):
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.max_requests_per_sec = max_requests_per_sec
+        self.max_files_per_sec = max_files_per_sec
+        self.rses = rses
+        self.username = username
+        self.password = password
+        self.account = account
+
+        self.files: dict[tuple[str, str], dict] = {}
+        self.replicas: dict[tuple[str, str], dict[str, str]] = {}
+        self.dids: dict[tuple[str, str], dict] = {}
+        self.rules: dict[str, dict] = {}
+        self.requests: Counter = Counter()
+        self.rejected = 0
+        self.payload_bytes = 0
+        self.faults: list[Fault] = []
+
+        self._tokens: set[str] = set()
+        self._lock = threading.Lock()
+        self._window = (0.0, 0, 0)  # start, requests and items of this second
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeRucioServer":
+        """Start serving on a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-rucio", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeRucioServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def inject(self, exception_class: str | None = "RucioException", **kwargs) -> Fault:
+        """Make requests fail.
+
+        Parameters
+        ----------
+        exception_class : `str` or `None`, optional
+            Name of the exception raised by the client; `None` for a bare
+            HTTP error.
+        **kwargs
+            Other `Fault` fields, selecting the requests that fail.
+
+        Returns
+        -------
+        fault : `Fault`
+            The fault, which can be removed from `faults` to stop it.
+        """
+        fault = Fault(exception_class=exception_class, **kwargs)
+        with self._lock:
+            self.faults.append(fault)
+        return fault
+
+    def client_kwargs(self) -> dict:
+        """Return the arguments connecting a Rucio client to the server."""
+        return dict(
+            rucio_host=self.url,
+            auth_host=self.url,
+            account=self.account,
+            auth_type="userpass",
+            creds={"username": self.username, "password": self.password},
+        )
+
+    def write_config(self, path: str) -> None:
+        """Write a ``rucio.cfg`` connecting clients to the server.
+
+        Parameters
+        ----------
+        path : `str`
+            File to write; point ``RUCIO_CONFIG`` at it. The clients keep
+            their token in ``path`` + ``.token``.
+        """
+        with open(path, "w") as f:
+            f.write(
+                "[client]\n"
+                f"rucio_host = {self.url}\n"
+                f"auth_host = {self.url}\n"
+                "auth_type = userpass\n"
+                f"username = {self.username}\n"
+                f"password = {self.password}\n"
+                f"account = {self.account}\n"
+                f"auth_token_file_path = {path}.token\n"
+            )
+
+    # Request handling, called from the handler threads.
+
+    def _admit(self, method: str, path: str, num_items: int) -> None:
+        # Apply throughput limits and injected faults to a request.
+        with self._lock:
+            now = time.monotonic()
+            start, requests, items = self._window
+            if now - start >= 1.0:
+                start, requests, items = now, 0, 0
+            if (self.max_requests_per_sec is not None and requests + 1 > self.max_requests_per_sec) or (
+                self.max_files_per_sec is not None and items and items + num_items > self.max_files_per_sec
+            ):
+                self.rejected += 1
+                raise _RucioError(None, "rate limit exceeded", 429)
+            self._window = (start, requests + 1, items + num_items)
+            for fault in self.faults:
+                if not path.startswith(fault.path) or fault.method not in (None, method):
+                    continue
+                if random.random() >= fault.probability:
+                    continue
+                if fault.count is not None:
+                    fault.count -= 1
+                    if fault.count <= 0:
+                        self.faults.remove(fault)
+                raise _RucioError(fault.exception_class, fault.message, fault.status)
+        time.sleep(self.latency + self.per_item_latency * num_items)
+
+    def _authenticate(self, headers) -> str:
+        if (
+            headers.get("X-Rucio-Username") != self.username
+            or headers.get("X-Rucio-Password") != self.password
+        ):
+            raise _RucioError("CannotAuthenticate", "wrong username or password")
+        token = f"{self.account}-fake-{uuid.uuid4().hex}"
+        with self._lock:
+            self._tokens.add(token)
+        return token
+
+    def _check_token(self, headers) -> None:
+        if headers.get("X-Rucio-Auth-Token") not in self._tokens:
+            raise _RucioError("CannotAuthenticate", "token missing or expired")
+
+    def _did(self, scope: str, name: str, did_type: str | None = None) -> dict:
+        did = self.dids.get((scope, name))
+        if did is None:
+            raise _RucioError("DataIdentifierNotFound", f"Data identifier '{scope}:{name}' not found")
+        if did_type is not None and did["type"] != did_type:
+            raise _RucioError("UnsupportedOperation", f"{scope}:{name} is a {did['type']}")
+        return did
+
+    def _add_replicas(self, data: dict) -> None:
+        rse = data["rse"]
+        if self.rses is not None and rse not in self.rses:
+            raise _RucioError("RSENotFound", f"RSE '{rse}' cannot be found")
+        with self._lock:
+            for file in data["files"]:
+                key = (file["scope"], file["name"])
+                known = self.files.get(key)
+                if known is not None and (known["bytes"], known["adler32"]) != (
+                    file["bytes"],
+                    file["adler32"],
+                ):
+                    raise _RucioError(
+                        "FileConsistencyMismatch", f"{key[0]}:{key[1]} has a different checksum"
+                    )
+                if rse in self.replicas.get(key, ()):
+                    raise _RucioError("Duplicate", f"Replica {key[0]}:{key[1]} already exists on {rse}")
+            for file in data["files"]:
+                key = (file["scope"], file["name"])
+                self.files.setdefault(
+                    key, {"bytes": file["bytes"], "adler32": file["adler32"], "meta": file.get("meta", {})}
+                )
+                self.replicas.setdefault(key, {})[rse] = file.get("pfn", "")
+
+    def _new_did(self, scope: str, name: str, data: dict) -> dict:
+        if (scope, name) in self.dids or (scope, name) in self.files:
+            raise _RucioError(
+                "DataIdentifierAlreadyExists", f"Data identifier '{scope}:{name}' already exists"
+            )
+        did_type = data.get("type", "DATASET").upper()
+        if did_type not in ("DATASET", "CONTAINER"):
+            raise _RucioError("UnsupportedOperation", f"Can not add a DID of type {did_type}")
+        statuses = data.get("statuses") or {}
+        return {"type": did_type, "open": True, "monotonic": bool(statuses.get("monotonic")), "children": {}}
+
+    def _add_did(self, scope: str, name: str, data: dict) -> None:
+        with self._lock:
+            self.dids[(scope, name)] = self._new_did(scope, name, data)
+
+    def _add_dids(self, dids: list[dict]) -> None:
+        with self._lock:
+            new = {(did["scope"], did["name"]): self._new_did(did["scope"], did["name"], did) for did in dids}
+            if len(new) < len(dids):
+                raise _RucioError("DataIdentifierAlreadyExists", "Duplicate DIDs in request")
+            self.dids.update(new)
+
+    def _attach(self, scope: str, name: str, children: list[dict], ignore_duplicate: bool) -> list[tuple]:
+        # Check an attachment, returning the children to add.
+        parent = self._did(scope, name)
+        if not parent["open"]:
+            raise _RucioError("UnsupportedOperation", f"Data identifier '{scope}:{name}' is closed")
+        new = []
+        for child in children:
+            key = (child["scope"], child["name"])
+            if parent["type"] == "DATASET":
+                if key not in self.files:
+                    raise _RucioError(
+                        "DataIdentifierNotFound", f"Data identifier '{key[0]}:{key[1]}' not found"
+                    )
+            elif key not in self.dids:
+                raise _RucioError("DataIdentifierNotFound", f"Data identifier '{key[0]}:{key[1]}' not found")
+            if key in parent["children"]:
+                if ignore_duplicate:
+                    continue
+                raise _RucioError("FileAlreadyExists", f"{key[0]}:{key[1]} is already in {scope}:{name}")
+            new.append(key)
+        return new
+
+    def _attach_dids(self, scope: str, name: str, data: dict) -> None:
+        if "rse" in data:
+            # Rucio registers the files as replicas on the RSE, which
+            # needs their size and checksum.
+            for did in data["dids"]:
+                if "bytes" not in did or "adler32" not in did:
+                    raise _RucioError(
+                        "InvalidObject",
+                        f"{did['scope']}:{did['name']} has no size or adler32 for {data['rse']}",
+                    )
+        with self._lock:
+            new = self._attach(scope, name, data["dids"], ignore_duplicate=False)
+            self.dids[(scope, name)]["children"].update(dict.fromkeys(new))
+
+    def _attach_dids_to_dids(self, data: dict) -> None:
+        ignore_duplicate = data.get("ignore_duplicate", False)
+        with self._lock:
+            new = [
+                ((a["scope"], a["name"]), self._attach(a["scope"], a["name"], a["dids"], ignore_duplicate))
+                for a in data["attachments"]
+            ]
+            for key, children in new:
+                self.dids[key]["children"].update(dict.fromkeys(children))
+
+    def _get_metadata_bulk(self, data: dict) -> list[dict]:
+        found = []
+        with self._lock:
+            for did in data["dids"]:
+                key = (did["scope"], did["name"])
+                if key in self.dids:
+                    d = self.dids[key]
+                    found.append(
+                        {
+                            "scope": key[0],
+                            "name": key[1],
+                            "did_type": d["type"],
+                            "is_open": d["open"],
+                            "monotonic": d["monotonic"],
+                        }
+                    )
+                elif key in self.files:
+                    f = self.files[key]
+                    found.append(
+                        {
+                            "scope": key[0],
+                            "name": key[1],
+                            "did_type": "FILE",
+                            "bytes": f["bytes"],
+                            "adler32": f["adler32"],
+                        }
+                    )
+        return found
+
+    def _set_status(self, scope: str, name: str, data: dict) -> None:
+        with self._lock:
+            did = self._did(scope, name)
+            if "open" in data:
+                if data["open"] and not did["open"]:
+                    raise _RucioError("UnsupportedOperation", f"Can not reopen {scope}:{name}")
+                did["open"] = bool(data["open"])
+
+    def _add_replication_rule(self, data: dict) -> list[str]:
+        with self._lock:
+            keys = [(did["scope"], did["name"]) for did in data["dids"]]
+            for key in keys:
+                if key not in self.dids and key not in self.files:
+                    raise _RucioError(
+                        "DataIdentifierNotFound", f"Data identifier '{key[0]}:{key[1]}' not found"
+                    )
+                for rule in self.rules.values():
+                    if (rule["scope"], rule["name"], rule["rse_expression"]) == (
+                        *key,
+                        data["rse_expression"],
+                    ):
+                        raise _RucioError(
+                            "DuplicateRule",
+                            f"A duplicate rule for {key[0]}:{key[1]} to {data['rse_expression']}",
+                        )
+            ids = []
+            for scope, name in keys:
+                rule_id = uuid.uuid4().hex
+                self.rules[rule_id] = {
+                    "scope": scope,
+                    "name": name,
+                    "rse_expression": data["rse_expression"],
+                    "copies": data["copies"],
+                    "lifetime": data.get("lifetime"),
+                    "grouping": data.get("grouping"),
+                    "activity": data.get("activity"),
+                }
+                ids.append(rule_id)
+        return ids
+
+
+def _num_items(data) -> int:
+    # Number of files or DIDs in a request, for latency and rate limits.
+    if not isinstance(data, dict):
+        return len(data) if isinstance(data, list) else 0
+    if "files" in data:
+        return len(data["files"])
+    if "attachments" in data:
+        return sum(len(a["dids"]) for a in data["attachments"])
+    return len(data.get("dids") or [])
+
+
+def _make_handler(server: FakeRucioServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _reply(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            path = urlsplit(self.path).path
+            parts = [unquote_plus(part) for part in path.strip("/").split("/")]
+            try:
+                if path == "/auth/userpass":
+                    with server._lock:
+                        server.requests[f"{method} /auth/userpass"] += 1
+                    token = server._authenticate(self.headers)
+                    self._reply(200, headers={"X-Rucio-Auth-Token": token})
+                    return
+                server._check_token(self.headers)
+                data = json.loads(body) if body else {}
+                endpoint, status, result = self._route(method, parts, data)
+                with server._lock:
+                    server.requests[endpoint] += 1
+                    server.payload_bytes += len(body)
+                server._admit(method, path, _num_items(data))
+                result = result()
+            except _RucioError as e:
+                if e.exception_class is None:
+                    self._reply(e.status)
+                    return
+                error = {"ExceptionClass": e.exception_class, "ExceptionMessage": e.message}
+                self._reply(
+                    e.status, json.dumps(error).encode(), dict(error, **{"Content-Type": "application/json"})
+                )
+                return
+            if isinstance(result, list) and endpoint == "POST /dids/bulkmeta":
+                payload = "".join(json.dumps(item) + "\n" for item in result).encode()
+                self._reply(status, payload, {"Content-Type": "application/x-json-stream"})
+            elif result is not None:
+                self._reply(status, json.dumps(result).encode(), {"Content-Type": "application/json"})
+            else:
+                self._reply(status)
+
+        def _route(self, method: str, parts: list[str], data):
+            # Return the endpoint name, success status, and a callable
+            # performing the request.
+            match method, parts:
+                case "POST", ["replicas"]:
+                    return "POST /replicas", 201, lambda: server._add_replicas(data)
+                case "POST", ["dids"]:
+                    return "POST /dids", 201, lambda: server._add_dids(data)
+                case "POST", ["dids", "attachments"]:
+                    return "POST /dids/attachments", 200, lambda: server._attach_dids_to_dids(data)
+                case "POST", ["dids", "bulkmeta"]:
+                    return "POST /dids/bulkmeta", 200, lambda: server._get_metadata_bulk(data)
+                case "POST", ["dids", scope, name, "dids"]:
+                    return (
+                        "POST /dids/{scope}/{name}/dids",
+                        201,
+                        lambda: server._attach_dids(scope, name, data),
+                    )
+                case "POST", ["dids", scope, name]:
+                    return "POST /dids/{scope}/{name}", 201, lambda: server._add_did(scope, name, data)
+                case "PUT", ["dids", scope, name, "status"]:
+                    return (
+                        "PUT /dids/{scope}/{name}/status",
+                        200,
+                        lambda: server._set_status(scope, name, data),
+                    )
+                case "POST", ["rules"] | ["rules", ""]:
+                    return "POST /rules", 201, lambda: server._add_replication_rule(data)
+                case "GET", ["ping"]:
+                    return "GET /ping", 200, lambda: {"version": "fake"}
+            raise _RucioError("RucioException", f"{method} {self.path} is not implemented", 404)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+    return Handler
+
+
+@click.command(short_help="Run a fake Rucio server for load testing.")
+@click.option("--host", type=str, default="127.0.0.1", help="address to listen on")
+@click.option("--port", type=int, default=0, help="port to listen on (default: any free port)")
+@click.option("--latency", type=float, default=0.0, help="seconds every request takes")
+@click.option("--per-item-latency", type=float, default=0.0, help="additional seconds per file or DID")
+@click.option("--max-requests-per-sec", type=float, default=None, help="requests accepted per second")
+@click.option("--max-files-per-sec", type=float, default=None, help="files and DIDs accepted per second")
+@click.option(
+    "--error-rate", type=float, default=0.0, help="fraction of requests failing with RucioException"
+)
+@click.option("--rucio-config", type=str, default=None, help="write a rucio.cfg for the server to this file")
+def main(
+    host, port, latency, per_item_latency, max_requests_per_sec, max_files_per_sec, error_rate, rucio_config
+):
+    """Serve the Rucio endpoints used for registration until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+    server = FakeRucioServer(
+        host,
+        port,
+        latency=latency,
+        per_item_latency=per_item_latency,
+        max_requests_per_sec=max_requests_per_sec,
+        max_files_per_sec=max_files_per_sec,
+    )
+    if error_rate > 0:
+        server.inject(count=None, probability=error_rate)
+    if rucio_config:
+        server.write_config(rucio_config)
+        logger.info("Wrote %s", rucio_config)
+    logger.info("Fake Rucio server listening on %s", server.url)
+    server.start()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info("%d files, %d requests", len(server.files), sum(server.requests.values()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
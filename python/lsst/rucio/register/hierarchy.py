@@ -0,0 +1,102 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+
+import pydantic
+
+__all__ = ["ContainerRule", "DatasetHierarchy"]
+
+
+class ContainerRule(pydantic.BaseModel):
+    """Containers that Rucio datasets with matching names belong to
+
+    Parameters
+    ----------
+    pattern : `str`
+        Regular expression matched against the start of dataset names.
+    containers : `list` [`str`]
+        Container name templates, outermost first; each is formatted with
+        the named groups of ``pattern`` and ``dataset``, the dataset name.
+        Each container is attached to the one before it, and the dataset
+        to the last.
+    """
+
+    pattern: str
+    containers: list[str]
+
+
+class DatasetHierarchy(pydantic.BaseModel):
+    """Container hierarchy of Rucio datasets, declared as a list of rules
+
+    Parameters
+    ----------
+    rules : `list` [`ContainerRule`]
+        Rules tried in order; the first whose pattern matches a dataset
+        name gives its containers.
+    """
+
+    rules: list[ContainerRule] = []
+
+    def containers(self, dataset_id: str) -> list[str]:
+        """Return the containers a dataset belongs to.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Name of the Rucio dataset.
+
+        Returns
+        -------
+        containers : `list` [`str`]
+            Container names, outermost first; empty if no rule matches.
+        """
+        for rule in self.rules:
+            match = re.match(rule.pattern, dataset_id)
+            if match:
+                fields = match.groupdict() | {"dataset": dataset_id}
+                return [template.format(**fields) for template in rule.containers]
+        return []
+
+    def attachments(self, dataset_ids) -> tuple[list[str], dict[str, list[str]]]:
+        """Return the containers and attachments needed by some datasets.
+
+        Parameters
+        ----------
+        dataset_ids : `~collections.abc.Iterable` [`str`]
+            Names of Rucio datasets.
+
+        Returns
+        -------
+        containers : `list` [`str`]
+            Every container needed, outermost first.
+        children : `dict` [`str`, `list` [`str`]]
+            Names of the containers and datasets to attach to each
+            container.
+        """
+        containers: dict[str, None] = {}
+        children: dict[str, dict[str, None]] = {}
+        for dataset_id in dataset_ids:
+            path = self.containers(dataset_id)
+            for parent, child in zip(path, path[1:] + [dataset_id]):
+                containers[parent] = None
+                children.setdefault(parent, {})[child] = None
+        return list(containers), {parent: list(names) for parent, names in children.items()}
@@ -0,0 +1,79 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+
+from lsst.daf.butler import Butler
+from lsst.rucio.register.metrics import Metrics
+
+__all__ = ["LazyButler"]
+
+logger = logging.getLogger(__name__)
+
+
+class LazyButler:
+    """Read-only Butler, connected to its repository on first use.
+
+    Any attribute of `lsst.daf.butler.Butler` is available, and connects
+    to the registry and datastore the first time one is used. This only
+    postpones the connection, so that it can overlap with other work; it
+    takes as long as ever, as the Butler reads the dimension universe
+    from the registry and cannot be given a cached one.
+
+    Parameters
+    ----------
+    repo : `str`
+        Butler repository.
+    metrics : `Metrics`, optional
+        Collector for the time taken to connect.
+    """
+
+    def __init__(self, repo: str, metrics: Metrics | None = None):
+        self.repo = repo
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._butler: Butler | None = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not found otherwise.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.butler, name)
+
+    def __repr__(self) -> str:
+        state = "connected" if self._butler is not None else "not connected"
+        return f"LazyButler({self.repo!r}, {state})"
+
+    @property
+    def connected(self) -> bool:
+        """Whether the Butler has connected to its repository."""
+        return self._butler is not None
+
+    @property
+    def butler(self) -> Butler:
+        """The Butler, connected on first use."""
+        with self._lock:
+            if self._butler is None:
+                logger.debug("Connecting to Butler repository %s", self.repo)
+                with self.metrics.timer("butler_init"):
+                    self._butler = Butler(self.repo, writeable=False)
+            return self._butler
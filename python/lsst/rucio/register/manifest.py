@@ -0,0 +1,223 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Registration of files listed in Parquet or CSV manifests, without a
+Butler.
+
+A manifest has one row per file, with the columns ``path``, ``size`` and
+``adler32``, and optionally ``sidecar`` holding the Rubin sidecar metadata
+of the file. Other columns, such as ``uuid`` and ``dataset_type``, are
+ignored.
+"""
+
+import logging
+import os
+import re
+from collections.abc import Iterator
+
+import pyarrow
+import pyarrow.compute
+import pyarrow.csv
+import pyarrow.dataset
+
+from lsst.resources import ResourcePath
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+__all__ = ["MANIFEST_COLUMNS", "iter_manifest", "register_manifest"]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_COLUMNS = ["path", "size", "adler32"]
+
+_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".csv": "csv"}
+
+_HEX = re.compile(r"[0-9a-fA-F]{1,8}")
+
+
+def _guess_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "parquet"
+    for ext, fmt in _FORMATS.items():
+        if path.endswith(ext) or path.endswith(f"{ext}.gz"):
+            return fmt
+    raise ValueError(f"Can not tell the format of manifest {path}; give it explicitly")
+
+
+def _normalized_adler32(path: str, adler32: str | int | None) -> str | None:
+    # Rucio compares checksums as strings, so write them as it does:
+    # lowercase hex, zero-padded to 8 digits. Integer columns hold the
+    # checksum's value.
+    if adler32 is None:
+        return None
+    if isinstance(adler32, int) and not isinstance(adler32, bool) and 0 <= adler32 <= 0xFFFFFFFF:
+        return f"{adler32:08x}"
+    if not isinstance(adler32, str) or not _HEX.fullmatch(adler32):
+        raise ValueError(f"{path}: adler32 {adler32!r} is not a hexadecimal checksum")
+    return f"{int(adler32, 16):08x}"
+
+
+def iter_manifest(path: str, batch_size: int, format: str | None = None) -> Iterator[pyarrow.RecordBatch]:
+    """Read a manifest in batches, without loading it all into memory.
+
+    Parameters
+    ----------
+    path : `str`
+        Manifest file, or directory of manifest files.
+    batch_size : `int`
+        Maximum number of rows per batch.
+    format : `str`, optional
+        ``parquet`` or ``csv``; guessed from ``path`` if not given.
+
+    Yields
+    ------
+    batch : `pyarrow.RecordBatch`
+        Rows of the manifest, with the columns in `MANIFEST_COLUMNS` and
+        ``sidecar`` if present. Checksums are lowercase, zero-padded hex,
+        including those given as integers.
+
+    Raises
+    ------
+    ValueError
+        Raised if a required column is missing, or a checksum is not
+        hexadecimal.
+    """
+    format = format or _guess_format(path)
+    if format == "csv":
+        # Keep checksums with leading zeros as strings.
+        format = pyarrow.dataset.CsvFileFormat(
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types={
+                    "path": pyarrow.string(),
+                    "adler32": pyarrow.string(),
+                    "sidecar": pyarrow.string(),
+                }
+            )
+        )
+    dataset = pyarrow.dataset.dataset(path, format=format)
+    names = dataset.schema.names
+    missing = [column for column in MANIFEST_COLUMNS if column not in names]
+    if missing:
+        raise ValueError(f"Manifest {path} is missing column(s) {', '.join(missing)}")
+    columns = MANIFEST_COLUMNS + (["sidecar"] if "sidecar" in names else [])
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        if batch.num_rows:
+            adler32 = [
+                _normalized_adler32(path, value)
+                for path, value in zip(batch["path"].to_pylist(), batch["adler32"].to_pylist())
+            ]
+            index = batch.schema.get_field_index("adler32")
+            yield batch.set_column(index, "adler32", pyarrow.array(adler32, pyarrow.string()))
+
+
+def _verified(ri: RucioInterface, batch: pyarrow.RecordBatch, verify: bool) -> pyarrow.RecordBatch:
+    # Fill in missing checksums, and if verifying, drop files whose size
+    # or checksum does not match the manifest. Files that do not exist are
+    # dropped too.
+    rows = batch.to_pydict()
+    keep = []
+    for i, (path, size, adler32) in enumerate(zip(rows["path"], rows["size"], rows["adler32"])):
+        if adler32 is None or size is None or verify:
+            try:
+                actual_size, actual_adler32 = ri.compute_hashes(ResourcePath(path))
+            except FileNotFoundError:
+                logger.error("%s: file listed in the manifest does not exist", path)
+                ri.metrics.increment("files_missing")
+                continue
+            # Checksums from the storage may be written differently.
+            actual_adler32 = _normalized_adler32(path, actual_adler32)
+        if adler32 is None or size is None:
+            rows["size"][i], rows["adler32"][i] = actual_size, actual_adler32
+            keep.append(i)
+            continue
+        if verify:
+            if (actual_size, actual_adler32) != (size, adler32):
+                logger.error(
+                    "%s: manifest has %d bytes, adler32 %s; file has %d bytes, adler32 %s",
+                    path,
+                    size,
+                    adler32,
+                    actual_size,
+                    actual_adler32,
+                )
+                ri.metrics.increment("checksum_mismatches")
+                continue
+        keep.append(i)
+    return pyarrow.RecordBatch.from_pydict({name: [rows[name][i] for i in keep] for name in rows})
+
+
+def _split_by_rse(ri, batch: pyarrow.RecordBatch) -> Iterator[tuple[RucioInterface, pyarrow.RecordBatch]]:
+    # Split the rows by the interface of the RSE they are on, if there are
+    # several RSEs.
+    if not hasattr(ri, "interface_for"):
+        yield ri, batch
+        return
+    indices = pyarrow.array([ri.selector.select(path) for path in batch["path"].to_pylist()])
+    for index in pyarrow.compute.unique(indices).to_pylist():
+        yield ri.interfaces[index], batch.filter(pyarrow.compute.equal(indices, index))
+
+
+def register_manifest(
+    ri: RucioInterface,
+    path: str,
+    rucio_dataset: str,
+    chunk_size: int,
+    verify_checksums: bool = False,
+    format: str | None = None,
+) -> int:
+    """Register the files listed in a manifest to a Rucio dataset.
+
+    Parameters
+    ----------
+    ri : `RucioInterface` or `~lsst.rucio.register.multi_rse.MultiRseInterface`
+        Interface to register with; its Butler is not used. With several
+        RSEs, each file is registered on the RSE its path is in.
+    path : `str`
+        Manifest file, or directory of manifest files.
+    rucio_dataset : `str`
+        Rucio dataset to attach the files to.
+    chunk_size : `int`
+        Number of files per Rucio request.
+    verify_checksums : `bool`, optional
+        Compute the size and checksum of every file and skip those that do
+        not match the manifest, or do not exist, rather than trusting it.
+        Files without a checksum in the manifest are always hashed.
+    format : `str`, optional
+        ``parquet`` or ``csv``; guessed from ``path`` if not given.
+
+    Returns
+    -------
+    num : `int`
+        Number of files registered.
+    """
+    total = 0
+    for batch in iter_manifest(path, chunk_size, format):
+        if verify_checksums or batch["adler32"].null_count or batch["size"].null_count:
+            batch = _verified(ri, batch, verify_checksums)
+        for rse_ri, rse_batch in _split_by_rse(ri, batch):
+            sidecars = rse_batch["sidecar"] if "sidecar" in rse_batch.schema.names else None
+            dids = rse_ri.make_dids(rse_batch["path"], rse_batch["size"], rse_batch["adler32"], sidecars)
+            with ri.metrics.timer("register_chunk"):
+                cnt = rse_ri.register_dids(rucio_dataset, dids)
+            ri.metrics.increment("files_registered", cnt)
+            total += cnt
+        ri.metrics.maybe_report()
+    ri.metrics.report()
+    return total
@@ -0,0 +1,135 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import time
+from collections.abc import Callable
+
+from lsst.rucio.register.metrics import Metrics
+
+__all__ = ["MemoryBudget", "current_rss"]
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss() -> int | None:
+    """Return the resident set size of this process in bytes, or `None`
+    where it is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryBudget:
+    """Limits on the memory used while registering query results.
+
+    Parameters
+    ----------
+    max_records : `int`, optional
+        Maximum number of Butler datasets held at once, across the pages
+        of query results waiting to be registered and the chunk being
+        registered.
+    max_rss : `float`, optional
+        Resident set size, in MB, above which no more query results are
+        fetched until those already fetched are registered. Ignored where
+        the size is not available.
+    metrics : `Metrics`, optional
+        Collector for the number of times fetching waited, and how long.
+    """
+
+    def __init__(
+        self, max_records: int | None = None, max_rss: float | None = None, metrics: Metrics | None = None
+    ):
+        self.max_records = max_records
+        self.max_rss = max_rss
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._warned = False
+
+    def page_size(self, page_size: int, depth: int, chunk_size: int) -> int:
+        """Return the largest page of query results within the record
+        budget.
+
+        Parameters
+        ----------
+        page_size : `int`
+            Requested number of results per page.
+        depth : `int`
+            Number of pages fetched ahead.
+        chunk_size : `int`
+            Number of results registered at once.
+
+        Returns
+        -------
+        page_size : `int`
+            ``page_size``, reduced so that ``depth`` pages waiting, one
+            being consumed, and a chunk fit in `max_records`.
+
+        Raises
+        ------
+        ValueError
+            Raised if a chunk alone does not fit in the budget.
+        """
+        if self.max_records is None:
+            return page_size
+        if chunk_size >= self.max_records:
+            raise ValueError(f"chunk size {chunk_size} must be below the record budget {self.max_records}")
+        return max(1, min(page_size, (self.max_records - chunk_size) // (depth + 1)))
+
+    def exceeded(self) -> bool:
+        """Return whether the process is above its RSS budget."""
+        if self.max_rss is None:
+            return False
+        rss = current_rss()
+        if rss is None or rss <= self.max_rss * 1024 * 1024:
+            return False
+        if not self._warned:
+            logger.warning(
+                "RSS %d MB is above the budget of %d MB; slowing down queries", rss >> 20, self.max_rss
+            )
+            self._warned = True
+        return True
+
+    def wait(self, done: Callable[[], bool], interval: float = 0.1) -> None:
+        """Block while the process is above its RSS budget.
+
+        Parameters
+        ----------
+        done : `~collections.abc.Callable`
+            Returns `True` once there is no need to wait any longer, such
+            as when the results already fetched have been consumed.
+        interval : `float`, optional
+            Seconds between checks of the RSS and ``done``.
+
+        Notes
+        -----
+        Each time this blocks counts once as ``memory_budget_waits``, and
+        its duration is recorded as the ``memory_budget_wait`` stage.
+        """
+        if done() or not self.exceeded():
+            return
+        self.metrics.increment("memory_budget_waits")
+        with self.metrics.timer("memory_budget_wait"):
+            while not done() and self.exceeded():
+                time.sleep(interval)
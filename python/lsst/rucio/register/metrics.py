@@ -0,0 +1,176 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+__all__ = ["Metrics"]
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "rucio_register"
+
+
+class _Histogram:
+    """Latency histogram with fixed bucket boundaries"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    """Thread-safe counters and per-stage latency histograms for a
+    registration run.
+
+    Parameters
+    ----------
+    progress_interval : `float`, optional
+        Minimum number of seconds between JSON progress lines emitted by
+        `maybe_report`. If `None`, progress lines are only emitted by
+        `report`.
+    prometheus_file : `str`, optional
+        If given, every report also rewrites this file in the Prometheus
+        text exposition format, suitable for the node exporter textfile
+        collector or for posting to a pushgateway.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+    def __init__(self, progress_interval: float | None = None, prometheus_file: str | None = None):
+        self.progress_interval = progress_interval
+        self.prometheus_file = prometheus_file
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, _Histogram] = {}
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Add ``value`` to the counter ``name``."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record one latency measurement for ``stage``."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(self.BUCKETS)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as one observation of ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """Return the current state of all counters and histograms.
+
+        Returns
+        -------
+        snapshot : `dict`
+            Elapsed time, counters, and per-stage count, total and maximum
+            latency.
+        """
+        with self._lock:
+            return {
+                "elapsed": round(time.monotonic() - self._start, 3),
+                "counters": dict(self._counters),
+                "stages": {
+                    stage: {"count": h.count, "sum": round(h.sum, 6), "max": round(h.max, 6)}
+                    for stage, h in self._histograms.items()
+                },
+            }
+
+    def maybe_report(self) -> None:
+        """Report progress if ``progress_interval`` seconds have passed
+        since the last report.
+        """
+        if self.progress_interval is None:
+            return
+        if time.monotonic() - self._last_report >= self.progress_interval:
+            self.report()
+
+    def report(self) -> None:
+        """Emit a JSON progress line and update the Prometheus file."""
+        self._last_report = time.monotonic()
+        logger.info("%s", json.dumps(self.snapshot(), sort_keys=True))
+        if self.prometheus_file is not None:
+            self.write_prometheus(self.prometheus_file)
+
+    def to_prometheus(self) -> str:
+        """Format all metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        text : `str`
+            Counters and histograms, one sample per line.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                metric = f"{_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self._counters[name]}")
+            metric = f"{_PREFIX}_stage_seconds"
+            if self._histograms:
+                lines.append(f"# TYPE {metric} histogram")
+            for stage in sorted(self._histograms):
+                h = self._histograms[stage]
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomically write all metrics to ``path`` in the Prometheus
+        text exposition format.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
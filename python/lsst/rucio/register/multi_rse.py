@@ -0,0 +1,210 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import lsst.daf.butler
+from lsst.resources import ResourcePath
+from lsst.rucio.register.metrics import Metrics
+from lsst.rucio.register.plan import RegistrationPlan
+from lsst.rucio.register.rse_profiles import RseProfile, RseSelector
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+__all__ = ["MultiRseInterface"]
+
+
+class MultiRseInterface:
+    """Register files spread across several RSEs, each with its own
+    `RucioInterface`.
+
+    Each file is registered through the interface whose ``rse_root`` is
+    the longest prefix of its path, and the interfaces of a request run in
+    parallel. The interfaces share their Butler and metrics.
+
+    Parameters
+    ----------
+    interfaces : `list` [`RucioInterface`]
+        One interface per RSE profile, the first being the default.
+    """
+
+    def __init__(self, interfaces: list[RucioInterface]):
+        self.interfaces = interfaces
+        self.selector = RseSelector(
+            [
+                RseProfile(rucio_rse=ri.rse, scope=ri.scope, rse_root=ri.rse_root, dtn_url=ri.dtn_url)
+                for ri in interfaces
+            ]
+        )
+
+    @property
+    def butler(self) -> lsst.daf.butler.Butler:
+        """Butler shared by the interfaces."""
+        return self.interfaces[0].butler
+
+    @property
+    def metrics(self) -> Metrics:
+        """Metrics shared by the interfaces."""
+        return self.interfaces[0].metrics
+
+    @property
+    def datasets_used(self) -> set[str]:
+        """Datasets files were attached to, through any interface."""
+        return set().union(*(ri.datasets_used for ri in self.interfaces))
+
+    def interface_for(self, path: str) -> RucioInterface:
+        """Return the interface registering a file.
+
+        Parameters
+        ----------
+        path : `str`
+            Local path of the file.
+
+        Returns
+        -------
+        ri : `RucioInterface`
+            Interface of the RSE whose root is the longest prefix of
+            ``path``.
+        """
+        return self.interfaces[self.selector.select(path)]
+
+    def with_data_type(self, rubin_butler_type: str) -> "MultiRseInterface":
+        """Return interfaces registering another type of file; see
+        `RucioInterface.with_data_type`.
+        """
+        return MultiRseInterface([ri.with_data_type(rubin_butler_type) for ri in self.interfaces])
+
+    def compute_hashes(self, resource_path: ResourcePath) -> tuple[int, str]:
+        """Return the size and adler32 checksum of a file, through the
+        interface of the RSE it is on; see `RucioInterface.compute_hashes`.
+        """
+        return self.interface_for(resource_path.unquoted_path).compute_hashes(resource_path)
+
+    def resolve_refs(self, dataset_refs) -> tuple[list, list]:
+        """Return the DatasetRefs to register and their locations; see
+        `RucioInterface.resolve_refs`.
+        """
+        return self.interfaces[0].resolve_refs(dataset_refs)
+
+    def _run(self, groups: dict[int, tuple], method: str) -> int:
+        # Call a method of each interface with its group of arguments, in
+        # parallel, and sum the results.
+        if len(groups) == 1:
+            ((index, args),) = groups.items()
+            return getattr(self.interfaces[index], method)(*args)
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            futures = [
+                pool.submit(getattr(self.interfaces[index], method), *args) for index, args in groups.items()
+            ]
+            return sum(future.result() for future in futures)
+
+    @staticmethod
+    def _flatten(dataset_refs) -> list:
+        refs = []
+        for dataset_ref in dataset_refs:
+            refs.extend(dataset_ref if type(dataset_ref) is list else [dataset_ref])
+        return refs
+
+    def register_as_replicas(self, dataset_id: str, dataset_refs, mode: str = "all") -> int:
+        """Register a list of DatasetRefs to a Rucio dataset, on the RSEs
+        they are found in; see `RucioInterface.register_as_replicas`.
+        """
+        refs, uris = self.resolve_refs(dataset_refs)
+        return self.register_resolved_refs(dataset_id, refs, uris, mode)
+
+    def register_resolved_refs(self, dataset_id: str, refs: list, uris: list, mode: str = "all") -> int:
+        """Register DatasetRefs whose locations are known to a Rucio
+        dataset, on the RSEs they are found in; see
+        `RucioInterface.register_resolved_refs`.
+        """
+        groups: dict[int, tuple[str, list, list, str]] = {}
+        for ref, uri in zip(refs, uris):
+            _, group_refs, group_uris, _ = groups.setdefault(
+                self.selector.select(uri.unquoted_path), (dataset_id, [], [], mode)
+            )
+            group_refs.append(ref)
+            group_uris.append(uri)
+        if not groups:
+            return 0
+        return self._run(groups, "register_resolved_refs")
+
+    def _register_files(self, dataset_id: str, files: list, method: str) -> int:
+        groups: dict[int, tuple[str, list]] = {}
+        for file in files:
+            resource_path = ResourcePath(file)
+            index = self.selector.select(resource_path.unquoted_path)
+            groups.setdefault(index, (dataset_id, []))[1].append(resource_path)
+        return self._run(groups, method)
+
+    def register_zips(self, dataset_id: str, zip_files: list) -> int:
+        """Register zip files to a Rucio dataset, on the RSEs they are
+        found in; see `RucioInterface.register_zips`.
+        """
+        return self._register_files(dataset_id, zip_files, "register_zips")
+
+    def register_dims(self, dataset_id: str, dim_files: list) -> int:
+        """Register dimension files to a Rucio dataset, on the RSEs they
+        are found in; see `RucioInterface.register_dims`.
+        """
+        return self._register_files(dataset_id, dim_files, "register_dims")
+
+    def plan_dataset_refs(self, plan: RegistrationPlan, dataset_id: str, dataset_refs) -> int:
+        """Account for a list of DatasetRefs in a registration plan; see
+        `RucioInterface.plan_dataset_refs`.
+        """
+        cnt = 0
+        for ref in self._flatten(dataset_refs):
+            resource_path = self.interfaces[0]._get_uri(ref)
+            info = resource_path.get_info()
+            plan.add(dataset_id, info.size, "adler32" in info.checksums)
+            path = resource_path.unquoted_path
+            try:
+                ri = self.interface_for(path)
+            except ValueError:
+                plan.outside_scope += 1
+            else:
+                if not path.startswith(f"{ri.rse_root.rstrip('/')}/{ri.scope}/"):
+                    plan.outside_scope += 1
+            cnt += 1
+        return cnt
+
+    def close_datasets(self, dataset_ids=None) -> int:
+        """Close the Rucio datasets files were attached to, through each
+        interface, once per scope; see `RucioInterface.close_datasets`.
+
+        Datasets given explicitly are closed in the scope of each interface
+        that attached files to them, or through the first interface if
+        none did.
+        """
+        wanted = None if dataset_ids is None else set(dataset_ids)
+        closed: set[tuple[str, str]] = set()
+        for ri in self.interfaces:
+            dataset_ids = {
+                dataset_id
+                for dataset_id in ri.datasets_used
+                if (wanted is None or dataset_id in wanted) and (ri.scope, dataset_id) not in closed
+            }
+            ri.close_datasets(dataset_ids)
+            closed.update((ri.scope, dataset_id) for dataset_id in dataset_ids)
+        if wanted is not None:
+            unused = wanted - {dataset_id for _, dataset_id in closed}
+            self.interfaces[0].close_datasets(unused)
+            closed.update((self.interfaces[0].scope, dataset_id) for dataset_id in unused)
+        return len(closed)
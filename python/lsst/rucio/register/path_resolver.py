@@ -0,0 +1,142 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import random
+import threading
+
+from lsst.daf.butler import Butler, DatasetRef
+from lsst.daf.butler.datastore.file_templates import FileTemplate
+from lsst.resources import ResourcePath
+from lsst.rucio.register.dataset_map import DatasetMap
+from lsst.rucio.register.metrics import Metrics
+
+__all__ = ["TemplatePathResolver"]
+
+logger = logging.getLogger(__name__)
+
+
+class TemplatePathResolver:
+    """Compute the location of Butler datasets from file templates, rather
+    than asking the datastore for each one.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler the datasets belong to; used for datasets without a
+        template, and to verify computed locations.
+    root : `str`
+        Root URI of the datastore the templates are relative to.
+    templates : `dict` [`str`, `str`] or `str`
+        Mapping of dataset type name to Butler file template, or the path
+        of a `DatasetMap` YAML file holding that mapping. A literal file
+        extension at the end of a template, such as ``.fits``, is appended
+        to the formatted path as is.
+    sample_rate : `float`, optional
+        Fraction of computed locations checked against
+        `lsst.daf.butler.Butler.getURI`. The first dataset of each type is
+        always checked.
+    metrics : `Metrics`, optional
+        Collector for counters; a new one is created if not given.
+
+    Notes
+    -----
+    If a computed location does not match the datastore, the template for
+    that dataset type is assumed to have drifted from the datastore
+    configuration, a warning is logged, and locations of that dataset type
+    are looked up in the datastore from then on.
+    """
+
+    def __init__(
+        self,
+        butler: Butler,
+        root: str,
+        templates: dict[str, str] | str,
+        sample_rate: float = 0.01,
+        metrics: Metrics | None = None,
+    ):
+        if isinstance(templates, str):
+            templates = DatasetMap.from_yaml(templates).map
+        self.butler = butler
+        self.root = ResourcePath(root, forceDirectory=True)
+        self.sample_rate = sample_rate
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._templates: dict[str, tuple[FileTemplate, str]] = {}
+        for dataset_type, template in templates.items():
+            stem, ext = os.path.splitext(template)
+            if "{" in ext or "}" in ext:
+                stem, ext = template, ""
+            self._templates[dataset_type] = (FileTemplate(stem), ext)
+        self._lock = threading.Lock()
+        self._verified: set[str] = set()
+        self._drifted: set[str] = set()
+
+    def getURI(self, ref: DatasetRef) -> ResourcePath:
+        """Return the location of a dataset.
+
+        Parameters
+        ----------
+        ref : `lsst.daf.butler.DatasetRef`
+            Dataset to locate.
+
+        Returns
+        -------
+        uri : `lsst.resources.ResourcePath`
+            Location of the dataset's file.
+        """
+        name = ref.datasetType.name
+        entry = self._templates.get(name)
+        with self._lock:
+            drifted = name in self._drifted
+        if entry is None or drifted:
+            return self.butler.getURI(ref)
+
+        template, ext = entry
+        try:
+            uri = self.root.join(template.format(ref) + ext)
+        except (KeyError, RuntimeError) as e:
+            logger.debug("can not format template for %s: %s", ref, e)
+            self.metrics.increment("path_template_fallbacks")
+            return self.butler.getURI(ref)
+
+        with self._lock:
+            verify = name not in self._verified or random.random() < self.sample_rate
+            self._verified.add(name)
+        if verify:
+            expected = self.butler.getURI(ref)
+            self.metrics.increment("path_template_verified")
+            if expected != uri:
+                with self._lock:
+                    drifted = name in self._drifted
+                    self._drifted.add(name)
+                # Threads verifying at once may all find the drift.
+                if not drifted:
+                    logger.warning(
+                        "Template for %s gives %s, but the datastore has %s; no longer using it",
+                        name,
+                        uri,
+                        expected,
+                    )
+                    self.metrics.increment("path_template_drift")
+                return expected
+        self.metrics.increment("path_template_hits")
+        return uri
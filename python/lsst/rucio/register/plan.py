@@ -0,0 +1,105 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pydantic
+
+__all__ = ["RegistrationPlan"]
+
+
+class RegistrationPlan(pydantic.BaseModel):
+    """Totals describing the work a registration would do
+
+    Parameters
+    ----------
+    files : `int`
+        Number of files that would be registered.
+    bytes : `int`
+        Total size of those files.
+    known_checksums : `int`
+        Number of files whose adler32 checksum is already known, and
+        would not have to be computed.
+    unknown_checksum_bytes : `int`
+        Total size of the files whose checksum would have to be computed.
+    outside_scope : `int`
+        Number of files not located below the RSE root and scope, whose
+        Rucio names would not be derived correctly.
+    datasets : `set` [`str`]
+        Rucio datasets the files would be attached to.
+    """
+
+    files: int = 0
+    bytes: int = 0
+    known_checksums: int = 0
+    unknown_checksum_bytes: int = 0
+    outside_scope: int = 0
+    datasets: set[str] = set()
+
+    def add(self, dataset_id: str, size: int, known_checksum: bool) -> None:
+        """Account for one file.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Rucio dataset the file would be attached to.
+        size : `int`
+            Size of the file in bytes.
+        known_checksum : `bool`
+            Whether the adler32 checksum of the file is already known.
+        """
+        self.files += 1
+        self.bytes += size
+        if known_checksum:
+            self.known_checksums += 1
+        else:
+            self.unknown_checksum_bytes += size
+        self.datasets.add(dataset_id)
+
+    def estimate_seconds(self, hash_throughput: float, register_rate: float) -> float:
+        """Estimate the duration of the registration.
+
+        Parameters
+        ----------
+        hash_throughput : `float`
+            Rate at which checksums are computed, in MB/s.
+        register_rate : `float`
+            Rate at which files are registered with Rucio, in files/s.
+
+        Returns
+        -------
+        seconds : `float`
+            Estimated wall clock time.
+        """
+        return self.unknown_checksum_bytes / 1e6 / hash_throughput + self.files / register_rate
+
+    def summary(self, hash_throughput: float, register_rate: float) -> str:
+        """Return a human readable summary of the plan."""
+        seconds = self.estimate_seconds(hash_throughput, register_rate)
+        lines = [
+            f"Files:               {self.files}",
+            f"Total size:          {self.bytes / 1e9:.3f} GB",
+            f"Known checksums:     {self.known_checksums}",
+            f"Bytes to checksum:   {self.unknown_checksum_bytes / 1e9:.3f} GB",
+            f"Outside RSE scope:   {self.outside_scope}",
+            f"Rucio datasets:      {len(self.datasets)} ({', '.join(sorted(self.datasets))})",
+            f"Estimated runtime:   {seconds:.0f} s "
+            f"(at {hash_throughput} MB/s hashing, {register_rate} files/s registration)",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import cProfile
+import functools
+import pstats
+import sys
+from contextlib import contextmanager
+
+import click
+
+__all__ = ["profile_options", "profiled"]
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+@contextmanager
+def profiled(path: str, top: int = 20, profiler: str = "cprofile"):
+    """Run the enclosed block under a profiler.
+
+    Parameters
+    ----------
+    path : `str`
+        File the profile is written to: `pstats` data for ``cprofile``,
+        an HTML report for ``pyinstrument``.
+    top : `int`
+        Number of functions to list in the summary printed to stderr.
+    profiler : `str`
+        ``cprofile`` for the deterministic standard library profiler, or
+        ``pyinstrument`` for the sampling profiler, which must be installed
+        separately.
+    """
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise click.UsageError("--profiler pyinstrument requires the pyinstrument package") from None
+        p = Profiler()
+        p.start()
+        try:
+            yield
+        finally:
+            p.stop()
+            p.write_html(path)
+            print(p.output_text(), file=sys.stderr)
+    else:
+        p = cProfile.Profile()
+        p.enable()
+        try:
+            yield
+        finally:
+            p.disable()
+            p.dump_stats(path)
+            stats = pstats.Stats(p, stream=sys.stderr)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    print(f"Profile written to: {path}", file=sys.stderr)
+
+
+def profile_options(f):
+    """Add profiling options to a click command, and run the command
+    under `profiled` when ``--profile`` is given.
+
+    The command itself never sees the options; when ``--profile`` is not
+    given it is called directly, so there is no overhead.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, profile=None, profile_top=20, profiler="cprofile", **kwargs):
+        if profile is None:
+            return f(*args, **kwargs)
+        with profiled(profile, profile_top, profiler):
+            return f(*args, **kwargs)
+
+    wrapper = click.option(
+        "--profiler",
+        required=False,
+        type=click.Choice(PROFILERS),
+        default="cprofile",
+        help="profiler used with --profile",
+    )(wrapper)
+    wrapper = click.option(
+        "--profile-top",
+        required=False,
+        type=int,
+        default=20,
+        help="number of hot functions to summarize with --profile",
+    )(wrapper)
+    wrapper = click.option(
+        "--profile",
+        required=False,
+        type=str,
+        help="run under a profiler, writing the profile to this file",
+    )(wrapper)
+    return wrapper
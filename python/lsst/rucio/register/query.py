@@ -0,0 +1,202 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import itertools
+import logging
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from lsst.daf.butler import Butler, DatasetRef
+from lsst.daf.butler.utils import has_globs
+from lsst.utils.iteration import ensure_iterable
+
+__all__ = ["batched", "iter_datasets", "prefetch"]
+
+logger = logging.getLogger(__name__)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yield successive lists of at most ``size`` items from ``iterable``."""
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def prefetch(
+    iterable: Iterable, page_size: int = 1000, depth: int = 4, metrics=None, memory_budget=None
+) -> Iterator:
+    """Iterate over ``iterable`` on a background thread, keeping up to
+    ``depth`` pages of ``page_size`` items ready for the caller.
+
+    This lets a slow producer, such as a Butler query, run while the
+    caller works on the items already produced.
+
+    Parameters
+    ----------
+    iterable : `~collections.abc.Iterable`
+        Items to produce. It is only iterated on the background thread, so
+        anything it uses, such as a Butler, must not also be used by the
+        caller.
+    page_size : `int`, optional
+        Number of items handed over at once.
+    depth : `int`, optional
+        Maximum number of pages waiting to be consumed. If 0, ``iterable``
+        is iterated directly, without a thread.
+    metrics : `Metrics`, optional
+        If given, time spent waiting for a page is recorded as the
+        ``prefetch_wait`` stage.
+    memory_budget : `~lsst.rucio.register.memory.MemoryBudget`, optional
+        If given, no page is fetched while the process is above its RSS
+        budget and the caller has pages left to consume.
+
+    Yields
+    ------
+    item
+        The items of ``iterable``, in order. An exception raised while
+        producing them is re-raised in the caller.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    pages: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # Give up if the caller has stopped consuming.
+        while not stop.is_set():
+            if memory_budget is not None:
+                memory_budget.wait(lambda: stop.is_set() or pages.empty())
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        it = iter(iterable)
+        try:
+            for page in batched(it, page_size):
+                if not put(page):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            if metrics is not None:
+                with metrics.timer("prefetch_wait"):
+                    page = pages.get()
+            else:
+                page = pages.get()
+            if page is done:
+                return
+            if isinstance(page, BaseException):
+                raise page
+            yield from page
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_datasets(
+    butler: Butler,
+    dataset_type: str,
+    collections: str | Iterable[str] | None = None,
+    *,
+    find_first: bool = True,
+    where: str = "",
+    bind: dict[str, Any] | None = None,
+    with_dimension_records: bool = False,
+    order_by: Iterable[str] | str | None = None,
+    limit: int | None = None,
+    **kwargs: Any,
+) -> Iterator[DatasetRef]:
+    """Query for datasets, yielding them as the registry returns them.
+
+    This takes the same arguments as `lsst.daf.butler.Butler.query_datasets`,
+    but rather than building a list of all the results it yields them one
+    page at a time, so memory use does not grow with the number of results.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler to query.
+    dataset_type : `str`
+        Name of the dataset type to search for.
+    collections : `str` or `~collections.abc.Iterable` [`str`], optional
+        Collections to search.
+    find_first : `bool`, optional
+        Only yield the first dataset found for each data ID.
+    where : `str`, optional
+        Query expression constraining the data IDs.
+    bind : `dict` [`str`, `~typing.Any`], optional
+        Values for identifiers in ``where``.
+    with_dimension_records : `bool`, optional
+        Expand the data IDs of the results with dimension records.
+    order_by : `~collections.abc.Iterable` [`str`] or `str`, optional
+        Dimensions or fields to sort the results by.
+    limit : `int`, optional
+        Maximum number of results; `None` or 0 for no limit. A negative
+        value is a cap at which a warning is logged.
+    **kwargs
+        Additional data ID key-value pairs constraining the query.
+
+    Yields
+    ------
+    ref : `lsst.daf.butler.DatasetRef`
+        Dataset matching the query.
+    """
+    if collections and has_globs(collections):
+        if find_first:
+            raise TypeError(
+                f"Can not use wildcards in collections when find_first=True (given {collections})"
+            )
+        collections = butler.collections.query(collections)
+    query_limit = limit or None
+    warn_limit = False
+    if query_limit is not None and query_limit < 0:
+        query_limit = abs(query_limit) + 1
+        warn_limit = True
+    with butler.query() as query:
+        result = (
+            query.datasets(dataset_type, collections=collections, find_first=find_first)
+            .where(where, bind=bind, **kwargs)
+            .order_by(*ensure_iterable(order_by or []))
+            .limit(query_limit)
+        )
+        if with_dimension_records:
+            result = result.with_dimension_records()
+        for count, ref in enumerate(result, start=1):
+            if warn_limit and count == query_limit:
+                logger.warning("More datasets are available than the requested limit of %d.", abs(limit))
+                return
+            yield ref
@@ -0,0 +1,201 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import fcntl
+import json
+import re
+import threading
+import time
+from collections.abc import Iterator
+
+from lsst.rucio.register.metrics import Metrics
+
+__all__ = ["RateLimiter", "is_overload"]
+
+# Rucio clients report responses without Rucio error details, such as those
+# of a proxy shedding load, with their HTTP status in the message.
+_OVERLOAD = re.compile(r"http status code: (429|503)\b")
+
+
+def is_overload(exception: Exception) -> bool:
+    """Return whether a Rucio client exception means the server is
+    overloaded, that is, it answered with HTTP 429 or 503.
+    """
+    return _OVERLOAD.search(str(exception)) is not None
+
+
+class RateLimiter:
+    """Token buckets limiting the rate of requests, and of DIDs in them,
+    sent to the Rucio server.
+
+    Requests take their tokens when made, going into debt if the bucket is
+    empty, and then wait until the debt is repaid. Each caller is thus
+    delayed in turn, whatever the size of its request. When the server
+    reports being overloaded, the rates are halved, down to ``min_scale``
+    of the configured rates, and they are raised again by ``increase`` of
+    the configured rates after each successful request.
+
+    Parameters
+    ----------
+    requests_per_sec : `float`, optional
+        Maximum rate of requests; unlimited if not given.
+    dids_per_sec : `float`, optional
+        Maximum rate of files and DIDs in requests; unlimited if not given.
+    burst : `float`, optional
+        Seconds of tokens that can be saved up while idle.
+    lock_file : `str`, optional
+        File holding the state of the buckets, locked while in use, to share
+        the limits between processes on a node. Without it, the limits are
+        shared between the threads of this process only.
+    min_scale : `float`, optional
+        Smallest fraction of the configured rates backed off to.
+    increase : `float`, optional
+        Fraction of the configured rates regained after each success.
+    cooldown : `float`, optional
+        Seconds after a backoff during which further overload reports are
+        ignored, so that requests already in flight halve the rates once.
+    metrics : `Metrics`, optional
+        Collector for the time spent waiting, and backoffs.
+    """
+
+    def __init__(
+        self,
+        requests_per_sec: float | None = None,
+        dids_per_sec: float | None = None,
+        burst: float = 1.0,
+        lock_file: str | None = None,
+        min_scale: float = 0.05,
+        increase: float = 0.01,
+        cooldown: float = 1.0,
+        metrics: Metrics | None = None,
+    ):
+        self.requests_per_sec = requests_per_sec
+        self.dids_per_sec = dids_per_sec
+        self.burst = burst
+        self.lock_file = lock_file
+        self.min_scale = min_scale
+        self.increase = increase
+        self.cooldown = cooldown
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+        # The scale seen by the last request, to skip raising it when it
+        # is already at its maximum.
+        self._last_scale = 1.0
+
+    def _initial_state(self) -> dict:
+        return {
+            "time": time.time(),
+            "requests": (self.requests_per_sec or 0.0) * self.burst,
+            "dids": (self.dids_per_sec or 0.0) * self.burst,
+            "scale": 1.0,
+            "throttled_at": 0.0,
+        }
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[dict]:
+        # Hold the state, exclusively across threads, and across processes
+        # if there is a lock file, refilled up to now. The file is only
+        # rewritten if the state was changed by more than the refill, which
+        # is the same whenever it is done.
+        with self._lock:
+            if self.lock_file is None:
+                self._refill(self._state)
+                yield self._state
+                return
+            with open(self.lock_file, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    text = f.read()
+                    state = json.loads(text) if text else self._initial_state()
+                    self._refill(state)
+                    refilled = dict(state)
+                    yield state
+                    if state != refilled or not text:
+                        f.seek(0)
+                        f.truncate()
+                        f.write(json.dumps(state))
+                        f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict) -> None:
+        now = time.time()
+        elapsed = max(0.0, now - state["time"])
+        state["time"] = now
+        for key, rate in (("requests", self.requests_per_sec), ("dids", self.dids_per_sec)):
+            if rate:
+                state[key] = min(rate * self.burst, state[key] + elapsed * rate * state["scale"])
+
+    @property
+    def scale(self) -> float:
+        """Fraction of the configured rates currently allowed."""
+        with self._locked() as state:
+            self._last_scale = state["scale"]
+            return self._last_scale
+
+    def acquire(self, num_dids: int = 0) -> float:
+        """Wait until a request may be sent.
+
+        Parameters
+        ----------
+        num_dids : `int`, optional
+            Number of files or DIDs in the request.
+
+        Returns
+        -------
+        wait : `float`
+            Seconds waited.
+        """
+        wait = 0.0
+        with self._locked() as state:
+            scale = self._last_scale = state["scale"]
+            for key, rate, num in (
+                ("requests", self.requests_per_sec, 1),
+                ("dids", self.dids_per_sec, num_dids),
+            ):
+                if rate and num:
+                    state[key] -= num
+                    if state[key] < 0:
+                        wait = max(wait, -state[key] / (rate * scale))
+        if wait > 0:
+            self.metrics.observe("rate_limit_wait", wait)
+            time.sleep(wait)
+        return wait
+
+    def throttled(self) -> None:
+        """Halve the rates, after the server reported being overloaded."""
+        with self._locked() as state:
+            if state["time"] - state["throttled_at"] < self.cooldown:
+                return
+            state["scale"] = self._last_scale = max(self.min_scale, state["scale"] / 2)
+            state["throttled_at"] = state["time"]
+        self.metrics.increment("rate_limit_backoffs")
+
+    def succeeded(self) -> None:
+        """Raise the rates a little, after a successful request."""
+        if self._last_scale >= 1.0:
+            # Nothing has been throttled since the request was allowed.
+            return
+        with self._locked() as state:
+            state["scale"] = self._last_scale = min(1.0, state["scale"] + self.increase)
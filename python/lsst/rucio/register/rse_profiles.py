@@ -0,0 +1,103 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+
+import pydantic
+
+__all__ = ["RseProfile", "RseSelector"]
+
+
+class RseProfile(pydantic.BaseModel):
+    """Where files of one RSE live, and how Rucio names them
+
+    Parameters
+    ----------
+    rucio_rse : `str`
+        Name of the RSE.
+    scope : `str`
+        Rucio scope to register the files in.
+    rse_root : `str`
+        Full path to the root directory of the RSE directory structure.
+    dtn_url : `str`
+        Base URL of the data transfer node for the Rucio physical filename.
+    """
+
+    rucio_rse: str
+    scope: str
+    rse_root: str
+    dtn_url: str
+
+
+class RseSelector:
+    """Index of RSE roots, selecting the RSE profile of a file from its
+    path.
+
+    Parameters
+    ----------
+    profiles : `list` [`RseProfile`]
+        Profiles to select from; their roots must differ.
+
+    Raises
+    ------
+    ValueError
+        Raised if two profiles have the same root.
+    """
+
+    def __init__(self, profiles: list[RseProfile]):
+        self.profiles = profiles
+        self._roots: dict[str, int] = {}
+        for index, profile in enumerate(profiles):
+            root = os.path.normpath(profile.rse_root)
+            if root in self._roots:
+                raise ValueError(
+                    f"RSE profiles {self._roots[root]} and {index} have the same rse_root {root}"
+                )
+            self._roots[root] = index
+
+    def select(self, path: str) -> int:
+        """Return the profile whose root is the longest prefix of a path.
+
+        Parameters
+        ----------
+        path : `str`
+            Absolute local path of a file.
+
+        Returns
+        -------
+        index : `int`
+            Index of the profile in `profiles`.
+
+        Raises
+        ------
+        ValueError
+            Raised if the path is below no profile's root.
+        """
+        # Look up each parent directory in turn, deepest first, so that the
+        # cost depends on the depth of the path, not the number of roots.
+        directory = os.path.normpath(path)
+        while True:
+            parent = os.path.dirname(directory)
+            if parent in self._roots:
+                return self._roots[parent]
+            if parent == directory:
+                raise ValueError(f"{path} is not below the rse_root of any RSE profile")
+            directory = parent
@@ -19,7 +19,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+import hashlib
 import logging
+import os
 import random
 import time
 import zlib
@@ -27,18 +30,39 @@ import zlib
 import rucio.common.exception
 from rucio.client.didclient import DIDClient
 from rucio.client.replicaclient import ReplicaClient
+from rucio.client.ruleclient import RuleClient
 
 import lsst.daf.butler
 from lsst.daf.butler import DatasetRef
 from lsst.resources import ResourcePath
+from lsst.rucio.register.content_index import ContentIndex
+from lsst.rucio.register.did_builder import make_file_dids
+from lsst.rucio.register.hierarchy import DatasetHierarchy
+from lsst.rucio.register.metrics import Metrics
+from lsst.rucio.register.path_resolver import TemplatePathResolver
+from lsst.rucio.register.plan import RegistrationPlan
+from lsst.rucio.register.rate_limiter import RateLimiter, is_overload
 from lsst.rucio.register.resource_bundle import ResourceBundle
 from lsst.rucio.register.rubin_meta import RubinMeta
 from lsst.rucio.register.rucio_did import RucioDID
+from lsst.rucio.register.rules import ReplicationRule
+from lsst.rucio.register.sidecar import SidecarBuilder, encode_sidecar
 
-__all__ = ["RucioInterface"]
+__all__ = ["REGISTRATION_MODES", "RucioInterface"]
 
 logger = logging.getLogger(__name__)
 
+# "all" adds replicas and attaches them to datasets, "replicas" only adds
+# replicas, and "attach" only attaches files that already have replicas.
+REGISTRATION_MODES = ["all", "replicas", "attach"]
+
+
+def _summarize(names: list[str], limit: int = 3) -> str:
+    # Name the first few of a list of files, for logging.
+    if len(names) <= limit:
+        return ", ".join(names)
+    return f"{', '.join(names[:limit])} and {len(names) - limit} more"
+
 
 class RucioInterface:
     """Add files as replicas in Rucio, along with metadata,
@@ -58,6 +82,38 @@ class RucioInterface:
         Base URL of the data transfer node for the Rucio physical filename.
     rubin_butler_type: `str`
         the type registered in "rubin_butler" metadata for rucio
+    replica_client : `rucio.client.replicaclient.ReplicaClient`, optional
+        Client used to add replicas; a new one is created on first use if
+        not given.
+    did_client : `rucio.client.didclient.DIDClient`, optional
+        Client used to manage DIDs; a new one is created on first use if
+        not given.
+    metrics : `Metrics`, optional
+        Collector for timings and counters; a new one is created if not
+        given.
+    path_resolver : `TemplatePathResolver`, optional
+        Resolver used to locate datasets from file templates; if not given,
+        each dataset is looked up in the Butler datastore.
+    sidecar_encoding : `str`, optional
+        Encoding of the "rubin_sidecar" metadata; one of
+        `~lsst.rucio.register.sidecar.SIDECAR_ENCODINGS`.
+    hierarchy : `DatasetHierarchy`, optional
+        Containers that Rucio datasets are attached to; datasets and their
+        containers are then created in bulk before files are attached.
+    replication_rules : `list` [`ReplicationRule`], optional
+        Rules created on datasets once files of this interface's data type
+        are first attached to them.
+    rule_client : `rucio.client.ruleclient.RuleClient`, optional
+        Client used to add replication rules; a new one is created on first
+        use if not given.
+    rate_limiter : `RateLimiter`, optional
+        Limiter every request to Rucio waits on, and which is told when the
+        server reports being overloaded; requests are not limited if not
+        given.
+    content_index : `ContentIndex`, optional
+        Index of the checksums of local files, and of registered contents;
+        zip and dimension files identical to registered files are then
+        attached as the existing DIDs.
     """
 
     def __init__(
@@ -68,6 +124,16 @@ class RucioInterface:
         rse_root: str,
         dtn_url: str,
         rubin_butler_type: str,
+        replica_client: ReplicaClient | None = None,
+        did_client: DIDClient | None = None,
+        metrics: Metrics | None = None,
+        path_resolver: TemplatePathResolver | None = None,
+        sidecar_encoding: str = "json",
+        hierarchy: DatasetHierarchy | None = None,
+        replication_rules: list[ReplicationRule] | None = None,
+        rule_client: RuleClient | None = None,
+        rate_limiter: RateLimiter | None = None,
+        content_index: ContentIndex | None = None,
     ):
         self.butler = butler
         self.rse = rucio_rse
@@ -75,11 +141,83 @@ class RucioInterface:
         self.rse_root = rse_root
         self.dtn_url = dtn_url
         self.pfn_base = f"{dtn_url}"
-        self.replica_client = ReplicaClient()
-        self.did_client = DIDClient()
+        self._replica_client = replica_client
+        self._did_client = did_client
+        # Clients made here are replaced after a failed request, to
+        # reconnect; clients given here are kept.
+        self._own_replica_client = replica_client is None
+        self._own_did_client = did_client is None
         self.rubin_butler_type = rubin_butler_type
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.path_resolver = path_resolver
+        self.sidecar_encoding = sidecar_encoding
+        self.sidecar_builder = SidecarBuilder()
+        self.hierarchy = hierarchy
+        # Datasets known to exist, with their containers, and datasets
+        # files were attached to.
+        self._ensured_datasets: set[str] = set()
+        self.datasets_used: set[str] = set()
+        self.replication_rules = replication_rules or []
+        self._rule_client = rule_client
+        # (rule index, dataset) pairs whose rule has been created.
+        self._ruled_datasets: set[tuple[int, str]] = set()
+        self.rate_limiter = rate_limiter
+        self.content_index = content_index
+
+    @property
+    def replica_client(self) -> ReplicaClient:
+        # Created lazily, so that nothing contacts Rucio until needed.
+        if self._replica_client is None:
+            self._replica_client = ReplicaClient()
+        return self._replica_client
+
+    @replica_client.setter
+    def replica_client(self, client: ReplicaClient) -> None:
+        self._replica_client = client
+        self._own_replica_client = False
+
+    @property
+    def did_client(self) -> DIDClient:
+        if self._did_client is None:
+            self._did_client = DIDClient()
+        return self._did_client
+
+    @did_client.setter
+    def did_client(self, client: DIDClient) -> None:
+        self._did_client = client
+        self._own_did_client = False
 
-    def _make_dataset_ref_bundle(self, dataset_id: str, dataset_ref: DatasetRef) -> ResourceBundle:
+    @property
+    def rule_client(self) -> RuleClient:
+        if self._rule_client is None:
+            self._rule_client = RuleClient()
+        return self._rule_client
+
+    def with_data_type(self, rubin_butler_type: str) -> "RucioInterface":
+        """Return an interface registering another type of file with the
+        same settings, clients, and metrics.
+
+        Parameters
+        ----------
+        rubin_butler_type : `str`
+            The type registered in "rubin_butler" metadata.
+
+        Returns
+        -------
+        ri : `RucioInterface`
+            The new interface; the datasets it attaches files to are added
+            to `datasets_used` of this one.
+        """
+        ri = copy.copy(self)
+        ri.rubin_butler_type = rubin_butler_type
+        ri.sidecar_builder = SidecarBuilder()
+        # Which rules apply depends on the type.
+        ri._ruled_datasets = set()
+        return ri
+
+    def _make_dataset_ref_bundle(
+        self, dataset_id: str, dataset_ref: DatasetRef, uri: ResourcePath | None = None
+    ) -> ResourceBundle:
         """Make a ResourceBundle
 
         Parameters
@@ -88,18 +226,30 @@ class RucioInterface:
             Rucio dataset name
         dataset_ref : `DatasetRef`
             Butler DatasetRef
+        uri : `ResourcePath`, optional
+            Location of the dataset, if already known.
 
         Returns
         -------
         rb : `ResourceBundle`
             ResourceBundle consolidating dataset id and DatasetRef
         """
-        logging.debug("%s", dataset_ref.to_json())
-        did = self._make_did(self.butler.getURI(dataset_ref), dataset_ref.to_json())
+        logger.debug("%s", dataset_ref)
+        did = self._make_did(uri or self._get_uri(dataset_ref), self.sidecar_builder.to_json(dataset_ref))
         rb = ResourceBundle(dataset_id=dataset_id, did=did)
         return rb
 
-    def _make_zip_bundle(self, dataset_id: str, resource_path: ResourcePath) -> ResourceBundle:
+    def _get_uri(self, dataset_ref: DatasetRef) -> ResourcePath:
+        """Return the location of a dataset, from file templates if
+        possible.
+        """
+        if self.path_resolver is not None:
+            return self.path_resolver.getURI(dataset_ref)
+        return self.butler.getURI(dataset_ref)
+
+    def _make_zip_bundle(
+        self, dataset_id: str, resource_path: ResourcePath, hashes: tuple[int, str] | None = None
+    ) -> ResourceBundle:
         """Make a ResourceBundle
 
         Parameters
@@ -108,17 +258,21 @@ class RucioInterface:
             Rucio dataset name
         resouce_path : `ResourcePath`
             ResourcePath to a file
+        hashes : `tuple` [`int`, `str`], optional
+            Size and Adler32 checksum of the file, if already known.
 
         Returns
         -------
         rb: ResourceBundle
             ResourceBundle consolidating dataset id and ResourcePath
         """
-        did = self._make_did(resource_path)
+        did = self._make_did(resource_path, hashes=hashes)
         rb = ResourceBundle(dataset_id=dataset_id, did=did)
         return rb
 
-    def _make_dim_bundle(self, dataset_id: str, resource_path: ResourcePath) -> ResourceBundle:
+    def _make_dim_bundle(
+        self, dataset_id: str, resource_path: ResourcePath, hashes: tuple[int, str] | None = None
+    ) -> ResourceBundle:
         """Make a ResourceBundle
 
         Parameters
@@ -127,13 +281,15 @@ class RucioInterface:
             Rucio dataset name
         resouce_path : `lsst.resource.ResourcePath`
             ResourcePath to a file
+        hashes : `tuple` [`int`, `str`], optional
+            Size and Adler32 checksum of the file, if already known.
 
         Returns
         -------
         rb: `lsst.rucio.register.rucio_bundle.ResourceBundle`
             ResourceBundle consolidating dataset id and ResourcePath
         """
-        did = self._make_did(resource_path)
+        did = self._make_did(resource_path, hashes=hashes)
         rb = ResourceBundle(dataset_id=dataset_id, did=did)
         return rb
 
@@ -157,20 +313,158 @@ class RucioInterface:
         if "adler32" in checksums:
             adler32 = checksums["adler32"]
             logger.debug("found adler32 for %s", resource_path)
+            self.metrics.increment("checksum_cache_hits")
             return size, adler32
+        if self.content_index is not None:
+            return size, self._indexed_digests(resource_path, size)[0]
         return size, self._compute_adler32(resource_path)
 
     def _compute_adler32(self, resource_path: ResourcePath) -> tuple[int, str]:
+        return self._compute_digests(resource_path)[0]
+
+    def _compute_digests(self, resource_path: ResourcePath, sha256: bool = False) -> tuple[str, str | None]:
+        # Adler32 and, if asked for, SHA-256 digests of a file, read once.
         logger.debug("computing adler32 for %s", resource_path)
         adler32 = zlib.adler32(b"")
+        sha256_hash = hashlib.sha256() if sha256 else None
         buffer_size = 10 * 1024 * 1024
-        with resource_path.open("rb") as f:
+        nbytes = 0
+        with self.metrics.timer("hash"), resource_path.open("rb") as f:
             while buffer := f.read(buffer_size):
                 adler32 = zlib.adler32(buffer, adler32)
+                if sha256_hash is not None:
+                    sha256_hash.update(buffer)
+                nbytes += len(buffer)
+        self.metrics.increment("bytes_hashed", nbytes)
         adler32_digest = f"{adler32:08x}"
-        return adler32_digest
+        return adler32_digest, None if sha256_hash is None else sha256_hash.hexdigest()
+
+    def _indexed_digests(
+        self, resource_path: ResourcePath, size: int, sha256: bool = False
+    ) -> tuple[str, str | None]:
+        # Digests of a file from the content index if the file is unchanged
+        # since they were stored, or else computed and stored in it. The
+        # SHA-256 digest is only computed if asked for.
+        index = self.content_index
+        mtime_ns = os.stat(resource_path.ospath).st_mtime_ns if resource_path.isLocal else None
+        if mtime_ns is not None:
+            cached = index.checksums(resource_path.ospath, size, mtime_ns)
+            if cached is not None and (cached[1] is not None or not sha256):
+                self.metrics.increment("content_index_checksum_hits")
+                return cached
+        digests = self._compute_digests(resource_path, sha256)
+        if mtime_ns is not None:
+            index.add_checksums(resource_path.ospath, size, mtime_ns, *digests)
+        return digests
+
+    def _content_key(self, resource_path: ResourcePath) -> tuple[int, str, str]:
+        # Size, Adler32 checksum and SHA-256 digest of a file's content,
+        # reading the file at most once.
+        size = resource_path.size()
+        return (size, *self._indexed_digests(resource_path, size, sha256=True))
 
-    def _make_did(self, resource_path: ResourcePath, metadata: str = None) -> RucioDID:
+    def _make_bundles(self, dataset_id: str, resource_paths: list, make_bundle) -> tuple[list, list, list]:
+        """Make ResourceBundles of files, except for those whose content
+        is registered already.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Rucio dataset name.
+        resource_paths : `list` [`ResourcePath`]
+            Files to register.
+        make_bundle : `~collections.abc.Callable`
+            Makes the ResourceBundle of a file in a dataset.
+
+        Returns
+        -------
+        bundles : `list` [`ResourceBundle`]
+            Bundles of the files to register.
+        duplicates : `list` [`dict`]
+            Scope and name of the registered DIDs identical to the other
+            files, or earlier files in ``resource_paths``.
+        contents : `list` [`tuple`]
+            Content of the files to register, to add to the content index
+            once they are registered.
+        """
+        if self.content_index is None or not self.content_index.sha256:
+            return [make_bundle(dataset_id, resource_path) for resource_path in resource_paths], [], []
+        bundles, duplicates, contents = [], [], []
+        seen: dict[tuple, tuple[str, str]] = {}
+        for resource_path in resource_paths:
+            key = self._content_key(resource_path)
+            existing = seen.get(key) or self.content_index.find(*key)
+            if existing is not None:
+                logger.debug("%s is identical to %s:%s; attaching that instead", resource_path, *existing)
+                self.metrics.increment("duplicate_files")
+                duplicates.append({"scope": existing[0], "name": existing[1]})
+                continue
+            bundle = make_bundle(dataset_id, resource_path, key[:2])
+            seen[key] = (bundle.did.scope, bundle.did.name)
+            bundles.append(bundle)
+            contents.append(key + seen[key])
+        if duplicates:
+            logger.info(
+                "%d files are identical to registered files, which are attached instead", len(duplicates)
+            )
+        return bundles, duplicates, contents
+
+    def _register_bundles(self, dataset_id: str, bundles: list, duplicates: list, contents: list) -> int:
+        # Register files as made by _make_bundles, and attach duplicates.
+        # The bundles are owned by this method, and emptied once they
+        # have been added as replicas, releasing their sidecars before
+        # the files are attached.
+        num = len(bundles)
+        if bundles:
+            self._add_replicas(bundles)
+            if self.content_index is not None:
+                self.content_index.add(contents)
+            attachments = self._attachments(bundles)
+            bundles.clear()
+            self._attach_all(attachments)
+        if duplicates:
+            self.attach({dataset_id: duplicates})
+        return num + len(duplicates)
+
+    def _make_pfn_and_name(self, resource_path: ResourcePath) -> tuple[str, str]:
+        """Make the Rucio physical and logical file names of a resource.
+
+        Parameters
+        ----------
+        resource_path: ResourcePath
+            ResourcePath object below ``rse_root``
+
+        Returns
+        -------
+        names : `tuple` [`str`, `str`]
+            Physical file name and logical name within the scope.
+        """
+        path = resource_path.unquoted_path.removeprefix(self.rse_root)
+        pfn = self.pfn_base + path
+        logging.debug("pfn=%s", pfn)
+        name = path.removeprefix("/" + self.scope + "/")
+        logging.debug("name=%s", name)
+        logging.debug("path=%s", path)
+        return pfn, name
+
+    def encode_sidecar(self, sidecar: str) -> str:
+        """Encode sidecar metadata with this interface's sidecar encoding.
+
+        Parameters
+        ----------
+        sidecar : `str`
+            Sidecar, normally the JSON serialization of a ``DatasetRef``.
+
+        Returns
+        -------
+        encoded : `str`
+            Sidecar as it is registered with Rucio.
+        """
+        return encode_sidecar(sidecar, self.sidecar_encoding)
+
+    def _make_did(
+        self, resource_path: ResourcePath, metadata: str = None, hashes: tuple[int, str] | None = None
+    ) -> RucioDID:
         """Make a Rucio data identifier dictionary from a resource.
 
         Parameters
@@ -181,6 +475,9 @@ class RucioInterface:
         metadata: `str`
             String containing Rubin dataset specific metadata
 
+        hashes: `tuple` [`int`, `str`], optional
+            Size and Adler32 checksum of the file, computed if not given.
+
         Returns
         -------
         did : `dict` [`str`, `str`|`int`]
@@ -188,16 +485,12 @@ class RucioInterface:
             byte length, adler32 checksum, meta, and scope.
         """
 
-        size, adler32 = self.compute_hashes(resource_path)
-        path = resource_path.unquoted_path.removeprefix(self.rse_root)
-        pfn = self.pfn_base + path
-        logging.debug("pfn=%s", pfn)
-        name = path.removeprefix("/" + self.scope + "/")
-        logging.debug("name=%s", name)
-        logging.debug("path=%s", path)
+        start = time.perf_counter()
+        size, adler32 = hashes if hashes is not None else self.compute_hashes(resource_path)
+        pfn, name = self._make_pfn_and_name(resource_path)
 
         if metadata:
-            meta = RubinMeta(rubin_butler=self.rubin_butler_type, rubin_sidecar=metadata)
+            meta = RubinMeta(rubin_butler=self.rubin_butler_type, rubin_sidecar=self.encode_sidecar(metadata))
         else:
             meta = RubinMeta(rubin_butler=self.rubin_butler_type, rubin_sidecar="")
         d = RucioDID(
@@ -208,9 +501,74 @@ class RucioInterface:
             scope=self.scope,
             meta=meta,
         )
+        self.metrics.observe("make_did", time.perf_counter() - start)
 
         return d
 
+    def make_dids(
+        self,
+        paths,
+        sizes,
+        adler32s,
+        sidecars=None,
+        rubin_butler_type: str | None = None,
+    ) -> list[dict]:
+        """Make Rucio file DIDs for a batch of files given as columns.
+
+        Parameters
+        ----------
+        paths : `~collections.abc.Iterable` [`str`]
+            Local paths of the files, below ``rse_root``. May be a list, or
+            a pyarrow or numpy array, as may the other columns.
+        sizes : `~collections.abc.Iterable` [`int`]
+            Size of each file in bytes.
+        adler32s : `~collections.abc.Iterable` [`str`]
+            Adler32 checksum of each file.
+        sidecars : `~collections.abc.Iterable` [`str`], optional
+            Rubin sidecar metadata of each file, registered as given; see
+            `encode_sidecar`.
+        rubin_butler_type : `str`, optional
+            Type registered in the "rubin_butler" metadata; defaults to the
+            type this interface was created with.
+
+        Returns
+        -------
+        dids : `list` [`dict`]
+            Rucio file DIDs, ready for `register_dids`.
+        """
+        with self.metrics.timer("make_dids"):
+            return make_file_dids(
+                paths,
+                sizes,
+                adler32s,
+                scope=self.scope,
+                rse_root=self.rse_root,
+                pfn_base=self.pfn_base,
+                rubin_butler_type=rubin_butler_type or self.rubin_butler_type,
+                sidecars=sidecars,
+            )
+
+    def register_dids(self, dataset_id: str, dids: list[dict]) -> int:
+        """Add files as replicas and attach them to a Rucio dataset.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Rucio dataset name.
+        dids : `list` [`dict`]
+            Rucio file DIDs, as made by `make_dids`.
+
+        Returns
+        -------
+        num : `int`
+            Number of files registered.
+        """
+        if not dids:
+            return 0
+        self._add_replica_dids(dids)
+        self._attach_dids(dataset_id, dids, self.rse)
+        return len(dids)
+
     def _add_replicas(self, bundles: list[ResourceBundle]) -> None:
         """Call the Rucio method add_replica for a list of DIDs
 
@@ -219,33 +577,57 @@ class RucioInterface:
         bundles : `list` [`ResourceBundle`]
             A list of ResourceBundles
         """
-        dids = [bundle.get_did() for bundle in bundles]
+        self._add_replica_dids([bundle.get_did() for bundle in bundles])
+
+    def _add_replica_dids(self, dids: list[dict]) -> None:
+        """Call the Rucio method add_replica for a list of DIDs
+
+        Parameters
+        ----------
+        dids : `list` [`dict`]
+            Rucio file DIDs.
+        """
         retries = 0
         max_retries = 5
         while True:
             try:
-                self.replica_client.add_replicas(rse=self.rse, files=dids)
+                with self.metrics.timer("add_replicas"):
+                    self._call(self.replica_client.add_replicas, rse=self.rse, files=dids, num_dids=len(dids))
                 break
             except rucio.common.exception.RucioException:
                 retries += 1
                 if retries < max_retries:
                     seconds = random.randint(10, 20)
                     logger.debug("failed to add_replicas; sleeping %d seconds", seconds)
-                    time.sleep(seconds)
-                    self.replica_client = ReplicaClient()  # XXX not sure we need to do this.
+                    self._sleep(seconds)
+                    if self._own_replica_client:
+                        # Reconnect on the next attempt.
+                        self._replica_client = None
                 else:
                     raise Exception(f"Tried {max_retries} times and couldn't add_replicas")
 
-    def _add_file_to_dataset_with_retries(self, dataset_id, did):
+    def _sleep(self, seconds: int) -> None:
+        """Sleep before retrying a failed Rucio request, recording it."""
+        self.metrics.increment("retries")
+        self.metrics.increment("sleep_seconds", seconds)
+        time.sleep(seconds)
+
+    def _add_file_to_dataset_with_retries(self, dataset_id, did, rse=None):
         retries = 0
         max_retries = 5
         while True:
             try:
-                self.did_client.add_files_to_dataset(
-                    scope=self.scope, name=dataset_id, files=[did], rse=self.rse
+                self._call(
+                    self.did_client.add_files_to_dataset,
+                    scope=self.scope,
+                    name=dataset_id,
+                    files=[did],
+                    rse=rse,
+                    num_dids=1,
                 )
                 break
             except rucio.common.exception.FileAlreadyExists:
+                self.metrics.increment("file_already_exists")
                 if "pfn" in did:
                     logger.debug("file %s already registered in dataset %s", did["pfn"], dataset_id)
                 return  # we can return, because it's already in the dataset
@@ -254,13 +636,15 @@ class RucioInterface:
                 if retries < max_retries:
                     seconds = random.randint(10, 20)
                     logger.debug("failed to register one did to %s; sleeping %d seconds", dataset_id, seconds)
-                    time.sleep(seconds)
-                    self.did_client = DIDClient()  # XXX not sure we need to do this.
+                    self._sleep(seconds)
+                    if self._own_did_client:
+                        # Reconnect on the next attempt.
+                        self._did_client = None
                 else:
                     # we tried max_retries times, and failed, so we'll bail out
                     raise Exception(f"Couldn't add {did['pfn']} to dataset {dataset_id}")
 
-    def _add_files_to_dataset(self, dataset_id: str, dids: list[dict]) -> None:
+    def _add_files_to_dataset(self, dataset_id: str, dids: list[dict], rse: str | None = None) -> None:
         """Attach a list of files specified by Rucio DIDs to a Rucio dataset.
 
         Ignores already-attached files for idempotency.
@@ -271,26 +655,35 @@ class RucioInterface:
             Logical name of the Rucio dataset.
         dids : `list` [`dict` [`str`, `str`|`int`] ]
             List of Rucio data identifiers.
+        rse : `str`, optional
+            RSE the files are replicas on, for Rucio to register them
+            there if needed; the DIDs must then have their size and
+            checksum.
         """
         retries = 0
         max_retries = 5
         while True:
             try:
-                self.did_client.add_files_to_dataset(
-                    scope=self.scope,
-                    name=dataset_id,
-                    files=dids,
-                    rse=self.rse,
-                )
+                with self.metrics.timer("attach"):
+                    self._call(
+                        self.did_client.add_files_to_dataset,
+                        scope=self.scope,
+                        name=dataset_id,
+                        files=dids,
+                        rse=rse,
+                        num_dids=len(dids),
+                    )
                 return
             except rucio.common.exception.FileAlreadyExists:
                 # At least one already is in the dataset.
                 # This shouldn't happen, but if it does,
                 # we have to retry each individually.
+                self.metrics.increment("file_already_exists_fallbacks")
                 for did in dids:
                     self._add_file_to_dataset_with_retries(
                         dataset_id=dataset_id,
                         did=did,
+                        rse=rse,
                     )
                 return
             except rucio.common.exception.DataIdentifierNotFound as e:
@@ -300,7 +693,7 @@ class RucioInterface:
                 if retries < max_retries:
                     seconds = random.randint(10, 20)
                     logger.debug("failed to register dids to %s; sleeping %d", dataset_id, seconds)
-                    time.sleep(seconds)
+                    self._sleep(seconds)
                     continue
                 else:
                     raise Exception(f"Couldn't add files to dataset {dataset_id}")
@@ -310,11 +703,13 @@ class RucioInterface:
         max_retries = 5
         while True:
             try:
-                self.did_client.add_dataset(
+                self._call(
+                    self.did_client.add_dataset,
                     scope=self.scope,
                     name=dataset_id,
                     statuses=statuses,
                     rse=self.rse,
+                    num_dids=1,
                 )
                 return
             except rucio.common.exception.DataIdentifierAlreadyExists as e:
@@ -325,7 +720,7 @@ class RucioInterface:
                 if retries < max_retries:
                     seconds = random.randint(10, 20)
                     logger.debug("couldn't register dids to %s; waiting %d", dataset_id, seconds)
-                    time.sleep(seconds)
+                    self._sleep(seconds)
                     continue
                 else:
                     raise Exception(f"Tried {max_retries} times and couldn't add dataset {dataset_id}")
@@ -338,36 +733,338 @@ class RucioInterface:
         bundles : `list` [`ResourceBundle`]
             List of resource bundles
         """
-        logger.debug("register to dataset")
+        self._attach_all(self._attachments(bundles))
 
-        datasets = dict()
+    def _attachments(self, bundles: list[ResourceBundle]) -> dict[str, list[dict]]:
+        # The DIDs of files to attach to each dataset, once they have been
+        # added as replicas. Their metadata, which holds the sidecar, is
+        # only used when replicas are added, so it is left out; the bundles
+        # can then be released while the files are attached.
+        datasets: dict[str, list[dict]] = {}
         for bundle in bundles:
-            dataset_id = bundle.dataset_id
-            datasets.setdefault(dataset_id, []).append(bundle)
+            datasets.setdefault(bundle.dataset_id, []).append(bundle.did.model_dump(exclude={"meta"}))
+        return datasets
+
+    def _attach_all(self, attachments: dict[str, list[dict]]) -> None:
+        # Attach files to their datasets, releasing each dataset's DIDs as
+        # soon as they are attached.
+        logger.debug("register to dataset")
+        start = time.perf_counter()
+        num = sum(len(dids) for dids in attachments.values())
+
+        if len(attachments) > 1:
+            self.attach(attachments)
+        else:
+            while attachments:
+                dataset_id, dids = attachments.popitem()
+                self._attach_dids(dataset_id, dids, self.rse)
+        attachments.clear()
+
+        self.metrics.observe("register_to_dataset", time.perf_counter() - start)
+        logger.debug("Done with Rucio for %d files", num)
+
+    def _attach_dids(self, dataset_id: str, dids: list[dict], rse: str | None = None) -> None:
+        """Attach files to a Rucio dataset, creating it if necessary.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Rucio dataset name.
+        dids : `list` [`dict`]
+            Rucio file DIDs.
+        rse : `str`, optional
+            RSE the files are replicas on; see `_add_files_to_dataset`.
+        """
+        if self.hierarchy is not None:
+            self.ensure_datasets([dataset_id])
+        self.datasets_used.add(dataset_id)
+        try:
+            names = [did.get("pfn", did["name"]) for did in dids]
+            logger.info(
+                "Registering %d files in dataset %s, RSE %s: %s",
+                len(names),
+                dataset_id,
+                self.rse,
+                _summarize(names),
+            )
+            logger.debug("Registering %s in dataset %s", names, dataset_id)
+            self._add_files_to_dataset(dataset_id, dids, rse)
+        except rucio.common.exception.DataIdentifierNotFound:
+            # No such dataset, so create it
+            try:
+                logger.info("Creating Rucio dataset %s", dataset_id)
+                self._add_dataset_with_retries(
+                    dataset_id=dataset_id,
+                    statuses={"monotonic": True},
+                )
+            except rucio.common.exception.DataIdentifierAlreadyExists:
+                # If someone else created it in the meantime
+                pass
+            # And then retry adding DIDs
+            self._add_files_to_dataset(dataset_id, dids, rse)
+        self.add_rules([dataset_id])
+
+    def attach(self, attachments: dict[str, list[dict]]) -> None:
+        """Attach files to several Rucio datasets in one request, creating
+        any of the datasets that do not exist.
 
-        for dataset_id, bundles in datasets.items():
+        Files already attached to a dataset are ignored.
+
+        Parameters
+        ----------
+        attachments : `dict` [`str`, `list` [`dict`]]
+            Rucio file DIDs, which need only have a scope and name, to
+            attach to each dataset.
+        """
+        payload = [
+            {
+                "scope": self.scope,
+                "name": dataset_id,
+                "dids": [{"scope": did["scope"], "name": did["name"]} for did in dids],
+            }
+            for dataset_id, dids in attachments.items()
+        ]
+        if self.hierarchy is not None:
+            self.ensure_datasets(attachments)
+        self.datasets_used.update(attachments)
+        created = False
+        retries = 0
+        max_retries = 5
+        while True:
             try:
-                dids = [rb.get_did() for rb in bundles]
-                names = [did["pfn"] for did in dids]
-                logger.info("Registering %s in dataset %s, RSE %s", names, dataset_id, self.rse)
-                self._add_files_to_dataset(dataset_id, dids)
+                with self.metrics.timer("attach"):
+                    self._call(
+                        self.did_client.attach_dids_to_dids,
+                        attachments=payload,
+                        ignore_duplicate=True,
+                        num_dids=sum(len(dids) for dids in attachments.values()),
+                    )
+                break
             except rucio.common.exception.DataIdentifierNotFound:
-                # No such dataset, so create it
+                if created:
+                    raise
+                # Some of the datasets are new; create them all, and retry.
+                self._ensured_datasets.difference_update(attachments)
+                self.ensure_datasets(attachments)
+                created = True
+            except rucio.common.exception.RucioException:
+                retries += 1
+                if retries < max_retries:
+                    seconds = random.randint(10, 20)
+                    logger.debug("failed to attach dids to %d datasets; sleeping %d", len(payload), seconds)
+                    self._sleep(seconds)
+                else:
+                    raise Exception(f"Couldn't attach files to {len(payload)} datasets")
+        self.add_rules(attachments)
+
+    def _call(self, func, *args, num_dids: int = 0, **kwargs):
+        # Call a Rucio client method once the rate limiter allows it, and
+        # tell the limiter how the server coped.
+        if self.rate_limiter is None:
+            return func(*args, **kwargs)
+        self.rate_limiter.acquire(num_dids)
+        try:
+            result = func(*args, **kwargs)
+        except rucio.common.exception.RucioException as e:
+            if is_overload(e):
+                logger.debug("Rucio server is overloaded; slowing down")
+                self.rate_limiter.throttled()
+            raise
+        self.rate_limiter.succeeded()
+        return result
+
+    def _with_retries(self, description: str, func, *args, num_dids: int = 0, **kwargs):
+        # Call a Rucio client method, retrying on server errors the way the
+        # other requests here do.
+        retries = 0
+        max_retries = 5
+        while True:
+            try:
+                return self._call(func, *args, num_dids=num_dids, **kwargs)
+            except (
+                rucio.common.exception.DataIdentifierAlreadyExists,
+                rucio.common.exception.DataIdentifierNotFound,
+                rucio.common.exception.DuplicateRule,
+            ):
+                raise
+            except rucio.common.exception.RucioException:
+                retries += 1
+                if retries < max_retries:
+                    seconds = random.randint(10, 20)
+                    logger.debug("failed to %s; sleeping %d seconds", description, seconds)
+                    self._sleep(seconds)
+                else:
+                    raise Exception(f"Tried {max_retries} times and couldn't {description}")
+
+    def _existing_dids(self, names: list[str]) -> set[str]:
+        """Return which of some DIDs in this scope exist, in one request."""
+        dids = [{"scope": self.scope, "name": name} for name in names]
+        try:
+            with self.metrics.timer("get_metadata_bulk"):
+                found = self._with_retries(
+                    "look up DIDs", self.did_client.get_metadata_bulk, dids, num_dids=len(dids)
+                )
+                return {meta["name"] for meta in found}
+        except rucio.common.exception.DataIdentifierNotFound:
+            return set()
+
+    def _add_dids(self, dids: list[dict]) -> None:
+        """Create datasets and containers in one request, tolerating any
+        created by someone else in the meantime.
+        """
+        try:
+            with self.metrics.timer("add_dids"):
+                self._with_retries(
+                    f"add {len(dids)} DIDs", self.did_client.add_dids, dids, num_dids=len(dids)
+                )
+        except rucio.common.exception.DataIdentifierAlreadyExists:
+            self.metrics.increment("did_already_exists_fallbacks")
+            for did in dids:
                 try:
-                    logger.info("Creating Rucio dataset %s", dataset_id)
-                    self._add_dataset_with_retries(
-                        dataset_id=dataset_id,
-                        statuses={"monotonic": True},
-                    )
+                    self._with_retries(f"add DID {did['name']}", self.did_client.add_dids, [did], num_dids=1)
                 except rucio.common.exception.DataIdentifierAlreadyExists:
-                    # If someone else created it in the meantime
                     pass
-                # And then retry adding DIDs
-                self._add_files_to_dataset(dataset_id, dids)
+        self.metrics.increment("dids_created", len(dids))
+
+    def ensure_datasets(self, dataset_ids) -> None:
+        """Create Rucio datasets, and the containers of `hierarchy` they
+        belong to, and attach them to their containers.
 
-        logger.debug("Done with Rucio for %s", bundles)
+        Existing DIDs are found with one request, the missing ones are
+        created with another, and all attachments are made with a third.
+        Datasets already handled by this interface are skipped.
 
-    def register_as_replicas(self, dataset_id, dataset_refs) -> None:
+        Parameters
+        ----------
+        dataset_ids : `~collections.abc.Iterable` [`str`]
+            Names of the Rucio datasets.
+        """
+        new = [
+            dataset_id
+            for dataset_id in dict.fromkeys(dataset_ids)
+            if dataset_id not in self._ensured_datasets
+        ]
+        if not new:
+            return
+        containers, children = ([], {}) if self.hierarchy is None else self.hierarchy.attachments(new)
+        existing = self._existing_dids(containers + new)
+        dids = [
+            {"scope": self.scope, "name": name, "type": "CONTAINER"}
+            for name in containers
+            if name not in existing
+        ] + [
+            {"scope": self.scope, "name": name, "type": "DATASET", "statuses": {"monotonic": True}}
+            for name in new
+            if name not in existing
+        ]
+        if dids:
+            logger.info(
+                "Creating Rucio %s", ", ".join(f"{did['type'].lower()} {did['name']}" for did in dids)
+            )
+            self._add_dids(dids)
+        if children:
+            payload = [
+                {
+                    "scope": self.scope,
+                    "name": parent,
+                    "dids": [{"scope": self.scope, "name": name} for name in names],
+                }
+                for parent, names in children.items()
+            ]
+            with self.metrics.timer("attach_containers"):
+                self._with_retries(
+                    f"attach to {len(payload)} containers",
+                    self.did_client.attach_dids_to_dids,
+                    attachments=payload,
+                    ignore_duplicate=True,
+                    num_dids=sum(len(names) for names in children.values()),
+                )
+        self._ensured_datasets.update(new)
+
+    def add_rules(self, dataset_ids) -> None:
+        """Create the `replication_rules` that apply to some datasets.
+
+        Each rule is created with one request for all the datasets it
+        applies to, and only once per dataset; rules that already exist
+        are ignored.
+
+        Parameters
+        ----------
+        dataset_ids : `~collections.abc.Iterable` [`str`]
+            Names of Rucio datasets files were attached to.
+        """
+        dataset_ids = list(dict.fromkeys(dataset_ids))
+        for index, rule in enumerate(self.replication_rules):
+            new = [
+                dataset_id
+                for dataset_id in dataset_ids
+                if (index, dataset_id) not in self._ruled_datasets
+                and rule.applies_to(dataset_id, self.rubin_butler_type)
+            ]
+            if not new:
+                continue
+            dids = [{"scope": self.scope, "name": dataset_id} for dataset_id in new]
+            logger.info("Adding rule to %s on %s", rule.rse_expression, ", ".join(new))
+            try:
+                with self.metrics.timer("add_rules"):
+                    self._with_retries(
+                        f"add rules to {rule.rse_expression}",
+                        self.rule_client.add_replication_rule,
+                        dids,
+                        num_dids=len(dids),
+                        **rule.options(),
+                    )
+                self.metrics.increment("rules_created", len(dids))
+            except rucio.common.exception.DuplicateRule:
+                # At least one exists already; add the others one by one.
+                for did in dids:
+                    try:
+                        self._with_retries(
+                            f"add rule to {did['name']}",
+                            self.rule_client.add_replication_rule,
+                            [did],
+                            num_dids=1,
+                            **rule.options(),
+                        )
+                        self.metrics.increment("rules_created")
+                    except rucio.common.exception.DuplicateRule:
+                        self.metrics.increment("rules_existing")
+            self._ruled_datasets.update((index, dataset_id) for dataset_id in new)
+
+    def close_datasets(self, dataset_ids=None) -> int:
+        """Close Rucio datasets, so that no more files can be attached.
+
+        Parameters
+        ----------
+        dataset_ids : `~collections.abc.Iterable` [`str`], optional
+            Names of the datasets; defaults to every dataset files were
+            attached to by this interface.
+
+        Returns
+        -------
+        num : `int`
+            Number of datasets closed.
+        """
+        dataset_ids = sorted(self.datasets_used if dataset_ids is None else dataset_ids)
+        for dataset_id in dataset_ids:
+            logger.info("Closing Rucio dataset %s", dataset_id)
+            with self.metrics.timer("close"):
+                self._with_retries(
+                    f"close dataset {dataset_id}",
+                    self.did_client.close,
+                    self.scope,
+                    dataset_id,
+                    num_dids=1,
+                )
+        return len(dataset_ids)
+
+    def _make_attachment_did(self, dataset_ref: DatasetRef, uri: ResourcePath | None = None) -> dict:
+        # Only the name is needed to attach a file that is already
+        # registered, so nothing is hashed or serialized.
+        _, name = self._make_pfn_and_name(uri or self._get_uri(dataset_ref))
+        return {"scope": self.scope, "name": name}
+
+    def register_as_replicas(self, dataset_id, dataset_refs, mode: str = "all") -> None:
         """Register a list of DatasetRefs to a Rucio dataset
 
         Parameters
@@ -376,19 +1073,108 @@ class RucioInterface:
             RUCIO dataset id
         dataset_refs : `list` [`DatasetRef`]
             list of Butler DatasetRefs
+        mode : `str`, optional
+            One of `REGISTRATION_MODES`: ``all`` adds the files as replicas
+            and attaches them to the dataset, ``replicas`` only adds them
+            as replicas, and ``attach`` only attaches files which are
+            already registered, without reading them.
+        """
+        refs, uris = self.resolve_refs(dataset_refs)
+        if len(refs) == 0:
+            return 0
+        return self.register_resolved_refs(dataset_id, refs, uris, mode)
+
+    def resolve_refs(self, dataset_refs) -> tuple[list, list]:
+        """Find the location of each of a list of DatasetRefs.
+
+        Parameters
+        ----------
+        dataset_refs : `list` [`DatasetRef`]
+            Butler DatasetRefs, or lists of them.
+
+        Returns
+        -------
+        refs : `list` [`DatasetRef`]
+            The DatasetRefs, flattened.
+        uris : `list` [`ResourcePath`]
+            Location of each DatasetRef, from file templates if possible.
         """
-        bundles = []
+        refs = []
         for dataset_ref in dataset_refs:
             if type(dataset_ref) is list:
-                for dsr in dataset_ref:
-                    bundles.append(self._make_dataset_ref_bundle(dataset_id, dsr))
+                refs.extend(dataset_ref)
             else:
-                bundles.append(self._make_dataset_ref_bundle(dataset_id, dataset_ref))
-        if len(bundles) == 0:
-            return 0
+                refs.append(dataset_ref)
+        return refs, [self._get_uri(ref) for ref in refs]
+
+    def register_resolved_refs(self, dataset_id: str, refs: list, uris: list, mode: str = "all") -> int:
+        """Register DatasetRefs whose locations are known to a Rucio
+        dataset.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Rucio dataset name.
+        refs : `list` [`DatasetRef`]
+            Butler DatasetRefs.
+        uris : `list` [`ResourcePath`]
+            Location of each DatasetRef.
+        mode : `str`, optional
+            One of `REGISTRATION_MODES`; see `register_as_replicas`.
+
+        Returns
+        -------
+        num : `int`
+            Number of files registered.
+        """
+        if mode == "attach":
+            # Only the names of the files are known, so no RSE is given;
+            # Rucio would otherwise try to register them as replicas.
+            self._attach_dids(
+                dataset_id, [self._make_attachment_did(ref, uri) for ref, uri in zip(refs, uris)]
+            )
+            return len(refs)
+        bundles = [self._make_dataset_ref_bundle(dataset_id, ref, uri) for ref, uri in zip(refs, uris)]
         self._add_replicas(bundles)
-        self.register_to_dataset(bundles)
-        return len(bundles)
+        if mode == "all":
+            attachments = self._attachments(bundles)
+            # Release the sidecars before attaching.
+            bundles.clear()
+            self._attach_all(attachments)
+        return len(refs)
+
+    def plan_dataset_refs(self, plan: RegistrationPlan, dataset_id: str, dataset_refs) -> int:
+        """Account for a list of DatasetRefs in a registration plan.
+
+        Only the file metadata is consulted; no file contents are read and
+        Rucio is not contacted.
+
+        Parameters
+        ----------
+        plan : `RegistrationPlan`
+            Plan to add the files to.
+        dataset_id : `str`
+            RUCIO dataset id
+        dataset_refs : `list` [`DatasetRef`]
+            list of Butler DatasetRefs
+
+        Returns
+        -------
+        num : `int`
+            number of files added to the plan
+        """
+        cnt = 0
+        scope_root = f"{self.rse_root.rstrip('/')}/{self.scope}/"
+        for dataset_ref in dataset_refs:
+            refs = dataset_ref if type(dataset_ref) is list else [dataset_ref]
+            for ref in refs:
+                resource_path = self._get_uri(ref)
+                info = resource_path.get_info()
+                plan.add(dataset_id, info.size, "adler32" in info.checksums)
+                if not resource_path.unquoted_path.startswith(scope_root):
+                    plan.outside_scope += 1
+                cnt += 1
+        return cnt
 
     def register_zips(self, dataset_id: str, zip_files: list) -> int:
         """Register a list of zips to a Rucio Dataset
@@ -405,12 +1191,9 @@ class RucioInterface:
         num : `int`
             number of zip files ingested
         """
-        bundles = []
-        for zip_file in zip_files:
-            bundles.append(self._make_zip_bundle(dataset_id, zip_file))
-        self._add_replicas(bundles)
-        self.register_to_dataset(bundles)
-        return len(bundles)
+        return self._register_bundles(
+            dataset_id, *self._make_bundles(dataset_id, zip_files, self._make_zip_bundle)
+        )
 
     def register_dims(self, dataset_id: str, dim_files: list) -> int:
         """Register a list of dimension files to a Rucio Dataset
@@ -427,9 +1210,6 @@ class RucioInterface:
         num : `int`
             number of dimension files ingested
         """
-        bundles = []
-        for dim_file in dim_files:
-            bundles.append(self._make_dim_bundle(dataset_id, dim_file))
-        self._add_replicas(bundles)
-        self.register_to_dataset(bundles)
-        return len(bundles)
+        return self._register_bundles(
+            dataset_id, *self._make_bundles(dataset_id, dim_files, self._make_dim_bundle)
+        )
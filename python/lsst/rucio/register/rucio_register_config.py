@@ -20,6 +20,11 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import yaml
 
+from lsst.rucio.register.hierarchy import ContainerRule
+from lsst.rucio.register.rse_profiles import RseProfile, RseSelector
+from lsst.rucio.register.rules import ReplicationRule
+from lsst.rucio.register.sidecar import SIDECAR_ENCODINGS
+
 
 class RucioRegisterConfig:
     """Describes a Rucio configuration
@@ -28,6 +33,55 @@ class RucioRegisterConfig:
     ----------
     config_file: `str`
        path to configuration file
+
+    Notes
+    -----
+    Besides the required ``rucio_rse``, ``scope``, ``rse_root`` and
+    ``dtn_url``, the optional ``hash_throughput`` (MB/s) and
+    ``register_rate`` (files/s) are used to estimate run times in
+    ``--plan`` mode.
+
+    Optionally, ``path_templates`` maps dataset type names to Butler file
+    templates (or names a `DatasetMap` YAML file of them), relative to the
+    datastore root ``path_template_root``. Datasets of those types are
+    then located without asking the datastore, and a fraction
+    ``path_template_sample_rate`` of the locations is verified.
+
+    ``sidecar_encoding`` selects how the "rubin_sidecar" metadata is
+    stored: ``json`` (the default), or compressed with ``zlib`` or
+    ``zstd``; see `lsst.rucio.register.sidecar.decode_sidecar`.
+
+    ``containers`` lists the containers Rucio datasets are organized in,
+    as `~lsst.rucio.register.hierarchy.ContainerRule` mappings of a
+    ``pattern`` matching dataset names to ``containers`` templates. With
+    ``close_datasets`` true, the datasets files were attached to are
+    closed when a run finishes.
+
+    ``replication_rules`` lists `~lsst.rucio.register.rules.ReplicationRule`
+    mappings, each with an ``rse_expression`` and optionally ``copies``,
+    ``lifetime``, and the ``data_types`` and dataset name ``pattern`` it
+    is restricted to. Matching rules are created on each dataset as soon
+    as files are attached to it.
+
+    ``requests_per_sec`` and ``dids_per_sec`` limit the rate of requests
+    to the Rucio server, and of files and DIDs in them, with up to
+    ``rate_limit_burst`` seconds of unused allowance saved up. The limits
+    apply to all threads of a run, and with ``rate_limit_lock_file`` to
+    all runs on the node sharing that file. The rates are lowered while
+    the server answers with HTTP 429 or 503.
+
+    ``content_index`` names a SQLite file caching the checksums of local
+    files and recording the contents registered; zip and dimension files
+    identical to registered ones are attached as the existing DIDs
+    instead. Files are identical if their SHA-256 digests match; with
+    ``content_index_sha256`` false, only checksums are cached.
+
+    ``rse_profiles`` lists further RSEs, as
+    `~lsst.rucio.register.rse_profiles.RseProfile` mappings of
+    ``rucio_rse``, ``rse_root``, ``dtn_url`` and optionally ``scope``,
+    which defaults to ``scope``. Each file is registered on the RSE,
+    among these and the one given by the top-level keys, whose
+    ``rse_root`` is the longest prefix of its path.
     """
 
     def __init__(self, config_file: str):
@@ -38,3 +92,33 @@ class RucioRegisterConfig:
         self.scope = config["scope"]
         self.rse_root = config["rse_root"]
         self.dtn_url = config["dtn_url"]
+        self.hash_throughput = float(config.get("hash_throughput", 200.0))
+        self.register_rate = float(config.get("register_rate", 50.0))
+        self.path_templates = config.get("path_templates")
+        self.path_template_root = config.get("path_template_root")
+        self.path_template_sample_rate = float(config.get("path_template_sample_rate", 0.01))
+        self.sidecar_encoding = config.get("sidecar_encoding", "json")
+        if self.sidecar_encoding not in SIDECAR_ENCODINGS:
+            raise ValueError(f"sidecar_encoding must be one of {SIDECAR_ENCODINGS}")
+        self.containers = [ContainerRule(**rule) for rule in config.get("containers") or []]
+        self.close_datasets = bool(config.get("close_datasets", False))
+        self.replication_rules = [ReplicationRule(**rule) for rule in config.get("replication_rules") or []]
+        self.requests_per_sec = _optional_float(config.get("requests_per_sec"))
+        self.dids_per_sec = _optional_float(config.get("dids_per_sec"))
+        self.rate_limit_burst = float(config.get("rate_limit_burst", 1.0))
+        self.rate_limit_lock_file = config.get("rate_limit_lock_file")
+        self.content_index = config.get("content_index")
+        self.content_index_sha256 = bool(config.get("content_index_sha256", True))
+        self.rse_profiles = [
+            RseProfile(
+                rucio_rse=self.rucio_rse, scope=self.scope, rse_root=self.rse_root, dtn_url=self.dtn_url
+            )
+        ] + [RseProfile(**{"scope": self.scope, **profile}) for profile in config.get("rse_profiles") or []]
+        # Check that the roots differ.
+        RseSelector(self.rse_profiles)
+        if self.path_templates and not self.path_template_root:
+            raise ValueError("path_templates requires path_template_root")
+
+
+def _optional_float(value) -> float | None:
+    return None if value is None else float(value)
@@ -0,0 +1,86 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+
+import pydantic
+
+__all__ = ["ReplicationRule"]
+
+
+class ReplicationRule(pydantic.BaseModel):
+    """Replication rule created on Rucio datasets as files are attached
+    to them
+
+    Parameters
+    ----------
+    rse_expression : `str`
+        RSE expression of the destinations.
+    copies : `int`, optional
+        Number of copies to keep.
+    lifetime : `int`, optional
+        Lifetime of the rule in seconds; forever if not given.
+    data_types : `list` [`str`], optional
+        `DataType` values the rule is restricted to; any if empty.
+    pattern : `str`, optional
+        Regular expression the start of dataset names must match; any
+        dataset if not given.
+    grouping : `str`, optional
+        Rucio grouping of the replicas: ``DATASET``, ``ALL`` or ``NONE``.
+    activity : `str`, optional
+        Transfer activity of the rule.
+    comment : `str`, optional
+        Comment recorded with the rule.
+    """
+
+    rse_expression: str
+    copies: int = 1
+    lifetime: int | None = None
+    data_types: list[str] = []
+    pattern: str | None = None
+    grouping: str = "DATASET"
+    activity: str | None = None
+    comment: str | None = None
+
+    def applies_to(self, dataset_id: str, data_type: str) -> bool:
+        """Return whether the rule is wanted on a dataset.
+
+        Parameters
+        ----------
+        dataset_id : `str`
+            Name of the Rucio dataset.
+        data_type : `str`
+            `DataType` of the files attached to it.
+
+        Returns
+        -------
+        applies : `bool`
+            `True` if the rule should be created on the dataset.
+        """
+        if self.data_types and data_type not in self.data_types:
+            return False
+        return self.pattern is None or re.match(self.pattern, dataset_id) is not None
+
+    def options(self) -> dict:
+        """Return the arguments of ``RuleClient.add_replication_rule``,
+        besides the DIDs.
+        """
+        return self.model_dump(exclude={"data_types", "pattern"})
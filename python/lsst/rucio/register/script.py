@@ -20,6 +20,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import functools
 import itertools
 import logging
 import os
@@ -27,17 +28,32 @@ from typing import Any
 
 import click
 
-from lsst.daf.butler import Butler
+from lsst.daf.butler import InvalidQueryError
 from lsst.daf.butler.cli.opt import (
     log_level_option,
     options_file_option,
     query_datasets_options,
 )
 from lsst.daf.butler.script.queryDatasets import QueryDatasets
+from lsst.daf.butler.utils import has_globs
 from lsst.resources import ResourcePath
+from lsst.rucio.register.content_index import ContentIndex
 from lsst.rucio.register.data_type import DataType
-from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.export import YamlExportStream
+from lsst.rucio.register.hierarchy import DatasetHierarchy
+from lsst.rucio.register.lazy_butler import LazyButler
+from lsst.rucio.register.manifest import register_manifest
+from lsst.rucio.register.memory import MemoryBudget
+from lsst.rucio.register.metrics import Metrics
+from lsst.rucio.register.multi_rse import MultiRseInterface
+from lsst.rucio.register.path_resolver import TemplatePathResolver
+from lsst.rucio.register.plan import RegistrationPlan
+from lsst.rucio.register.profiling import profile_options
+from lsst.rucio.register.query import iter_datasets, prefetch
+from lsst.rucio.register.rate_limiter import RateLimiter
+from lsst.rucio.register.rucio_interface import REGISTRATION_MODES, RucioInterface
 from lsst.rucio.register.rucio_register_config import RucioRegisterConfig
+from lsst.rucio.register.walker import DEFAULT_RAW_PATTERN, ButlerPathIndex, register_tree
 
 logger = logging.getLogger(__name__)
 _FORMAT = (
@@ -59,7 +75,7 @@ def chunks(refs, chunk_size):
         yield itertools.chain((start,), chunk)
 
 
-def _getRucioInterface(repo, rucio_register_config, rubin_butler_type):
+def _get_config(rucio_register_config):
     # default to using RUCIO_REGISTER_CONFIG env variable
     # if that's not set, try to use the command line
     # if neither are set, then raise an Exception
@@ -67,34 +83,212 @@ def _getRucioInterface(repo, rucio_register_config, rubin_butler_type):
     if config_file is None:
         raise RuntimeError(f"{RUCIO_REGISTER_CONFIG} {_MSG}")
 
-    config = RucioRegisterConfig(config_file)
+    return _load_config(os.path.abspath(config_file), os.stat(config_file).st_mtime_ns)
 
-    rucio_rse = config.rucio_rse
-    scope = config.scope
-    rse_root = config.rse_root
-    dtn_url = config.dtn_url
 
+@functools.cache
+def _load_config(config_file, mtime_ns):
+    # parse each configuration file once, unless it changes
+    return RucioRegisterConfig(config_file)
+
+
+def _getRucioInterface(repo, rucio_register_config, rubin_butler_type, metrics=None):
+    config = _get_config(rucio_register_config)
+
+    metrics = metrics if metrics is not None else Metrics()
+    # connect to the repository only when it is first used
     butler = None
     if repo:
-        butler = Butler(repo)
-
-    # create RucioInterface object used to register replicas into datasets
-    ri = RucioInterface(
-        butler=butler,
-        rucio_rse=rucio_rse,
-        scope=scope,
-        rse_root=rse_root,
-        dtn_url=dtn_url,
-        rubin_butler_type=rubin_butler_type,
-    )
+        butler = LazyButler(repo, metrics)
+
+    rate_limiter = None
+    if config.requests_per_sec or config.dids_per_sec:
+        rate_limiter = RateLimiter(
+            requests_per_sec=config.requests_per_sec,
+            dids_per_sec=config.dids_per_sec,
+            burst=config.rate_limit_burst,
+            lock_file=config.rate_limit_lock_file,
+            metrics=metrics,
+        )
+    content_index = None
+    if config.content_index:
+        content_index = ContentIndex(config.content_index, sha256=config.content_index_sha256)
+    hierarchy = DatasetHierarchy(rules=config.containers) if config.containers else None
+
+    # create a RucioInterface object used to register replicas into
+    # datasets for each RSE, sharing everything but the RSE
+    interfaces = [
+        RucioInterface(
+            butler=butler,
+            rucio_rse=profile.rucio_rse,
+            scope=profile.scope,
+            rse_root=profile.rse_root,
+            dtn_url=profile.dtn_url,
+            rubin_butler_type=rubin_butler_type,
+            metrics=metrics,
+            sidecar_encoding=config.sidecar_encoding,
+            hierarchy=hierarchy,
+            replication_rules=config.replication_rules,
+            rate_limiter=rate_limiter,
+            content_index=content_index,
+        )
+        for profile in config.rse_profiles
+    ]
+    if butler is not None and config.path_templates:
+        path_resolver = TemplatePathResolver(
+            butler,
+            config.path_template_root,
+            config.path_templates,
+            sample_rate=config.path_template_sample_rate,
+            metrics=metrics,
+        )
+        for interface in interfaces:
+            interface.path_resolver = path_resolver
+    ri = interfaces[0] if len(interfaces) == 1 else MultiRseInterface(interfaces)
     return ri, butler
 
 
-def _register(ri, dataset_refs, chunk_size, rucio_dataset):
-    # register dataset_refs with Rucio into the rucio dataset, in chunks
+def _interfaces(ri):
+    # the interface of each RSE
+    return ri.interfaces if isinstance(ri, MultiRseInterface) else [ri]
+
+
+def _scope_root(ri):
+    return f"{ri.rse_root.rstrip('/')}/{ri.scope}/"
+
+
+def _register(ri, dataset_refs, chunk_size, rucio_dataset, export=None, mode="all"):
+    # register dataset_refs with Rucio into the rucio dataset, in chunks,
+    # writing each chunk to the butler export, if there is one, from the
+    # locations found for registration
     for refs in chunks(dataset_refs, chunk_size):
-        cnt = ri.register_as_replicas(rucio_dataset, refs)
+        with ri.metrics.timer("register_chunk"):
+            refs, uris = ri.resolve_refs(refs)
+            cnt = ri.register_resolved_refs(rucio_dataset, refs, uris, mode) if refs else 0
+        if export is not None:
+            export.write(refs, uris)
+        ri.metrics.increment("files_registered", cnt)
         logger.debug("%d butler datasets registered", cnt)
+        ri.metrics.maybe_report()
+    ri.metrics.report()
+
+
+def _register_with_export(ri, dim_ri, dataset_refs, chunk_size, rucio_dataset, export_file, mode="all"):
+    # register dataset_refs and save them to a butler export file in the
+    # same pass, so the query runs only once, then register the export file
+    scope_roots = [_scope_root(interface) for interface in _interfaces(ri)]
+    if not any(os.path.abspath(export_file).startswith(scope_root) for scope_root in scope_roots):
+        raise RuntimeError(
+            f"export file {export_file} must be below {' or '.join(scope_roots)} to be registered"
+        )
+    logger.info("Writing butler export to %s", export_file)
+    with YamlExportStream(ri.butler, export_file) as export:
+        _register(ri, dataset_refs, chunk_size, rucio_dataset, export, mode)
+    _register_dims(dim_ri, [os.path.abspath(export_file)], chunk_size, rucio_dataset)
+
+
+def _register_refs(
+    ri, dataset_refs, chunk_size, rucio_dataset, export_file, rucio_register_config, mode="all"
+):
+    # register dataset_refs, along with a butler export of them if requested
+    if export_file is None:
+        _register(ri, dataset_refs, chunk_size, rucio_dataset, mode=mode)
+        _close_datasets(ri, rucio_register_config)
+        return
+    dim_ri = ri.with_data_type(DataType.DIM_FILE)
+    _register_with_export(ri, dim_ri, dataset_refs, chunk_size, rucio_dataset, export_file, mode)
+    _close_datasets(ri, rucio_register_config)
+
+
+def _close_datasets(ri, rucio_register_config):
+    # close the datasets files were attached to, if so configured
+    if _get_config(rucio_register_config).close_datasets:
+        cnt = ri.close_datasets()
+        logger.debug("%d rucio datasets closed", cnt)
+
+
+def _query_refs(butler, page_size, prefetch_depth, metrics, memory_budget=None, **query_kwargs):
+    # run the butler query on its own butler, so that it can page through
+    # the results on a background thread while earlier refs are registered;
+    # the results are streamed whenever that, or a memory budget, needs
+    # them before the query is finished
+    stream = prefetch_depth > 0 or memory_budget is not None
+    refs = _run_query(butler, prefetch_depth > 0, stream, **query_kwargs)
+    return prefetch(refs, page_size, prefetch_depth, metrics, memory_budget)
+
+
+def _run_query(butler, clone, stream, **query_kwargs):
+    # only connect to the repository, and query it, once the first ref is
+    # wanted, on the thread consuming the refs
+    query_butler = butler.clone() if clone else butler
+    if stream:
+        yield from _stream_refs(query_butler, **query_kwargs)
+    else:
+        # QueryDatasets lists all the results of each dataset type
+        query = QueryDatasets(butler=query_butler, **query_kwargs)
+        yield from itertools.chain.from_iterable(query.getDatasets())
+
+
+def _stream_refs(
+    butler, glob, collections, where, find_first, limit, order_by, with_dimension_records=False, **kwargs
+):
+    # query each dataset type in pages, rather than in one list per
+    # dataset type as QueryDatasets does
+    collections = list(collections) or ["*"]
+    if find_first and has_globs(collections):
+        raise InvalidQueryError("Can not use wildcards in collections when find_first=True")
+    # No dataset type needs more results than the whole query, but the
+    # limit, and its warning, apply to all of them together.
+    type_limit = abs(limit) + 1 if limit and limit < 0 else limit
+    refs = itertools.chain.from_iterable(
+        iter_datasets(
+            butler,
+            dataset_type.name,
+            collections,
+            find_first=find_first,
+            where=where,
+            with_dimension_records=with_dimension_records,
+            order_by=order_by,
+            limit=type_limit,
+        )
+        for dataset_type in butler.registry.queryDatasetTypes(list(glob) or ["*"])
+    )
+    return _limit_refs(refs, limit) if limit else refs
+
+
+def _limit_refs(refs, limit):
+    # yield at most abs(limit) refs, warning if a negative limit is hit,
+    # as QueryDatasets does
+    for count, ref in enumerate(itertools.islice(refs, abs(limit) + (limit < 0)), start=1):
+        if count > abs(limit):
+            logger.warning(
+                "Requested limit of %d hit for number of datasets returned. "
+                "Use --limit to increase this limit.",
+                abs(limit),
+            )
+            return
+        yield ref
+
+
+def _memory_budget(max_records, max_rss, page_size, prefetch_depth, chunk_size, metrics):
+    # return the memory budget, if any, and the page size that fits it
+    if max_records is None and max_rss is None:
+        return None, page_size
+    memory_budget = MemoryBudget(max_records, max_rss, metrics)
+    try:
+        return memory_budget, memory_budget.page_size(page_size, prefetch_depth, chunk_size)
+    except ValueError as e:
+        raise click.UsageError(str(e)) from None
+
+
+def _plan(ri, dataset_refs, rucio_register_config, rucio_dataset):
+    # resolve dataset_refs without reading files or contacting Rucio,
+    # and print what registering them would involve
+    config = _get_config(rucio_register_config)
+    plan = RegistrationPlan()
+    cnt = ri.plan_dataset_refs(plan, rucio_dataset, dataset_refs)
+    logger.debug("%d butler datasets planned", cnt)
+    print(plan.summary(config.hash_throughput, config.register_rate))
 
 
 def _register_zips(ri, zip_files, chunk_size, rucio_dataset):
@@ -102,7 +296,9 @@ def _register_zips(ri, zip_files, chunk_size, rucio_dataset):
     for zip_file in zip_files:
         rp = ResourcePath(zip_file)
         cnt = ri.register_zips(rucio_dataset, [rp])
+        ri.metrics.increment("files_registered", cnt)
         logger.debug("%d zips registered", cnt)
+    ri.metrics.report()
 
 
 def _register_dims(ri, dim_files, chunk_size, rucio_dataset):
@@ -110,7 +306,9 @@ def _register_dims(ri, dim_files, chunk_size, rucio_dataset):
     for dim_file in dim_files:
         rp = ResourcePath(dim_file)
         cnt = ri.register_dims(rucio_dataset, [rp])
+        ri.metrics.increment("files_registered", cnt)
         logger.debug("%d dimension files registered", cnt)
+    ri.metrics.report()
 
 
 def _set_log_level(log_level):
@@ -122,20 +320,109 @@ def _set_log_level(log_level):
     logging.basicConfig(level=logging_num_level, format=(_FORMAT), datefmt="%Y-%m-%d %H:%M:%S")
 
 
+def export_file_option(f):
+    """Add the option writing and registering a butler export file."""
+    return click.option(
+        "--export-file",
+        required=False,
+        type=str,
+        help="""
+             also write the registered datasets to this butler export YAML file, which must be
+             below the RSE root and scope, and register it as a dimension file in the same rucio dataset.
+             """,
+    )(f)
+
+
+def mode_option(f):
+    """Add the option selecting which registration steps are run."""
+    return click.option(
+        "--mode",
+        required=False,
+        type=click.Choice(REGISTRATION_MODES),
+        default="all",
+        help="""
+             all: add replicas and attach them to the rucio dataset; replicas: only add replicas;
+             attach: only attach files that are already registered, without reading them.
+             """,
+    )(f)
+
+
+def plan_option(f):
+    """Add the option selecting dry-run planning mode."""
+    return click.option(
+        "--plan",
+        is_flag=True,
+        default=False,
+        help="summarize the files, bytes and Rucio datasets involved, without registering anything",
+    )(f)
+
+
+def prefetch_options(f):
+    """Add the options controlling prefetching of Butler query results."""
+    f = click.option(
+        "--prefetch-depth",
+        required=False,
+        type=int,
+        default=4,
+        help="number of pages of query results to fetch ahead of registration; 0 to query inline",
+    )(f)
+    f = click.option(
+        "--page-size",
+        required=False,
+        type=int,
+        default=1000,
+        help="number of query results handed to registration at once",
+    )(f)
+    f = click.option(
+        "--max-records",
+        required=False,
+        type=int,
+        help="memory-bounded mode: maximum number of query results held at once",
+    )(f)
+    f = click.option(
+        "--max-rss",
+        required=False,
+        type=float,
+        help="memory-bounded mode: resident memory (MB) above which fetching query results pauses",
+    )(f)
+    return f
+
+
+def metrics_options(f):
+    """Add the options controlling progress and metrics reporting."""
+    f = click.option(
+        "--metrics-interval",
+        required=False,
+        type=float,
+        default=60.0,
+        help="seconds between JSON progress lines",
+    )(f)
+    f = click.option(
+        "--metrics-file",
+        required=False,
+        type=str,
+        help="Prometheus textfile to write metrics to at each progress report",
+    )(f)
+    return f
+
+
+def _make_metrics(metrics_interval, metrics_file):
+    return Metrics(progress_interval=metrics_interval, prometheus_file=metrics_file)
+
+
 @click.group(context_settings={"help_option_names": ["-h", "--help"]})
 def main():
     pass
 
 
 def _get_and_delete(kwargs, key):
-    x = kwargs.get(key, None)
-    if x is None:
-        return x
-    del kwargs[key]
-    return x
+    # remove the key even when its value is None, so that optional
+    # options that weren't given aren't passed on
+    return kwargs.pop(key, None)
 
 
 @main.command()
+@profile_options
 @click.option("--repo", required=True, type=str, help="butler repository")
 @click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
 @click.option("--rucio-register-config", required=False, type=str, help="registration configuration file")
@@ -146,6 +433,11 @@ def _get_and_delete(kwargs, key):
     default=30,
     help="number of replica requests to make at once",
 )
+@plan_option
+@export_file_option
+@mode_option
+@prefetch_options
+@metrics_options
 @log_level_option()
 @options_file_option()
 @query_datasets_options(repo=False, showUri=True, useArguments=False)
@@ -165,11 +457,24 @@ def data_products(**kwargs: Any) -> None:
     limit = kwargs.get("limit", None)
     order_by = kwargs.get("order_by", None)
     dataset_type = kwargs.get("dataset_type", None)
+    metrics = _make_metrics(kwargs.get("metrics_interval"), kwargs.get("metrics_file"))
 
-    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.DATA_PRODUCT)
+    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.DATA_PRODUCT, metrics)
 
-    query = QueryDatasets(
-        butler=butler,
+    memory_budget, page_size = _memory_budget(
+        kwargs.get("max_records"),
+        kwargs.get("max_rss"),
+        kwargs.get("page_size"),
+        kwargs.get("prefetch_depth"),
+        chunk_size,
+        metrics,
+    )
+    dataset_refs = _query_refs(
+        butler,
+        page_size,
+        kwargs.get("prefetch_depth"),
+        metrics,
+        memory_budget,
         glob=dataset_type,
         collections=collections,
         where=where,
@@ -180,12 +485,16 @@ def data_products(**kwargs: Any) -> None:
         with_dimension_records=True,
     )
 
-    dataset_refs = itertools.chain(*query.getDatasets())
-
-    _register(ri, dataset_refs, chunk_size, rucio_dataset)
+    if kwargs.get("plan"):
+        _plan(ri, dataset_refs, rucio_register_config, rucio_dataset)
+        return
+    export_file = kwargs.get("export_file")
+    mode = kwargs.get("mode")
+    _register_refs(ri, dataset_refs, chunk_size, rucio_dataset, export_file, rucio_register_config, mode)
 
 
 @main.command()
+@profile_options
 @click.option("--repo", required=True, type=str, help="butler repository")
 @click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
 @click.option("--rucio-register-config", required=False, type=str, help="registration configuration file")
@@ -204,6 +513,10 @@ def data_products(**kwargs: Any) -> None:
          filename of a list of butler dataset UUIDs to be register to the rucio dataset.
          """,
 )
+@plan_option
+@export_file_option
+@mode_option
+@metrics_options
 @log_level_option()
 @options_file_option()
 def dataset_list(**kwargs: Any) -> None:
@@ -217,8 +530,9 @@ def dataset_list(**kwargs: Any) -> None:
     uuidlist = kwargs.get("uuidlist", None)
 
     repo = kwargs.get("repo", None)
+    metrics = _make_metrics(kwargs.get("metrics_interval"), kwargs.get("metrics_file"))
 
-    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.DATA_PRODUCT)
+    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.DATA_PRODUCT, metrics)
 
     uuids = []
     with open(uuidlist) as f:
@@ -228,10 +542,16 @@ def dataset_list(**kwargs: Any) -> None:
 
     dataset_refs = butler.get_many_datasets(uuids)
 
-    _register(ri, dataset_refs, chunk_size, rucio_dataset)
+    if kwargs.get("plan"):
+        _plan(ri, dataset_refs, rucio_register_config, rucio_dataset)
+        return
+    export_file = kwargs.get("export_file")
+    mode = kwargs.get("mode")
+    _register_refs(ri, dataset_refs, chunk_size, rucio_dataset, export_file, rucio_register_config, mode)
 
 
 @main.command()
+@profile_options
 @click.option("--repo", required=True, type=str, help="butler repository")
 @click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
 @click.option(
@@ -244,6 +564,11 @@ def dataset_list(**kwargs: Any) -> None:
     default=30,
     help="number of replica requests to make at once",
 )
+@plan_option
+@export_file_option
+@mode_option
+@prefetch_options
+@metrics_options
 @log_level_option()
 @options_file_option()
 @query_datasets_options(repo=False, showUri=True)
@@ -255,18 +580,37 @@ def raws(**kwargs: Any) -> None:
     rucio_register_config = _get_and_delete(kwargs, "rucio_register_config")
     rucio_dataset = _get_and_delete(kwargs, "rucio_dataset")
     chunk_size = _get_and_delete(kwargs, "chunk_size")
+    metrics_interval = _get_and_delete(kwargs, "metrics_interval")
+    metrics_file = _get_and_delete(kwargs, "metrics_file")
+    metrics = _make_metrics(metrics_interval, metrics_file)
+    plan = _get_and_delete(kwargs, "plan")
+    export_file = _get_and_delete(kwargs, "export_file")
+    mode = _get_and_delete(kwargs, "mode")
+    page_size = _get_and_delete(kwargs, "page_size")
+    prefetch_depth = _get_and_delete(kwargs, "prefetch_depth")
+    memory_budget, page_size = _memory_budget(
+        _get_and_delete(kwargs, "max_records"),
+        _get_and_delete(kwargs, "max_rss"),
+        page_size,
+        prefetch_depth,
+        chunk_size,
+        metrics,
+    )
 
-    repo = kwargs["repo"]
+    repo = _get_and_delete(kwargs, "repo")
 
-    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.RAW_FILE)
+    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.RAW_FILE, metrics)
 
-    # chain is needed to flatten the list of lists returned by getDatasets()
-    dataset_refs = itertools.chain.from_iterable(QueryDatasets(**kwargs).getDatasets())
+    dataset_refs = _query_refs(butler, page_size, prefetch_depth, metrics, memory_budget, **kwargs)
 
-    _register(ri, dataset_refs, chunk_size, rucio_dataset)
+    if plan:
+        _plan(ri, dataset_refs, rucio_register_config, rucio_dataset)
+        return
+    _register_refs(ri, dataset_refs, chunk_size, rucio_dataset, export_file, rucio_register_config, mode)
 
 
 @main.command()
+@profile_options
 @click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
 @click.option(
     "--rucio-register-config", required=False, type=str, help="configuration file used for registration"
@@ -279,16 +623,22 @@ def raws(**kwargs: Any) -> None:
     help="number of replica requests to make at once",
 )
 @click.option("--zip-file", required=True, help="zip file to register")
+@metrics_options
 @log_level_option()
-def zips(rucio_dataset, rucio_register_config, chunk_size, zip_file, log_level):
+def zips(
+    rucio_dataset, rucio_register_config, chunk_size, zip_file, metrics_interval, metrics_file, log_level
+):
     _set_log_level(log_level)
 
-    ri, butler = _getRucioInterface(None, rucio_register_config, DataType.ZIP_FILE)
+    metrics = _make_metrics(metrics_interval, metrics_file)
+    ri, butler = _getRucioInterface(None, rucio_register_config, DataType.ZIP_FILE, metrics)
 
     _register_zips(ri, [zip_file], chunk_size, rucio_dataset)
+    _close_datasets(ri, rucio_register_config)
 
 
 @main.command()
+@profile_options
 @click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
 @click.option(
     "--rucio-register-config", required=False, type=str, help="configuration file used for registration"
@@ -301,10 +651,177 @@ def zips(rucio_dataset, rucio_register_config, chunk_size, zip_file, log_level):
     help="number of replica requests to make at once",
 )
 @click.option("--dimension-file", required=True, help="dimension file to register")
+@metrics_options
 @log_level_option()
-def dimensions(rucio_dataset, rucio_register_config, chunk_size, dimension_file, log_level):
+def dimensions(
+    rucio_dataset,
+    rucio_register_config,
+    chunk_size,
+    dimension_file,
+    metrics_interval,
+    metrics_file,
+    log_level,
+):
     _set_log_level(log_level)
 
-    ri, butler = _getRucioInterface(None, rucio_register_config, DataType.DIM_FILE)
+    metrics = _make_metrics(metrics_interval, metrics_file)
+    ri, butler = _getRucioInterface(None, rucio_register_config, DataType.DIM_FILE, metrics)
 
     _register_dims(ri, [dimension_file], chunk_size, rucio_dataset)
+    _close_datasets(ri, rucio_register_config)
+
+
+@main.command()
+@profile_options
+@click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
+@click.option(
+    "--rucio-register-config", required=False, type=str, help="configuration file used for registration"
+)
+@click.option(
+    "--chunk-size",
+    required=False,
+    type=int,
+    default=1000,
+    help="number of manifest rows to read and register at once",
+)
+@click.option(
+    "--manifest",
+    "manifest_path",
+    required=True,
+    type=str,
+    help="Parquet or CSV manifest, or directory of them, with path, size and adler32 columns",
+)
+@click.option(
+    "--format",
+    "manifest_format",
+    required=False,
+    type=click.Choice(["parquet", "csv"]),
+    help="manifest format (default: from the file extension)",
+)
+@click.option(
+    "--verify-checksums",
+    is_flag=True,
+    default=False,
+    help="recompute sizes and checksums, skipping files that do not match the manifest",
+)
+@click.option(
+    "--rubin-butler-type",
+    required=False,
+    type=click.Choice([DataType.DATA_PRODUCT, DataType.RAW_FILE, DataType.ZIP_FILE, DataType.DIM_FILE]),
+    default=DataType.DATA_PRODUCT,
+    help="type registered in the rubin_butler metadata of the files",
+)
+@metrics_options
+@log_level_option()
+def manifest(
+    rucio_dataset,
+    rucio_register_config,
+    chunk_size,
+    manifest_path,
+    manifest_format,
+    verify_checksums,
+    rubin_butler_type,
+    metrics_interval,
+    metrics_file,
+    log_level,
+):
+    """Register the files listed in a manifest, without using a Butler."""
+    _set_log_level(log_level)
+
+    metrics = _make_metrics(metrics_interval, metrics_file)
+    ri, _ = _getRucioInterface(None, rucio_register_config, rubin_butler_type, metrics)
+
+    cnt = register_manifest(ri, manifest_path, rucio_dataset, chunk_size, verify_checksums, manifest_format)
+    logger.debug("%d manifest files registered", cnt)
+    mismatches = metrics.snapshot()["counters"].get("checksum_mismatches", 0)
+    if mismatches:
+        raise click.ClickException(f"{mismatches} file(s) did not match the manifest and were not registered")
+    _close_datasets(ri, rucio_register_config)
+
+
+@main.command()
+@profile_options
+@click.option("--rucio-dataset", required=True, type=str, help="rucio dataset to register files to")
+@click.option(
+    "--rucio-register-config", required=False, type=str, help="configuration file used for registration"
+)
+@click.option(
+    "--chunk-size",
+    required=False,
+    type=int,
+    default=1000,
+    help="number of files to hash and register at once",
+)
+@click.option(
+    "--path",
+    "subdir",
+    required=False,
+    type=str,
+    help="directory below the RSE root and scope to register (default: the whole scope)",
+)
+@click.option("--jobs", required=False, type=int, default=8, help="threads scanning directories and hashing")
+@click.option(
+    "--exclude",
+    required=False,
+    multiple=True,
+    help="glob pattern, relative to the scanned directory, of files and directories to skip",
+)
+@click.option(
+    "--raw-pattern",
+    required=False,
+    type=str,
+    default=DEFAULT_RAW_PATTERN,
+    help="regular expression recognizing raw files by their path below the scope",
+)
+@click.option("--repo", required=False, type=str, help="butler repository to find sidecar metadata in")
+@click.option(
+    "--collections",
+    required=False,
+    multiple=True,
+    help="collections searched for sidecar metadata; required with --repo",
+)
+@metrics_options
+@log_level_option()
+def walk(
+    rucio_dataset,
+    rucio_register_config,
+    chunk_size,
+    subdir,
+    jobs,
+    exclude,
+    raw_pattern,
+    repo,
+    collections,
+    metrics_interval,
+    metrics_file,
+    log_level,
+):
+    """Register every file found below the root and scope of each RSE."""
+    _set_log_level(log_level)
+
+    if repo and not collections:
+        raise click.UsageError("--collections is required with --repo")
+
+    metrics = _make_metrics(metrics_interval, metrics_file)
+    ri, butler = _getRucioInterface(repo, rucio_register_config, DataType.DATA_PRODUCT, metrics)
+
+    path_index = ButlerPathIndex(butler, list(collections)) if butler is not None else None
+
+    counts: dict[str, int] = {}
+    try:
+        # walk the scope of each RSE, registering its files there
+        for interface in _interfaces(ri):
+            top = os.path.join(interface.rse_root, interface.scope)
+            if subdir:
+                top = os.path.join(top, subdir)
+            rse_counts = register_tree(
+                interface, top, rucio_dataset, chunk_size, jobs, exclude, raw_pattern, path_index
+            )
+            for data_type, cnt in rse_counts.items():
+                counts[data_type] = counts.get(data_type, 0) + cnt
+    finally:
+        if path_index is not None:
+            path_index.close()
+    _close_datasets(ri, rucio_register_config)
+    for data_type, cnt in sorted(counts.items()):
+        logger.info("%d %s files registered", cnt, data_type)
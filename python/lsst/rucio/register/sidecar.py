@@ -0,0 +1,180 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Compact encodings of the ``rubin_sidecar`` metadata.
+
+A sidecar is normally the JSON serialization of a Butler ``DatasetRef``.
+Encoded sidecars are compressed, base64 encoded, and prefixed with the
+name of the encoding and a colon, so that `decode_sidecar` can recognize
+them; plain JSON is left as is.
+"""
+
+import base64
+import json
+import zlib
+
+from lsst.daf.butler import DatasetRef, DatasetType
+
+__all__ = ["SIDECAR_ENCODINGS", "SidecarBuilder", "decode_sidecar", "encode_sidecar"]
+
+SIDECAR_ENCODINGS = ["json", "zlib", "zstd"]
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("The zstd sidecar encoding requires the zstandard package") from None
+    return zstandard
+
+
+def encode_sidecar(sidecar: str, encoding: str = "json") -> str:
+    """Encode a sidecar for storage in Rucio metadata.
+
+    Parameters
+    ----------
+    sidecar : `str`
+        Sidecar, normally the JSON serialization of a ``DatasetRef``.
+    encoding : `str`, optional
+        One of `SIDECAR_ENCODINGS`: ``json`` leaves the sidecar as is,
+        ``zlib`` and ``zstd`` compress it.
+
+    Returns
+    -------
+    encoded : `str`
+        Encoded sidecar. Empty sidecars are never encoded.
+
+    Raises
+    ------
+    ValueError
+        Raised if the encoding is unknown, or its compressor is not
+        installed.
+    """
+    if encoding not in SIDECAR_ENCODINGS:
+        raise ValueError(f"Unknown sidecar encoding {encoding!r}; expected one of {SIDECAR_ENCODINGS}")
+    if encoding == "json" or not sidecar:
+        return sidecar
+    data = sidecar.encode()
+    if encoding == "zlib":
+        compressed = zlib.compress(data, 9)
+    else:
+        compressed = _zstd().ZstdCompressor(level=19).compress(data)
+    return f"{encoding}:{base64.b64encode(compressed).decode('ascii')}"
+
+
+def decode_sidecar(encoded: str | None) -> str:
+    """Decode a sidecar read from Rucio metadata.
+
+    Parameters
+    ----------
+    encoded : `str` or `None`
+        Sidecar as stored, in any of `SIDECAR_ENCODINGS`.
+
+    Returns
+    -------
+    sidecar : `str`
+        Sidecar as originally given to `encode_sidecar`.
+    """
+    if not encoded:
+        return ""
+    encoding, sep, payload = encoded.partition(":")
+    if not sep or encoding not in ("zlib", "zstd"):
+        return encoded
+    data = base64.b64decode(payload)
+    if encoding == "zlib":
+        return zlib.decompress(data).decode()
+    return _zstd().ZstdDecompressor().decompress(data).decode()
+
+
+class SidecarBuilder:
+    """Serialize DatasetRefs with their dimension records, serializing each
+    distinct dimension record only once.
+
+    The refs of a chunk typically share most of their dimension records,
+    such as the instrument, visit and physical filter of all the detectors
+    of a visit. Each record, and each dataset type, is serialized the
+    first time it is seen and the JSON is reused for later refs.
+
+    Parameters
+    ----------
+    max_records : `int`, optional
+        Number of serialized records kept; the table is cleared when it
+        grows beyond this.
+
+    Notes
+    -----
+    The JSON produced is identical to ``DatasetRef.to_json()``.
+    """
+
+    _FLAGS = dict(exclude_defaults=True, exclude_unset=True)
+
+    def __init__(self, max_records: int = 100_000):
+        self.max_records = max_records
+        self._records: dict[tuple, str] = {}
+        self._dataset_types: dict[DatasetType, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _record_json(self, element: str, record) -> str:
+        key = (element, record.dataId)
+        fragment = self._records.get(key)
+        if fragment is not None:
+            self.hits += 1
+            return fragment
+        self.misses += 1
+        if len(self._records) >= self.max_records:
+            self._records.clear()
+        fragment = f"{json.dumps(element)}:{record.to_simple().model_dump_json(**self._FLAGS)}"
+        self._records[key] = fragment
+        return fragment
+
+    def to_json(self, ref: DatasetRef) -> str:
+        """Serialize a DatasetRef, including its dimension records.
+
+        Parameters
+        ----------
+        ref : `lsst.daf.butler.DatasetRef`
+            Dataset to serialize.
+
+        Returns
+        -------
+        json : `str`
+            Serialized ref, as returned by ``ref.to_json()``.
+        """
+        data_id = ref.dataId
+        if not data_id.hasRecords():
+            return ref.to_json()
+        records = [
+            self._record_json(element, record)
+            for element in data_id.dimensions.elements
+            if (record := data_id.records[element]) is not None
+        ]
+        dataset_type = self._dataset_types.get(ref.datasetType)
+        if dataset_type is None:
+            dataset_type = ref.datasetType.to_simple().model_dump_json(**self._FLAGS)
+            self._dataset_types[ref.datasetType] = dataset_type
+        # Same field order and compact separators as pydantic uses.
+        mapping = json.dumps(dict(data_id.mapping), separators=(",", ":"), ensure_ascii=False)
+        return (
+            f'{{"id":"{ref.id}","datasetType":{dataset_type},'
+            f'"dataId":{{"dataId":{mapping},"records":{{{",".join(records)}}}}},'
+            f'"run":{json.dumps(ref.run, ensure_ascii=False)}}}'
+        )
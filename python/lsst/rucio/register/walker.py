@@ -0,0 +1,319 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Registration of every file found below the RSE root and scope, for
+recovering Rucio's view of an RSE without going through Butler queries.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import sqlite3
+import uuid
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lsst.daf.butler import Butler, DatasetRef
+from lsst.resources import ResourcePath
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.query import batched, iter_datasets
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+__all__ = ["DEFAULT_RAW_PATTERN", "ButlerPathIndex", "classify", "register_tree", "scan_tree"]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RAW_PATTERN = r"(^|/)raw/"
+
+_SIDECAR_TYPES = {DataType.RAW_FILE, DataType.DATA_PRODUCT}
+
+
+def scan_tree(top: str, jobs: int = 8, exclude: Iterable[str] = ()) -> Iterator[tuple[str, int]]:
+    """Find every regular file below a directory, scanning directories in
+    parallel.
+
+    Parameters
+    ----------
+    top : `str`
+        Directory to scan.
+    jobs : `int`, optional
+        Number of directories scanned at once.
+    exclude : `~collections.abc.Iterable` [`str`], optional
+        Glob patterns, matched against paths relative to ``top``, of files
+        and directories to skip.
+
+    Yields
+    ------
+    path : `str`
+        Path of a file.
+    size : `int`
+        Size of the file in bytes.
+
+    Notes
+    -----
+    At most ``jobs`` directories are scanned at once, and their files are
+    handed over before any more are scanned, so the files found but not
+    yet consumed stay bounded however large the tree.
+    """
+    top = top.rstrip("/")
+    exclude = list(exclude)
+
+    def excluded(path: str) -> bool:
+        relative = path.removeprefix(top + "/")
+        return any(fnmatch.fnmatch(relative, pattern) for pattern in exclude)
+
+    def scan(directory: str) -> tuple[list[tuple[str, int]], list[str]]:
+        files, directories = [], []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if exclude and excluded(entry.path):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append((entry.path, entry.stat(follow_symlinks=False).st_size))
+        except OSError as e:
+            logger.warning("Can not scan %s: %s", directory, e)
+        return files, directories
+
+    waiting = deque([top])
+    with ThreadPoolExecutor(jobs) as pool:
+        pending: set = set()
+        while waiting or pending:
+            while waiting and len(pending) < jobs:
+                pending.add(pool.submit(scan, waiting.popleft()))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, directories = future.result()
+                waiting.extend(directories)
+                yield from files
+
+
+def classify(path: str, raw_pattern: re.Pattern | None = None, butler_dataset: bool = False) -> str:
+    """Return the `DataType` of a file, judged from its name and whether it
+    holds a Butler dataset.
+
+    Parameters
+    ----------
+    path : `str`
+        Path of the file, relative to the scope directory.
+    raw_pattern : `re.Pattern`, optional
+        Pattern searched for in ``path`` to recognize raw files; defaults
+        to `DEFAULT_RAW_PATTERN`.
+    butler_dataset : `bool`, optional
+        Whether the file is known to hold a Butler dataset.
+
+    Returns
+    -------
+    data_type : `str`
+        ``ZIP_FILE`` for zip files, ``RAW_FILE`` for paths matching
+        ``raw_pattern``, and ``DATA_PRODUCT`` for other Butler datasets.
+        Other YAML files are ``DIM_FILE`` and anything else
+        ``DATA_PRODUCT``.
+    """
+    if path.endswith(".zip"):
+        return DataType.ZIP_FILE
+    if not butler_dataset and path.endswith((".yaml", ".yml")):
+        return DataType.DIM_FILE
+    if (raw_pattern or re.compile(DEFAULT_RAW_PATTERN)).search(path):
+        return DataType.RAW_FILE
+    return DataType.DATA_PRODUCT
+
+
+class ButlerPathIndex:
+    """Lookup of the Butler datasets stored in files, by path.
+
+    The first lookup records the path and dataset ID of every dataset in
+    the collections in a temporary on-disk SQLite database, with one query
+    per dataset type and bulk URI lookups; no refs are kept. Each lookup
+    then queries the refs, with their dimension records, of only the
+    datasets in the files asked for.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler holding the datasets.
+    collections : `list` [`str`]
+        Collections to search.
+    dataset_types : `str`, optional
+        Glob selecting the dataset types to index.
+    batch_size : `int`, optional
+        Number of datasets whose URIs are looked up at once.
+    """
+
+    def __init__(
+        self, butler: Butler, collections: list[str], dataset_types: str = "*", batch_size: int = 10000
+    ):
+        self.butler = butler
+        self.collections = collections
+        self.dataset_types = dataset_types
+        self.batch_size = batch_size
+        self._db: sqlite3.Connection | None = None
+
+    def close(self) -> None:
+        """Delete the index."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _build(self) -> sqlite3.Connection:
+        # An empty name is a temporary database, deleted once closed.
+        db = sqlite3.connect("")
+        db.execute("CREATE TABLE paths (path TEXT PRIMARY KEY, dataset_type TEXT, dataset_id TEXT)")
+        count = 0
+        for dataset_type in self.butler.registry.queryDatasetTypes(self.dataset_types):
+            refs = iter_datasets(self.butler, dataset_type.name, self.collections, find_first=False)
+            for batch in batched(refs, self.batch_size):
+                rows = [
+                    (uris.primaryURI.unquoted_path, dataset_type.name, str(ref.id))
+                    for ref, uris in self.butler.get_many_uris(batch).items()
+                    if uris.primaryURI is not None
+                ]
+                db.executemany("INSERT OR IGNORE INTO paths VALUES (?, ?, ?)", rows)
+                count += len(rows)
+        db.commit()
+        logger.info("Indexed %d Butler datasets by path", count)
+        return db
+
+    def lookup(self, paths: list[str]) -> dict[str, DatasetRef]:
+        """Return the datasets stored in some files.
+
+        Parameters
+        ----------
+        paths : `list` [`str`]
+            Paths of the files.
+
+        Returns
+        -------
+        refs : `dict` [`str`, `lsst.daf.butler.DatasetRef`]
+            Dataset, with its dimension records, stored in each file that
+            holds one.
+        """
+        if self._db is None:
+            self._db = self._build()
+        by_type: dict[str, dict[str, str]] = {}
+        for batch in batched(paths, 500):
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT path, dataset_type, dataset_id FROM paths WHERE path IN ({placeholders})", batch
+            )
+            for path, dataset_type, dataset_id in rows:
+                by_type.setdefault(dataset_type, {})[dataset_id] = path
+        refs = {}
+        for dataset_type, ids in by_type.items():
+            for ref in iter_datasets(
+                self.butler,
+                dataset_type,
+                self.collections,
+                find_first=False,
+                where=f"{dataset_type}.dataset_id IN (ids)",
+                bind={"ids": [uuid.UUID(dataset_id) for dataset_id in ids]},
+                with_dimension_records=True,
+            ):
+                refs[ids[str(ref.id)]] = ref
+        return refs
+
+
+def register_tree(
+    ri: RucioInterface,
+    top: str,
+    rucio_dataset: str,
+    chunk_size: int,
+    jobs: int = 8,
+    exclude: Iterable[str] = (),
+    raw_pattern: str = DEFAULT_RAW_PATTERN,
+    path_index: ButlerPathIndex | None = None,
+) -> dict[str, int]:
+    """Register every file below a directory to a Rucio dataset.
+
+    Parameters
+    ----------
+    ri : `RucioInterface`
+        Interface to register with.
+    top : `str`
+        Directory to register, below the RSE root and scope.
+    rucio_dataset : `str`
+        Rucio dataset to attach the files to.
+    chunk_size : `int`
+        Number of files hashed and registered at once.
+    jobs : `int`, optional
+        Number of threads scanning directories, and hashing files.
+    exclude : `~collections.abc.Iterable` [`str`], optional
+        Glob patterns, relative to ``top``, of files and directories to
+        skip.
+    raw_pattern : `str`, optional
+        Regular expression searched for in paths relative to the scope
+        directory to recognize raw files.
+    path_index : `ButlerPathIndex`, optional
+        Index used to find the Butler dataset of each file but zip files,
+        whose serialized ref is registered as sidecar metadata. YAML files
+        that hold no dataset are dimension files. Without it, no sidecars
+        are registered and all YAML files are dimension files.
+
+    Returns
+    -------
+    counts : `dict` [`str`, `int`]
+        Number of files registered of each `DataType`.
+    """
+    pattern = re.compile(raw_pattern)
+    scope_root = f"{ri.rse_root.rstrip('/')}/{ri.scope}/"
+    counts: dict[str, int] = {}
+    with ThreadPoolExecutor(jobs) as pool:
+        for chunk in batched(scan_tree(top, jobs, exclude), chunk_size):
+            # Only the datasets of this chunk's files are looked up, and
+            # released once it is registered.
+            refs = {}
+            if path_index is not None:
+                refs = path_index.lookup([path for path, _ in chunk if not path.endswith(".zip")])
+            by_type: dict[str, list[str]] = {}
+            for path, _ in chunk:
+                data_type = classify(path.removeprefix(scope_root), pattern, path in refs)
+                by_type.setdefault(data_type, []).append(path)
+            for data_type, paths in sorted(by_type.items()):
+                hashes = list(pool.map(lambda path: ri.compute_hashes(ResourcePath(path)), paths))
+                sidecars = None
+                if path_index is not None and data_type in _SIDECAR_TYPES:
+                    sidecars = []
+                    for path in paths:
+                        ref = refs.get(path)
+                        if ref is None:
+                            ri.metrics.increment("sidecars_missing")
+                            logger.debug("no Butler dataset found for %s", path)
+                        sidecars.append(
+                            ri.encode_sidecar(ri.sidecar_builder.to_json(ref)) if ref is not None else ""
+                        )
+                dids = ri.make_dids(
+                    paths,
+                    [size for size, _ in hashes],
+                    [adler32 for _, adler32 in hashes],
+                    sidecars,
+                    rubin_butler_type=data_type,
+                )
+                with ri.metrics.timer("register_chunk"):
+                    cnt = ri.register_dids(rucio_dataset, dids)
+                ri.metrics.increment("files_registered", cnt)
+                counts[data_type] = counts.get(data_type, 0) + cnt
+            ri.metrics.maybe_report()
+    ri.metrics.report()
+    return counts
@@ -0,0 +1,121 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import (
+    STAGES,
+    LatencyDIDClient,
+    LatencyReplicaClient,
+    StageResult,
+    compare_to_baseline,
+    main,
+    make_synthetic_repo,
+    run_benchmark,
+)
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def testRunBenchmark(self):
+        butler = make_synthetic_repo(self.root, "bench", 5, 1000)
+        rc = LatencyReplicaClient()
+        dc = LatencyDIDClient()
+        ri = RucioInterface(
+            butler, "BENCH", "bench", self.root, "root://bench:1094//rucio", DataType.DATA_PRODUCT, rc, dc
+        )
+        results = run_benchmark(ri, butler, "bench_dataset", 2)
+
+        self.assertEqual(list(results), STAGES)
+        for result in results.values():
+            self.assertEqual(result.files, 5)
+        self.assertEqual(results["hashing"].bytes, 5000)
+        self.assertEqual(rc.replicas, 5)
+        self.assertEqual(rc.requests, 3)
+        self.assertEqual(dc.attached, 5)
+
+    def testHashesReused(self):
+        butler = make_synthetic_repo(self.root, "bench", 5, 100)
+        ri = RucioInterface(
+            butler,
+            "BENCH",
+            "bench",
+            self.root,
+            "root://bench:1094//rucio",
+            DataType.DATA_PRODUCT,
+            LatencyReplicaClient(),
+            LatencyDIDClient(),
+        )
+        compute_hashes = RucioInterface.compute_hashes
+        with patch.object(
+            RucioInterface, "compute_hashes", autospec=True, side_effect=compute_hashes
+        ) as mock:
+            run_benchmark(ri, butler, "bench_dataset", 2)
+        # files are hashed once, in the hashing stage, and the interface
+        # is left as it was
+        self.assertEqual(mock.call_count, 5)
+        self.assertNotIn("compute_hashes", vars(ri))
+
+    def testFakeServer(self):
+        result = CliRunner().invoke(
+            main,
+            [
+                "--num-files",
+                "5",
+                "--file-size",
+                "100",
+                "--latency",
+                "0",
+                "--workdir",
+                self.root,
+                "--fake-server",
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("'POST /replicas': 1", result.output)
+
+    def testCompareToBaseline(self):
+        results = {"hashing": StageResult(seconds=2.0, files=100, bytes=0)}
+        baseline = {"hashing": {"seconds": 1.0, "files": 100, "bytes": 0}}
+        self.assertEqual(len(compare_to_baseline(results, baseline, 0.2)), 1)
+        self.assertEqual(len(compare_to_baseline(results, baseline, 0.6)), 0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
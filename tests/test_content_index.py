@@ -0,0 +1,205 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import PropertyMock, patch
+
+from rucio.client.didclient import DIDClient
+from rucio.client.replicaclient import ReplicaClient
+
+import lsst.utils.tests
+from lsst.resources import ResourcePath
+from lsst.resources.file import FileResourcePath
+from lsst.rucio.register.content_index import ContentIndex
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.fake_rucio import FakeRucioServer
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+
+class ContentIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.index_file = os.path.join(self.root, "index.sqlite3")
+
+    def testChecksums(self):
+        index = ContentIndex(self.index_file)
+        self.addCleanup(index.close)
+        index.add_checksums("/a.zip", 10, 1000, "00000001")
+        self.assertEqual(index.checksums("/a.zip", 10, 1000), ("00000001", None))
+        # a file that changed since is not known
+        self.assertIsNone(index.checksums("/a.zip", 10, 2000))
+        self.assertIsNone(index.checksums("/a.zip", 11, 1000))
+
+    def testFind(self):
+        index = ContentIndex(self.index_file)
+        index.add([(10, "00000001", "ab", "test", "a.zip"), (10, "00000001", "ab", "other", "a.zip")])
+        index.add([(10, "00000001", "ab", "test", "b.zip"), (10, "00000001", "ab", "test", "a.zip")])
+        index.close()
+        # the index persists, and finds the first DID registered
+        index = ContentIndex(self.index_file)
+        self.addCleanup(index.close)
+        self.assertEqual(index.find(10, "00000001", "ab"), ("test", "a.zip"))
+        # matching checksums are not enough
+        self.assertIsNone(index.find(10, "00000001", "cd"))
+        self.assertIsNone(index.find(11, "00000001", "ab"))
+
+
+class DeduplicationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.server = FakeRucioServer(rses=["DRR1"]).start()
+        self.addCleanup(self.server.stop)
+        self.index = ContentIndex(os.path.join(self.root, "index.sqlite3"))
+        self.addCleanup(self.index.close)
+
+    def makeInterface(self, scope="test"):
+        client_kwargs = self.server.client_kwargs()
+        return RucioInterface(
+            None,
+            "DRR1",
+            scope,
+            self.root,
+            "root://xrd1:1094//rucio",
+            DataType.ZIP_FILE,
+            replica_client=ReplicaClient(**client_kwargs),
+            did_client=DIDClient(**client_kwargs),
+            content_index=self.index,
+        )
+
+    def makeFile(self, path, content):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return ResourcePath(path)
+
+    def testDuplicates(self):
+        ri = self.makeInterface()
+        files = [
+            self.makeFile("test/run1/a.zip", b"a" * 100),
+            self.makeFile("test/run1/b.zip", b"b" * 100),
+            self.makeFile("test/run2/a.zip", b"a" * 100),
+        ]
+        self.assertEqual(ri.register_zips("run1", files), 3)
+        # the identical file is attached, without a replica of its own
+        self.assertEqual(len(self.server.files), 2)
+        self.assertEqual(
+            sorted(self.server.dids[("test", "run1")]["children"]),
+            [("test", "run1/a.zip"), ("test", "run1/b.zip")],
+        )
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["duplicate_files"], counters["bytes_hashed"]), (1, 300))
+
+        # a later run hashes nothing, and registers no replicas
+        ri = self.makeInterface()
+        self.assertEqual(ri.register_zips("run2", files[1:]), 2)
+        self.assertEqual(self.server.requests["POST /replicas"], 1)
+        self.assertEqual(
+            sorted(self.server.dids[("test", "run2")]["children"]),
+            [("test", "run1/a.zip"), ("test", "run1/b.zip")],
+        )
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual(counters["content_index_checksum_hits"], 2)
+        self.assertNotIn("bytes_hashed", counters)
+
+    def testOtherScope(self):
+        self.makeInterface().register_zips("run1", [self.makeFile("test/a.zip", b"a" * 100)])
+        ri = self.makeInterface("other")
+        ri.register_dims(
+            "dims", [self.makeFile("other/a.zip", b"a" * 100), self.makeFile("other/b.zip", b"b")]
+        )
+        self.assertEqual(
+            sorted(self.server.dids[("other", "dims")]["children"]), [("other", "b.zip"), ("test", "a.zip")]
+        )
+
+    def testAdler32Collision(self):
+        ri = self.makeInterface()
+        files = [
+            self.makeFile("test/a.yaml", b"\x01\x00\x00\x01"),
+            self.makeFile("test/b.yaml", b"\x00\x01\x01\x00"),
+        ]
+        self.assertEqual(ri.compute_hashes(files[0]), ri.compute_hashes(files[1]))
+        # both files are registered, as their contents differ
+        self.assertEqual(ri.register_dims("dims", files), 2)
+        self.assertEqual(len(self.server.files), 2)
+        self.assertNotIn("duplicate_files", ri.metrics.snapshot()["counters"])
+
+    def testRemoteHashedOnce(self):
+        ri = self.makeInterface()
+        files = [self.makeFile(f"test/{name}.zip", b"a" * 100) for name in "abc"]
+        with patch.object(FileResourcePath, "isLocal", new_callable=PropertyMock, return_value=False):
+            self.assertEqual(ri.register_zips("run1", files), 3)
+        # no checksums are cached, but each file is read once
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["duplicate_files"], counters["bytes_hashed"]), (2, 300))
+
+    def testWithoutSha256(self):
+        index = ContentIndex(os.path.join(self.root, "adler32.sqlite3"), sha256=False)
+        self.addCleanup(index.close)
+        ri = self.makeInterface()
+        ri.content_index = index
+        files = [self.makeFile("test/a.zip", b"a" * 100), self.makeFile("test/b.zip", b"a" * 100)]
+        # identical files are registered, but their checksums are cached
+        self.assertEqual(ri.register_zips("run1", files), 2)
+        self.assertEqual(len(self.server.files), 2)
+        self.assertEqual(index.checksums(files[0].ospath, 100, os.stat(files[0].ospath).st_mtime_ns)[1], None)
+
+    def testSha256OnlyToDeduplicate(self):
+        ri = self.makeInterface()
+        path = self.makeFile("test/a.fits", b"a" * 100)
+        mtime_ns = os.stat(path.ospath).st_mtime_ns
+        # checksums for registration alone need no SHA-256 digest
+        self.assertEqual(ri.compute_hashes(path), ri.compute_hashes(path))
+        self.assertIsNone(self.index.checksums(path.ospath, 100, mtime_ns)[1])
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["content_index_checksum_hits"], counters["bytes_hashed"]), (1, 100))
+        # deduplicating reads the file again for it, once
+        key = ri._content_key(path)
+        self.assertEqual(ri._content_key(path), key)
+        self.assertEqual(self.index.checksums(path.ospath, 100, mtime_ns), key[1:])
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["content_index_checksum_hits"], counters["bytes_hashed"]), (2, 200))
+
+    def testChangedFile(self):
+        ri = self.makeInterface()
+        path = self.makeFile("test/a.zip", b"a" * 100)
+        self.assertEqual(ri.compute_hashes(path), ri.compute_hashes(path))
+        stat = os.stat(path.ospath)
+        self.makeFile("test/a.zip", b"c" * 100)
+        os.utime(path.ospath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        # the new content is hashed again
+        self.assertEqual(ri.compute_hashes(path), (100, ri._compute_adler32(path)))
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["content_index_checksum_hits"], counters["bytes_hashed"]), (1, 300))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
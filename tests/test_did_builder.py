@@ -0,0 +1,94 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+import pyarrow as pa
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.did_builder import make_file_dids
+from lsst.rucio.register.rubin_meta import RubinMeta
+from lsst.rucio.register.rucio_did import RucioDID
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+_KWARGS = dict(scope="test", rse_root="/rse", pfn_base="root://xrd1:1094//rucio", rubin_butler_type="raw")
+
+
+class DIDBuilderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.paths = [f"/rse/test/a/file_{i}.fits" for i in range(3)]
+        self.sizes = [10, 20, 30]
+        self.adler32s = ["00000001", "00000002", "00000003"]
+
+    def testMatchesModel(self):
+        dids = make_file_dids(self.paths, self.sizes, self.adler32s, sidecars=["x", None, ""], **_KWARGS)
+        expected = RucioDID(
+            pfn="root://xrd1:1094//rucio/test/a/file_0.fits",
+            bytes=10,
+            adler32="00000001",
+            name="a/file_0.fits",
+            scope="test",
+            meta=RubinMeta(rubin_butler="raw", rubin_sidecar="x"),
+        )
+        self.assertEqual(dids[0], expected.model_dump())
+        self.assertEqual([did["meta"]["rubin_sidecar"] for did in dids], ["x", "", ""])
+
+    def testColumns(self):
+        expected = make_file_dids(self.paths, self.sizes, self.adler32s, **_KWARGS)
+        table = pa.table({"path": self.paths, "size": self.sizes, "adler32": self.adler32s})
+        dids = make_file_dids(table["path"], table["size"], table["adler32"], **_KWARGS)
+        self.assertEqual(dids, expected)
+        dids = make_file_dids(np.array(self.paths), np.array(self.sizes), np.array(self.adler32s), **_KWARGS)
+        self.assertEqual(dids, expected)
+
+    def testLengthMismatch(self):
+        with self.assertRaises(ValueError):
+            make_file_dids(self.paths, self.sizes[:2], self.adler32s, **_KWARGS)
+
+    def testInterface(self):
+        ri = RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            "/rse",
+            "root://xrd1:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=LatencyReplicaClient(),
+            did_client=LatencyDIDClient(),
+        )
+        dids = ri.make_dids(self.paths, self.sizes, self.adler32s, rubin_butler_type=DataType.ZIP_FILE)
+        self.assertEqual({did["meta"]["rubin_butler"] for did in dids}, {DataType.ZIP_FILE})
+        self.assertEqual(ri.register_dids("mydataset", dids), 3)
+        self.assertEqual(ri.replica_client.replicas, 3)
+        self.assertEqual(ri.did_client.attached, 3)
+        self.assertEqual(ri.register_dids("mydataset", []), 0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,275 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import astropy.time
+import yaml
+from click.testing import CliRunner
+
+import lsst.utils.tests
+from lsst.daf.butler import Butler, CollectionType, DatasetRef, DatasetType, FileDataset
+from lsst.rucio.register.benchmark import make_synthetic_repo
+from lsst.rucio.register.export import YamlExportStream, import_main, main, read_jsonl_export
+from lsst.rucio.register.query import iter_datasets
+
+
+class _Loader(yaml.SafeLoader):
+    pass
+
+
+_Loader.add_constructor("!uuid", lambda loader, node: loader.construct_scalar(node))
+
+
+def _datasets(filename):
+    with open(filename) as f:
+        export = yaml.load(f, Loader=_Loader)
+    return [record for item in export["data"] if item["type"] == "dataset" for record in item["records"]]
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.butler = make_synthetic_repo(self.root, "bench", 7, 10)
+        self.repo = os.path.join(self.root, "bench", "repo")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def export(self, *args):
+        result = CliRunner().invoke(main, [self.repo, "*", "--collections", "bench/run", *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result
+
+    def testSingleFile(self):
+        filename = os.path.join(self.root, "export.yaml")
+        self.export("--filename", filename)
+        self.assertEqual(len(_datasets(filename)), 7)
+
+    def testChunks(self):
+        filename = os.path.join(self.root, "export.yaml")
+        self.export("--filename", filename, "--chunk-size", "3")
+        counts = [len(_datasets(os.path.join(self.root, f"export-{i:04d}.yaml"))) for i in range(3)]
+        self.assertEqual(counts, [3, 3, 1])
+        self.assertFalse(os.path.exists(filename))
+
+    def addDatasetType(self, name, run="bench/run"):
+        dataset_type = DatasetType(
+            name, ["instrument", "detector"], "StructuredDataDict", universe=self.butler.dimensions
+        )
+        self.butler.registry.registerDatasetType(dataset_type)
+        file_datasets = []
+        for i in range(7):
+            path = os.path.join(self.root, f"{name}_{i}.json")
+            with open(path, "w") as f:
+                f.write("{}")
+            ref = DatasetRef(dataset_type, {"instrument": "BenchCam", "detector": i}, run=run)
+            file_datasets.append(
+                FileDataset(path=path, refs=[ref], formatter="lsst.daf.butler.formatters.json.JsonFormatter")
+            )
+        self.butler.ingest(*file_datasets, transfer="direct")
+
+    def testParallel(self):
+        self.addDatasetType("bench_other")
+        serial = os.path.join(self.root, "serial.yaml")
+        parallel = os.path.join(self.root, "parallel.yaml")
+        self.export("--filename", serial)
+        self.export("--filename", parallel, "--jobs", "2")
+        with open(serial) as f1, open(parallel) as f2:
+            self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(len(_datasets(parallel)), 14)
+
+    def testSplitByType(self):
+        self.addDatasetType("bench_other")
+        filename = os.path.join(self.root, "export.yaml")
+        self.export("--filename", filename, "--split-by-type", "--jobs", "2")
+        self.assertEqual(len(_datasets(os.path.join(self.root, "export-bench_other.yaml"))), 7)
+        self.assertEqual(len(_datasets(os.path.join(self.root, "export-rucio_register_bench.yaml"))), 7)
+        self.assertFalse(os.path.exists(filename))
+
+    def testCollectionPruning(self):
+        self.butler.registry.registerRun("bench/other")
+        self.addDatasetType("bench_other", run="bench/other")
+        self.butler.collections.register("bench/chain", CollectionType.CHAINED)
+        self.butler.collections.redefine_chain("bench/chain", ["bench/run", "bench/other"])
+
+        filename = os.path.join(self.root, "export.yaml")
+        with patch("lsst.rucio.register.export.iter_datasets", side_effect=iter_datasets) as mock_iter:
+            result = CliRunner().invoke(
+                main, [self.repo, "*", "--collections", "bench/chain", "--filename", filename]
+            )
+        self.assertEqual(result.exit_code, 0, result.output)
+        searched = {c.args[1]: c.kwargs["collections"] for c in mock_iter.call_args_list}
+        self.assertEqual(searched, {"bench_other": ["bench/other"], "rucio_register_bench": ["bench/run"]})
+        self.assertEqual(len(_datasets(filename)), 14)
+
+    def testJsonLines(self):
+        filename = os.path.join(self.root, "export.jsonl.gz")
+        self.export("--filename", filename, "--format", "jsonl.gz")
+        with gzip.open(filename, "rt") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 7)
+        ref = DatasetRef.from_json(json.dumps(lines[0]["ref"]), universe=self.butler.dimensions)
+        self.assertTrue(ref.dataId.hasRecords())
+        self.assertTrue(lines[0]["path"].endswith(".json"))
+
+    def testJsonLinesRoundTrip(self):
+        filename = os.path.join(self.root, "export.jsonl.gz")
+        self.export("--filename", filename, "--format", "jsonl.gz", "--root", f"file://{self.root}/")
+        refs = {ref.id: ref for ref in self.butler.query_datasets("rucio_register_bench", "bench/run")}
+        file_datasets = list(read_jsonl_export(filename, self.butler.dimensions, self.root))
+        self.assertEqual({fd.refs[0].id for fd in file_datasets}, set(refs))
+        for file_dataset in file_datasets:
+            self.assertEqual(file_dataset.path, self.butler.getURI(refs[file_dataset.refs[0].id]))
+
+        # into an empty repository, through the command
+        repo = os.path.join(self.root, "imported")
+        Butler.makeRepo(repo)
+        result = CliRunner().invoke(import_main, [repo, filename, "--directory", self.root])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 7 datasets", result.output)
+        imported = Butler(repo)
+        self.addCleanup(imported.close)
+        imported_refs = imported.query_datasets(
+            "rucio_register_bench", "bench/run", with_dimension_records=True
+        )
+        self.assertEqual({ref.id for ref in imported_refs}, set(refs))
+        for ref in imported_refs:
+            self.assertEqual(imported.getURI(ref), self.butler.getURI(refs[ref.id]))
+            self.assertEqual(ref.dataId.records["detector"].full_name, f"D{ref.dataId['detector']:06d}")
+
+    def testYamlExportStream(self):
+        filename = os.path.join(self.root, "export.yaml")
+        refs = self.butler.query_datasets("rucio_register_bench", "bench/run", with_dimension_records=True)
+        uris = [self.butler.getURI(ref) for ref in refs]
+        with YamlExportStream(self.butler, filename) as export:
+            for i in range(0, 7, 3):
+                # written without asking the datastore again
+                with patch.object(Butler, "getURI", side_effect=AssertionError):
+                    export.write(refs[i : i + 3], uris[i : i + 3])
+                # each chunk is on disk, and the file is complete, as soon
+                # as it is written
+                self.assertEqual(len(_datasets(filename)), min(i + 3, 7))
+        with open(filename) as f:
+            data = yaml.load(f, Loader=_Loader)["data"]
+        types = [item["type"] for item in data]
+        self.assertEqual(types.count("run"), 1)
+        self.assertEqual(types.count("dataset_type"), 1)
+        # the instrument record is shared by every chunk
+        instruments = [
+            item for item in data if item["type"] == "dimension" and item["element"] == "instrument"
+        ]
+        self.assertEqual(len(instruments), 1)
+
+        repo = os.path.join(self.root, "imported")
+        Butler.makeRepo(repo)
+        imported = Butler(repo, writeable=True)
+        self.addCleanup(imported.close)
+        imported.import_(filename=filename, transfer="direct")
+        imported_refs = imported.query_datasets(
+            "rucio_register_bench", "bench/run", with_dimension_records=True
+        )
+        self.assertEqual({ref.id for ref in imported_refs}, {ref.id for ref in refs})
+        expected = {ref.id: uri for ref, uri in zip(refs, uris)}
+        for ref in imported_refs:
+            self.assertEqual(imported.getURI(ref), expected[ref.id])
+            self.assertEqual(ref.dataId.records["detector"].full_name, f"D{ref.dataId['detector']:06d}")
+
+    def testYamlExportStreamEmpty(self):
+        filename = os.path.join(self.root, "export.yaml")
+        with YamlExportStream(self.butler, filename):
+            pass
+        self.assertEqual(_datasets(filename), [])
+
+    def testIncremental(self):
+        filename = os.path.join(self.root, "export.yaml")
+        watermark_file = f"{filename}.watermark.json"
+
+        self.export("--filename", filename, "--incremental")
+        with open(watermark_file) as f:
+            watermark = json.load(f)
+        self.assertEqual(watermark["collections"], ["bench/run"])
+        self.assertEqual(len(watermark["filenames"]), 1)
+        self.assertEqual(len(_datasets(watermark["filenames"][0])), 7)
+        self.assertFalse(os.path.exists(filename))
+
+        # Nothing new since the last export.
+        self.export("--filename", filename, "--incremental")
+        with open(watermark_file) as f:
+            watermark = json.load(f)
+        self.assertEqual(len(watermark["filenames"]), 2)
+        self.assertEqual(len(_datasets(watermark["filenames"][1])), 0)
+
+        # New datasets in a known run, and in a new run.
+        self.addDatasetType("bench_other")
+        self.butler.registry.registerRun("bench/other")
+        self.addDatasetType("bench_third", run="bench/other")
+        self.butler.collections.register("bench/chain", CollectionType.CHAINED)
+        self.butler.collections.redefine_chain("bench/chain", ["bench/run", "bench/other"])
+        result = CliRunner().invoke(
+            main, [self.repo, "*", "--collections", "bench/chain", "--filename", filename, "--incremental"]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(watermark_file) as f:
+            watermark = json.load(f)
+        self.assertEqual(watermark["collections"], ["bench/other", "bench/run"])
+        datasets = _datasets(watermark["filenames"][2])
+        self.assertEqual(len(datasets), 14)
+
+    def testIncrementalFindFirst(self):
+        result = CliRunner().invoke(
+            main,
+            [self.repo, "*", "--collections", "bench/run", "--find-first", "--incremental"],
+        )
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn("--find-first", result.output)
+
+    @patch("lsst.rucio.register.export.astropy.time.Time.now")
+    def testIncrementalStart(self, mock_now):
+        filename = os.path.join(self.root, "export.yaml")
+        mock_now.return_value = astropy.time.Time("2000-01-01T00:00:00", scale="tai")
+        clock_reads = []
+
+        def query(*args, **kwargs):
+            clock_reads.append(mock_now.call_count)
+            return iter_datasets(*args, **kwargs)
+
+        with patch("lsst.rucio.register.export.iter_datasets", side_effect=query):
+            self.export("--filename", filename, "--incremental")
+        # the watermark time was taken before the first query
+        self.assertEqual(clock_reads, [1])
+        with open(f"{filename}.watermark.json") as f:
+            self.assertEqual(json.load(f)["ingest_date"], "2000-01-01T00:00:00.000")
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,168 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from rucio.client.didclient import DIDClient
+from rucio.client.replicaclient import ReplicaClient
+from rucio.client.ruleclient import RuleClient
+from rucio.common.exception import DataIdentifierNotFound, InvalidObject, RucioException
+
+import lsst.utils.tests
+from lsst.resources import ResourcePath
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.fake_rucio import FakeRucioServer
+from lsst.rucio.register.hierarchy import ContainerRule, DatasetHierarchy
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.rules import ReplicationRule
+
+
+class FakeRucioTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.server = FakeRucioServer(rses=["DRR1"]).start()
+        self.addCleanup(self.server.stop)
+        self.paths = []
+        os.makedirs(os.path.join(self.root, "test", "a"))
+        for i in range(4):
+            path = os.path.join(self.root, "test", "a", f"file_{i}.fits")
+            with open(path, "wb") as f:
+                f.write(bytes([i]) * 100)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def makeInterface(self, **kwargs):
+        client_kwargs = self.server.client_kwargs()
+        return RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            self.root,
+            "root://xrd1:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=ReplicaClient(**client_kwargs),
+            did_client=DIDClient(**client_kwargs),
+            rule_client=RuleClient(**client_kwargs),
+            **kwargs,
+        )
+
+    def makeDIDs(self, ri, paths):
+        hashes = [ri.compute_hashes(ResourcePath(path)) for path in paths]
+        return ri.make_dids(paths, [size for size, _ in hashes], [adler32 for _, adler32 in hashes])
+
+    def testRegister(self):
+        ri = self.makeInterface()
+        self.assertEqual(ri.register_dids("mydataset", self.makeDIDs(ri, self.paths)), 4)
+        self.assertEqual(len(self.server.files), 4)
+        self.assertEqual(
+            self.server.replicas[("test", "a/file_0.fits")],
+            {"DRR1": "root://xrd1:1094//rucio/test/a/file_0.fits"},
+        )
+        dataset = self.server.dids[("test", "mydataset")]
+        self.assertTrue(dataset["monotonic"])
+        self.assertEqual(len(dataset["children"]), 4)
+        # the dataset was created when the first attachment failed
+        self.assertEqual(self.server.requests["POST /dids/{scope}/{name}/dids"], 2)
+
+        # files already in the dataset are attached one by one
+        dids = self.makeDIDs(ri, self.paths[:2])
+        ri._attach_dids("mydataset", dids)
+        self.assertEqual(ri.metrics.snapshot()["counters"]["file_already_exists"], 2)
+
+    def testAttachByName(self):
+        ri = self.makeInterface()
+        dids = self.makeDIDs(ri, self.paths)
+        ri._add_replica_dids(dids)
+        ri.did_client.add_dataset("test", "mydataset")
+        names = [{"scope": did["scope"], "name": did["name"]} for did in dids]
+        # without a size and checksum, files cannot be attached on an RSE
+        with self.assertRaises(InvalidObject):
+            ri.did_client.add_files_to_dataset("test", "mydataset", names, rse="DRR1")
+        ri._attach_dids("mydataset", names)
+        self.assertEqual(len(self.server.dids[("test", "mydataset")]["children"]), 4)
+
+    def testHierarchyAndRules(self):
+        ri = self.makeInterface(
+            hierarchy=DatasetHierarchy(rules=[ContainerRule(pattern="DP1_", containers=["DP1"])]),
+            replication_rules=[ReplicationRule(rse_expression="IN2P3", copies=1)],
+        )
+        dids = self.makeDIDs(ri, self.paths)
+        ri._add_replica_dids(dids)
+        ri.attach({"DP1_a": dids[:2], "DP1_b": dids[2:]})
+        self.assertEqual(
+            list(self.server.dids[("test", "DP1")]["children"]), [("test", "DP1_a"), ("test", "DP1_b")]
+        )
+        self.assertEqual(self.server.requests["POST /dids"], 1)
+        self.assertEqual(self.server.requests["POST /rules"], 1)
+        self.assertEqual(sorted(rule["name"] for rule in self.server.rules.values()), ["DP1_a", "DP1_b"])
+
+        ri.close_datasets()
+        self.assertFalse(self.server.dids[("test", "DP1_a")]["open"])
+        with self.assertRaises(RucioException):
+            ri.did_client.add_files_to_dataset("test", "DP1_a", dids[2:], rse="DRR1")
+
+    @patch.object(RucioInterface, "_sleep")
+    def testFaults(self, mock_sleep):
+        ri = self.makeInterface()
+        dids = self.makeDIDs(ri, self.paths)
+        ri._add_replica_dids(dids)
+        ri.did_client.add_dataset("test", "mydataset")
+        self.server.inject(path="/dids/test/mydataset/dids")
+        ri._add_files_to_dataset("mydataset", dids)
+        self.assertEqual(self.server.requests["POST /dids/{scope}/{name}/dids"], 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(len(self.server.dids[("test", "mydataset")]["children"]), 4)
+
+        self.server.inject("DataIdentifierNotFound", path="/dids", count=None)
+        with self.assertRaises(DataIdentifierNotFound):
+            ri.did_client.add_dataset("test", "other")
+
+    def testRateLimit(self):
+        server = FakeRucioServer(max_requests_per_sec=1).start()
+        self.addCleanup(server.stop)
+        client = ReplicaClient(**server.client_kwargs())
+        client.add_replicas(rse="DRR1", files=[])
+        with self.assertRaises(RucioException):
+            client.add_replicas(rse="DRR1", files=[])
+        self.assertEqual(server.rejected, 1)
+
+    def testWriteConfig(self):
+        config = os.path.join(self.root, "rucio.cfg")
+        self.server.write_config(config)
+        with open(config) as f:
+            text = f.read()
+        self.assertIn(f"rucio_host = {self.server.url}", text)
+        self.assertIn("auth_type = userpass", text)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,115 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.hierarchy import ContainerRule, DatasetHierarchy
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+_RULES = [
+    ContainerRule(
+        pattern=r"(?P<campaign>[^_]+)_(?P<instrument>[^_]+)_",
+        containers=["{campaign}", "{campaign}_{instrument}"],
+    ),
+    ContainerRule(pattern=r"dims/", containers=["dimensions"]),
+]
+
+
+class HierarchyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hierarchy = DatasetHierarchy(rules=_RULES)
+        self.dc = LatencyDIDClient()
+        self.ri = RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            "/rse",
+            "root://xrd1:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=LatencyReplicaClient(),
+            did_client=self.dc,
+            hierarchy=self.hierarchy,
+        )
+
+    def testContainers(self):
+        self.assertEqual(self.hierarchy.containers("DP1_LSSTCam_raw_1"), ["DP1", "DP1_LSSTCam"])
+        self.assertEqual(self.hierarchy.containers("dims/2024"), ["dimensions"])
+        self.assertEqual(self.hierarchy.containers("other"), [])
+
+    def testAttachments(self):
+        containers, children = self.hierarchy.attachments(
+            ["DP1_LSSTCam_a", "DP1_LSSTCam_b", "DP1_LATISS_a", "other"]
+        )
+        self.assertEqual(containers, ["DP1", "DP1_LSSTCam", "DP1_LATISS"])
+        self.assertEqual(
+            children,
+            {
+                "DP1": ["DP1_LSSTCam", "DP1_LATISS"],
+                "DP1_LSSTCam": ["DP1_LSSTCam_a", "DP1_LSSTCam_b"],
+                "DP1_LATISS": ["DP1_LATISS_a"],
+            },
+        )
+
+    def testEnsureDatasets(self):
+        self.dc.dids["DP1"] = "CONTAINER"
+        self.ri.ensure_datasets(["DP1_LSSTCam_a", "DP1_LSSTCam_b", "other"])
+        # one lookup, one creation and one attachment request
+        self.assertEqual(self.dc.requests, 3)
+        self.assertEqual(
+            self.dc.dids,
+            {
+                "DP1": "CONTAINER",
+                "DP1_LSSTCam": "CONTAINER",
+                "DP1_LSSTCam_a": "DATASET",
+                "DP1_LSSTCam_b": "DATASET",
+                "other": "DATASET",
+            },
+        )
+        self.assertEqual(
+            self.dc.children, {"DP1": ["DP1_LSSTCam"], "DP1_LSSTCam": ["DP1_LSSTCam_a", "DP1_LSSTCam_b"]}
+        )
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["dids_created"], 4)
+
+        # known datasets are not looked up again
+        self.ri.ensure_datasets(["DP1_LSSTCam_a"])
+        self.assertEqual(self.dc.requests, 3)
+
+    def testRegisterAndClose(self):
+        dids = self.ri.make_dids(["/rse/test/a.fits"], [10], ["00000001"])
+        self.ri.register_dids("DP1_LSSTCam_a", dids)
+        self.ri.attach({"DP1_LSSTCam_a": dids, "DP1_LSSTCam_b": dids})
+        self.assertEqual(self.dc.attached, 3)
+        self.assertEqual(self.dc.children["DP1_LSSTCam"], ["DP1_LSSTCam_a", "DP1_LSSTCam_b"])
+
+        self.assertEqual(self.ri.close_datasets(), 2)
+        self.assertEqual(self.dc.closed, {"DP1_LSSTCam_a", "DP1_LSSTCam_b"})
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -41,7 +41,9 @@ from lsst.daf.butler import Butler, DatasetRef, DimensionUniverse
 from lsst.resources import ResourceInfo, ResourcePath
 from lsst.resources.file import FileResourcePath
 from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.plan import RegistrationPlan
 from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.sidecar import decode_sidecar
 
 
 class InterfaceTestCase(lsst.utils.tests.TestCase):
@@ -111,6 +113,7 @@ class InterfaceTestCase(lsst.utils.tests.TestCase):
         did = rb.did.model_dump()
 
         self.assertEqual(did["adler32"], "abcd1234")
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["checksum_cache_hits"], 2)
 
     def testInterfaceTestCase(self):
         dtn_url = "root://xrd1:1094//rucio"
@@ -138,6 +141,107 @@ class InterfaceTestCase(lsst.utils.tests.TestCase):
         meta = did["meta"]
         self.assertEqual(meta["rubin_butler"], DataType.DATA_PRODUCT)
 
+        counters = self.ri.metrics.snapshot()["counters"]
+        self.assertEqual(counters["bytes_hashed"], 2 * 1365120)
+
+    def testPlan(self):
+        with open(self.dataset_ref_file) as f:
+            json_ref = f.readline()
+        ref = DatasetRef.from_json(json_ref, DimensionUniverse())
+
+        plan = RegistrationPlan()
+        cnt = self.ri.plan_dataset_refs(plan, "mydataset", [ref, [ref]])
+        self.assertEqual(cnt, 2)
+        self.assertEqual(plan.files, 2)
+        self.assertEqual(plan.bytes, 2 * 1365120)
+        self.assertEqual(plan.known_checksums, 0)
+        self.assertEqual(plan.outside_scope, 2)
+        self.assertEqual(plan.datasets, {"mydataset"})
+        self.mock_rc_add_replicas.assert_not_called()
+        self.assertNotIn("bytes_hashed", self.ri.metrics.snapshot()["counters"])
+
+    def testSidecarEncoding(self):
+        with open(self.dataset_ref_file) as f:
+            json_ref = f.readline()
+        ref = DatasetRef.from_json(json_ref, DimensionUniverse())
+
+        self.ri.sidecar_encoding = "zlib"
+        rb = self.ri._make_dataset_ref_bundle("mydataset", ref)
+        sidecar = rb.did.meta.rubin_sidecar
+        self.assertTrue(sidecar.startswith("zlib:"))
+        self.assertEqual(decode_sidecar(sidecar), ref.to_json())
+
+    def loadRef(self):
+        with open(self.dataset_ref_file) as f:
+            ref = DatasetRef.from_json(f.readline(), DimensionUniverse())
+        self.butler.registry.registerDatasetType(ref.datasetType)
+        return ref
+
+    @patch.object(DIDClient, "add_files_to_dataset", return_value=True)
+    def testAttachMode(self, mock_add_files):
+        ref = self.loadRef()
+        self.assertEqual(self.ri.register_as_replicas("mydataset", [ref, [ref]], mode="attach"), 2)
+        self.mock_rc_add_replicas.assert_not_called()
+        files = mock_add_files.call_args.kwargs["files"]
+        self.assertEqual(files, [{"scope": "test", "name": self.data_file}] * 2)
+        self.assertIsNone(mock_add_files.call_args.kwargs["rse"])
+        self.assertNotIn("bytes_hashed", self.ri.metrics.snapshot()["counters"])
+
+    @patch.object(DIDClient, "add_files_to_dataset", return_value=True)
+    def testReplicasMode(self, mock_add_files):
+        ref = self.loadRef()
+        self.assertEqual(self.ri.register_as_replicas("mydataset", [ref], mode="replicas"), 1)
+        self.mock_rc_add_replicas.assert_called_once()
+        mock_add_files.assert_not_called()
+
+    @patch.object(DIDClient, "add_files_to_dataset", return_value=True)
+    def testAttachWithoutSidecars(self, mock_add_files):
+        ref = self.loadRef()
+        with self.assertLogs("lsst.rucio.register.rucio_interface", "INFO") as cm:
+            self.assertEqual(self.ri.register_as_replicas("mydataset", [ref] * 5), 5)
+        # the sidecars went with the replicas, and are not sent again
+        self.assertIn("meta", self.mock_rc_add_replicas.call_args.kwargs["files"][0])
+        files = mock_add_files.call_args.kwargs["files"]
+        self.assertEqual(len(files), 5)
+        self.assertNotIn("meta", files[0])
+        self.assertEqual(
+            files[0]["adler32"], self.mock_rc_add_replicas.call_args.kwargs["files"][0]["adler32"]
+        )
+        # the log names a few files rather than all of them
+        (message,) = [m for m in cm.output if "Registering" in m]
+        self.assertIn("Registering 5 files in dataset mydataset", message)
+        self.assertIn("and 2 more", message)
+
+    @patch.object(DIDClient, "add_files_to_dataset", return_value=True)
+    def testBundlesReleased(self, mock_add_files):
+        ref = self.loadRef()
+        bundles = [self.ri._make_dataset_ref_bundle("mydataset", ref) for _ in range(3)]
+        # the sidecars are gone before anything is attached
+        mock_add_files.side_effect = lambda **kwargs: self.assertEqual(bundles, [])
+        self.assertEqual(self.ri._register_bundles("mydataset", bundles, [], []), 3)
+        mock_add_files.assert_called_once()
+
+    @patch.object(DIDClient, "add_dids", return_value=True)
+    @patch.object(DIDClient, "get_metadata_bulk", return_value=[{"scope": "test", "name": "dataset1"}])
+    @patch.object(DIDClient, "attach_dids_to_dids", side_effect=[DataIdentifierNotFound("new"), True])
+    def testBulkAttach(self, mock_attach, mock_metadata, mock_add_dids):
+        ref = self.loadRef()
+        bundles = [
+            self.ri._make_dataset_ref_bundle("dataset1", ref),
+            self.ri._make_dataset_ref_bundle("dataset2", ref),
+            self.ri._make_dataset_ref_bundle("dataset2", ref),
+        ]
+        self.ri.register_to_dataset(bundles)
+        self.assertEqual(mock_attach.call_count, 2)
+        attachments = mock_attach.call_args.kwargs["attachments"]
+        self.assertEqual([a["name"] for a in attachments], ["dataset1", "dataset2"])
+        self.assertEqual([len(a["dids"]) for a in attachments], [1, 2])
+        self.assertEqual(attachments[0]["dids"][0], {"scope": "test", "name": self.data_file})
+        self.assertTrue(mock_attach.call_args.kwargs["ignore_duplicate"])
+        # only the missing dataset is created
+        mock_add_dids.assert_called_once()
+        self.assertEqual([did["name"] for did in mock_add_dids.call_args.args[0]], ["dataset2"])
+
     def common(self):
         json_ref = None
         with open(self.dataset_ref_file) as f:
@@ -201,6 +305,29 @@ class InterfaceTestCase(lsst.utils.tests.TestCase):
         with self.assertRaises(Exception):
             ri._add_file_to_dataset_with_retries(None, None)
 
+    @patch.object(ReplicaClient, "add_replicas", side_effect=[RucioException("failed"), None])
+    def testRetryKeepsInjectedClient(self, mock_add_replicas):
+        replica_client = ReplicaClient()
+        ri = RucioInterface(
+            self.butler,
+            "DRR1",
+            "test",
+            self.rse_root,
+            "root://xrd1:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=replica_client,
+        )
+        self.mock_rc_init.reset_mock()
+        ri._add_replica_dids([])
+        self.assertIs(ri.replica_client, replica_client)
+        self.mock_rc_init.assert_not_called()
+
+    @patch.object(ReplicaClient, "add_replicas", side_effect=[RucioException("failed"), None])
+    def testRetryReconnects(self, mock_add_replicas):
+        self.ri._add_replica_dids([])
+        # a client was made for each attempt
+        self.assertEqual(self.mock_rc_init.call_count, 2)
+
     def tearDown(self):
         patch.stopall()
         shutil.rmtree(self.butler_repo, ignore_errors=True)
@@ -0,0 +1,83 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import make_synthetic_repo
+from lsst.rucio.register.lazy_butler import LazyButler
+from lsst.rucio.register.script import _query_refs
+
+
+class LazyButlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        make_synthetic_repo(self.root, "bench", 2, 10)
+        self.repo = os.path.join(self.root, "bench", "repo")
+
+    def testLazy(self):
+        butler = LazyButler(self.repo)
+        self.assertFalse(butler.connected)
+        refs = butler.query_datasets("rucio_register_bench", "bench/run")
+        self.assertEqual(len(refs), 2)
+        self.assertTrue(butler.connected)
+        self.assertFalse(butler.isWriteable())
+        self.assertEqual(butler.metrics.snapshot()["stages"]["butler_init"]["count"], 1)
+
+    def testDeferredQuery(self):
+        for depth in (0, 2):
+            butler = LazyButler(self.repo)
+            refs = _query_refs(
+                butler,
+                10,
+                depth,
+                None,
+                glob=["rucio_register_bench"],
+                collections=["bench/run"],
+                where="",
+                find_first=False,
+                limit=0,
+                order_by=(),
+                show_uri=False,
+            )
+            # nothing is queried until the first ref is wanted
+            self.assertFalse(butler.connected)
+            self.assertEqual(len(list(refs)), 2)
+            self.assertTrue(butler.connected)
+
+    def testPrivateAttributes(self):
+        butler = LazyButler(self.repo)
+        with self.assertRaises(AttributeError):
+            butler._registry
+        self.assertFalse(butler.connected)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
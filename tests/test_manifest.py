@@ -0,0 +1,165 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.manifest import iter_manifest, register_manifest
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        data_dir = os.path.join(self.root, "test", "data")
+        os.makedirs(data_dir)
+        self.rows = {"path": [], "size": [], "adler32": [], "uuid": [], "dataset_type": []}
+        for i in range(5):
+            path = os.path.join(data_dir, f"file_{i}.fits")
+            content = os.urandom(100 + i)
+            with open(path, "wb") as f:
+                f.write(content)
+            self.rows["path"].append(path)
+            self.rows["size"].append(len(content))
+            self.rows["adler32"].append(f"{zlib.adler32(content):08x}")
+            self.rows["uuid"].append(f"uuid-{i}")
+            self.rows["dataset_type"].append("raw")
+        self.rc = LatencyReplicaClient()
+        self.dc = LatencyDIDClient()
+        self.ri = RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            self.root,
+            "root://xrd1:1094//rucio",
+            DataType.RAW_FILE,
+            replica_client=self.rc,
+            did_client=self.dc,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def writeParquet(self, rows):
+        path = os.path.join(self.root, "manifest.parquet")
+        pyarrow.parquet.write_table(pa.table(rows), path)
+        return path
+
+    def testParquet(self):
+        path = self.writeParquet(self.rows)
+        batches = list(iter_manifest(path, 2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0].schema.names, ["path", "size", "adler32"])
+
+        self.assertEqual(register_manifest(self.ri, path, "mydataset", 2), 5)
+        self.assertEqual(self.rc.replicas, 5)
+        self.assertEqual(self.dc.attached, 5)
+        # checksums are trusted, so no file is read
+        self.assertNotIn("hash", self.ri.metrics.snapshot()["stages"])
+
+    def testCsv(self):
+        path = os.path.join(self.root, "manifest.csv")
+        self.rows["adler32"][0] = "00000123"
+        pyarrow.csv.write_csv(pa.table(self.rows), path)
+        batch = next(iter_manifest(path, 10))
+        self.assertEqual(batch["adler32"][0].as_py(), "00000123")
+
+    def testVerify(self):
+        self.rows["adler32"][1] = "00000000"
+        self.rows["adler32"][2] = None
+        path = self.writeParquet(self.rows)
+        self.assertEqual(register_manifest(self.ri, path, "mydataset", 10, verify_checksums=True), 4)
+        counters = self.ri.metrics.snapshot()["counters"]
+        self.assertEqual(counters["checksum_mismatches"], 1)
+
+    def testMissingChecksum(self):
+        self.rows["adler32"][2] = None
+        path = self.writeParquet(self.rows)
+        self.assertEqual(register_manifest(self.ri, path, "mydataset", 10), 5)
+        self.assertEqual(self.ri.metrics.snapshot()["stages"]["hash"]["count"], 1)
+
+    def testChecksumsNormalized(self):
+        # written by other tools as uppercase, or without leading zeros
+        self.rows["adler32"][0] = self.rows["adler32"][0].upper()
+        self.rows["adler32"][1] = self.rows["adler32"][1].lstrip("0") or "0"
+        self.rows["adler32"][2] = "00000123"
+        path = self.writeParquet(self.rows)
+        batch = next(iter_manifest(path, 10))
+        self.assertEqual(batch["adler32"][0].as_py(), self.rows["adler32"][0].lower())
+        self.assertEqual(len(batch["adler32"][1].as_py()), 8)
+        self.assertEqual(batch["adler32"][2].as_py(), "00000123")
+        # only the real mismatch is found
+        self.assertEqual(register_manifest(self.ri, path, "mydataset", 10, verify_checksums=True), 4)
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["checksum_mismatches"], 1)
+
+    def testIntegerChecksums(self):
+        adler32s = [int(adler32, 16) for adler32 in self.rows["adler32"]]
+        self.rows["adler32"] = adler32s
+        path = self.writeParquet(self.rows)
+        batch = next(iter_manifest(path, 10))
+        self.assertEqual(batch["adler32"].to_pylist(), [f"{adler32:08x}" for adler32 in adler32s])
+        self.assertEqual(register_manifest(self.ri, path, "mydataset", 10, verify_checksums=True), 5)
+        self.assertNotIn("checksum_mismatches", self.ri.metrics.snapshot()["counters"])
+        for adler32 in (-1, 1 << 32):
+            self.rows["adler32"][3] = adler32
+            path = self.writeParquet(self.rows)
+            with self.assertRaisesRegex(ValueError, "file_3.fits"):
+                list(iter_manifest(path, 10))
+
+    def testVerifyMissingFile(self):
+        os.remove(self.rows["path"][1])
+        path = self.writeParquet(self.rows)
+        with self.assertLogs("lsst.rucio.register.manifest", "ERROR") as cm:
+            self.assertEqual(register_manifest(self.ri, path, "mydataset", 10, verify_checksums=True), 4)
+        self.assertIn(self.rows["path"][1], cm.output[0])
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["files_missing"], 1)
+
+    def testChecksumNotHex(self):
+        for adler32 in ("0x1234", "12345g78", "123456789", ""):
+            self.rows["adler32"][3] = adler32
+            path = self.writeParquet(self.rows)
+            with self.assertRaisesRegex(ValueError, "file_3.fits"):
+                list(iter_manifest(path, 10))
+
+    def testMissingColumn(self):
+        del self.rows["adler32"]
+        path = self.writeParquet(self.rows)
+        with self.assertRaises(ValueError):
+            list(iter_manifest(path, 10))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
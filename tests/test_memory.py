@@ -0,0 +1,95 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+from unittest.mock import patch
+
+import lsst.utils.tests
+from lsst.rucio.register.memory import MemoryBudget, current_rss
+
+
+class MemoryBudgetTestCase(unittest.TestCase):
+    def testCurrentRss(self):
+        rss = current_rss()
+        if rss is not None:
+            self.assertGreater(rss, 0)
+
+    def testPageSize(self):
+        self.assertEqual(MemoryBudget().page_size(1000, 4, 500), 1000)
+        budget = MemoryBudget(max_records=10000)
+        self.assertEqual(budget.page_size(1000, 4, 500), 1000)
+        # four pages waiting and one consumed, beside a chunk
+        self.assertEqual(budget.page_size(5000, 4, 500), 1900)
+        self.assertEqual(MemoryBudget(max_records=10).page_size(1000, 100, 5), 1)
+        with self.assertRaises(ValueError):
+            budget.page_size(1000, 4, 10000)
+
+    @patch("lsst.rucio.register.memory.current_rss")
+    def testExceeded(self, mock_rss):
+        self.assertFalse(MemoryBudget(max_records=10).exceeded())
+        mock_rss.assert_not_called()
+        budget = MemoryBudget(max_rss=100)
+        mock_rss.return_value = 50 << 20
+        self.assertFalse(budget.exceeded())
+        mock_rss.return_value = 150 << 20
+        with self.assertLogs("lsst.rucio.register.memory", "WARNING") as cm:
+            self.assertTrue(budget.exceeded())
+            self.assertTrue(budget.exceeded())
+        # warned only once
+        self.assertEqual(len(cm.output), 1)
+        mock_rss.return_value = None
+        self.assertFalse(budget.exceeded())
+
+    @patch("lsst.rucio.register.memory.current_rss")
+    def testWait(self, mock_rss):
+        budget = MemoryBudget(max_rss=100)
+        mock_rss.return_value = 50 << 20
+        budget.wait(lambda: False)
+        self.assertNotIn("memory_budget_waits", budget.metrics.snapshot()["counters"])
+
+        # memory is released after a few polls, which make up one wait
+        mock_rss.side_effect = [150 << 20] * 4 + [50 << 20]
+        with self.assertLogs("lsst.rucio.register.memory", "WARNING"):
+            budget.wait(lambda: False, interval=0.01)
+        self.assertEqual(mock_rss.call_count, 6)
+        snapshot = budget.metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["memory_budget_waits"], 1)
+        self.assertEqual(snapshot["stages"]["memory_budget_wait"]["count"], 1)
+
+        # no need to wait once the results are consumed
+        mock_rss.side_effect = None
+        mock_rss.return_value = 150 << 20
+        budget.wait(lambda: True)
+        self.assertEqual(budget.metrics.snapshot()["counters"]["memory_budget_waits"], 1)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,79 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import tempfile
+import unittest
+
+import lsst.utils.tests
+from lsst.rucio.register.metrics import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def testCounters(self):
+        metrics = Metrics()
+        metrics.increment("retries")
+        metrics.increment("bytes_hashed", 1024)
+        metrics.increment("bytes_hashed", 1024)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {"retries": 1, "bytes_hashed": 2048})
+
+    def testTimer(self):
+        metrics = Metrics()
+        with metrics.timer("hash"):
+            pass
+        metrics.observe("hash", 2.0)
+        stage = metrics.snapshot()["stages"]["hash"]
+        self.assertEqual(stage["count"], 2)
+        self.assertEqual(stage["max"], 2.0)
+
+    def testReport(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prom_file = os.path.join(tmpdir, "metrics.prom")
+            metrics = Metrics(progress_interval=0.0, prometheus_file=prom_file)
+            metrics.increment("files_registered", 3)
+            metrics.observe("attach", 0.02)
+            with self.assertLogs("lsst.rucio.register.metrics", level="INFO") as cm:
+                metrics.maybe_report()
+            line = cm.records[0].getMessage()
+            self.assertEqual(json.loads(line)["counters"]["files_registered"], 3)
+
+            with open(prom_file) as f:
+                text = f.read()
+        self.assertIn("rucio_register_files_registered_total 3", text)
+        self.assertIn('rucio_register_stage_seconds_bucket{stage="attach",le="0.01"} 0', text)
+        self.assertIn('rucio_register_stage_seconds_bucket{stage="attach",le="0.05"} 1', text)
+        self.assertIn('rucio_register_stage_seconds_count{stage="attach"} 1', text)
+
+    def testNoProgressInterval(self):
+        metrics = Metrics()
+        with self.assertNoLogs("lsst.rucio.register.metrics", level="INFO"):
+            metrics.maybe_report()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,116 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import lsst.utils.tests
+from lsst.daf.butler import DatasetType
+from lsst.rucio.register.benchmark import make_synthetic_repo
+from lsst.rucio.register.path_resolver import TemplatePathResolver
+
+_TEMPLATE = "{run:/}/{datasetType}/{datasetType}_{instrument}_{detector.full_name}_{run}.yaml"
+
+
+class TemplatePathResolverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.butler = make_synthetic_repo(self.root, "bench", 5, 10)
+        self.repo = os.path.join(self.root, "bench", "repo")
+        dataset_type = DatasetType(
+            "bench_put", ["instrument", "detector"], "StructuredDataDict", universe=self.butler.dimensions
+        )
+        self.butler.registry.registerDatasetType(dataset_type)
+        self.butler.registry.registerRun("bench/put")
+        for i in range(5):
+            self.butler.put({"i": i}, "bench_put", instrument="BenchCam", detector=i, run="bench/put")
+        self.refs = self.butler.query_datasets(
+            "bench_put", collections="bench/put", with_dimension_records=True
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def testTemplates(self):
+        resolver = TemplatePathResolver(self.butler, self.repo, {"bench_put": _TEMPLATE}, sample_rate=0.0)
+        expected = [self.butler.getURI(ref) for ref in self.refs]
+        with patch.object(self.butler, "getURI", wraps=self.butler.getURI) as mock_get_uri:
+            uris = [resolver.getURI(ref) for ref in self.refs]
+        self.assertEqual(uris, expected)
+        # Only the first location is verified against the datastore.
+        self.assertEqual(mock_get_uri.call_count, 1)
+        counters = resolver.metrics.snapshot()["counters"]
+        self.assertEqual(counters["path_template_hits"], 5)
+        self.assertEqual(counters["path_template_verified"], 1)
+
+    def testNoTemplate(self):
+        resolver = TemplatePathResolver(self.butler, self.repo, {"bench_put": _TEMPLATE})
+        ref = self.butler.query_datasets("rucio_register_bench", collections="bench/run", limit=1)[0]
+        self.assertEqual(resolver.getURI(ref), self.butler.getURI(ref))
+
+    def testDrift(self):
+        template = _TEMPLATE.replace("{datasetType}/", "")
+        resolver = TemplatePathResolver(self.butler, self.repo, {"bench_put": template}, sample_rate=0.0)
+        with self.assertLogs("lsst.rucio.register.path_resolver", level="WARNING"):
+            uris = [resolver.getURI(ref) for ref in self.refs]
+        self.assertEqual(uris, [self.butler.getURI(ref) for ref in self.refs])
+        self.assertEqual(resolver.metrics.snapshot()["counters"]["path_template_drift"], 1)
+
+    def testConcurrentDrift(self):
+        template = _TEMPLATE.replace("{datasetType}/", "")
+        resolver = TemplatePathResolver(self.butler, self.repo, {"bench_put": template}, sample_rate=1.0)
+        barrier = threading.Barrier(2, timeout=10)
+        get_uri = self.butler.getURI
+
+        def verify(ref):
+            # both threads check their location before either finds drift
+            barrier.wait()
+            return get_uri(ref)
+
+        with patch.object(self.butler, "getURI", side_effect=verify):
+            with self.assertLogs("lsst.rucio.register.path_resolver", level="WARNING") as cm:
+                with ThreadPoolExecutor(2) as pool:
+                    uris = list(pool.map(resolver.getURI, self.refs[:2]))
+        self.assertEqual(uris, [get_uri(ref) for ref in self.refs[:2]])
+        # the drift is reported once
+        self.assertEqual(len(cm.output), 1)
+        self.assertEqual(resolver.metrics.snapshot()["counters"]["path_template_drift"], 1)
+
+    def testDatasetMapFile(self):
+        map_file = os.path.join(self.root, "templates.yaml")
+        with open(map_file, "w") as f:
+            f.write(f'map:\n  bench_put: "{_TEMPLATE}"\n')
+        resolver = TemplatePathResolver(self.butler, self.repo, map_file, sample_rate=1.0)
+        self.assertEqual(resolver.getURI(self.refs[0]), self.butler.getURI(self.refs[0]))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
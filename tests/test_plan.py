@@ -0,0 +1,52 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import lsst.utils.tests
+from lsst.rucio.register.plan import RegistrationPlan
+
+
+class RegistrationPlanTestCase(unittest.TestCase):
+    def testPlan(self):
+        plan = RegistrationPlan()
+        plan.add("ds1", 100_000_000, known_checksum=True)
+        plan.add("ds1", 300_000_000, known_checksum=False)
+        plan.add("ds2", 100_000_000, known_checksum=False)
+
+        self.assertEqual(plan.files, 3)
+        self.assertEqual(plan.bytes, 500_000_000)
+        self.assertEqual(plan.known_checksums, 1)
+        self.assertEqual(plan.unknown_checksum_bytes, 400_000_000)
+        self.assertEqual(plan.datasets, {"ds1", "ds2"})
+
+        # 400 MB at 100 MB/s, plus 3 files at 1 file/s
+        self.assertAlmostEqual(plan.estimate_seconds(100.0, 1.0), 7.0)
+        self.assertIn("Rucio datasets:      2 (ds1, ds2)", plan.summary(100.0, 1.0))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
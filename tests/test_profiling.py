@@ -0,0 +1,63 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import pstats
+import tempfile
+import unittest
+
+import click
+from click.testing import CliRunner
+
+import lsst.utils.tests
+from lsst.rucio.register.profiling import profile_options
+
+
+@click.command()
+@profile_options
+@click.option("--value", type=int, default=1)
+def command(value):
+    click.echo(f"value={sum(range(value))}")
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def testDisabled(self):
+        result = CliRunner().invoke(command, ["--value", "4"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, "value=6\n")
+
+    def testProfile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "command.prof")
+            result = CliRunner().invoke(command, ["--value", "4", "--profile", path, "--profile-top", "3"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("value=6", result.output)
+            stats = pstats.Stats(path)
+        self.assertGreater(stats.total_calls, 0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,105 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import lsst.utils.tests
+from lsst.rucio.register.memory import MemoryBudget
+from lsst.rucio.register.metrics import Metrics
+from lsst.rucio.register.query import batched, prefetch
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def testBatched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def testOrder(self):
+        metrics = Metrics()
+        self.assertEqual(list(prefetch(range(100), page_size=7, depth=2, metrics=metrics)), list(range(100)))
+        self.assertEqual(metrics.snapshot()["stages"]["prefetch_wait"]["count"], 16)
+        self.assertEqual(list(prefetch(range(10), depth=0)), list(range(10)))
+
+    def testBackgroundThread(self):
+        threads = []
+
+        def produce():
+            for i in range(3):
+                threads.append(threading.current_thread())
+                yield i
+
+        self.assertEqual(list(prefetch(produce(), page_size=2)), [0, 1, 2])
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def testException(self):
+        def produce():
+            yield 1
+            raise RuntimeError("query failed")
+
+        it = prefetch(produce(), page_size=1)
+        self.assertEqual(next(it), 1)
+        with self.assertRaisesRegex(RuntimeError, "query failed"):
+            next(it)
+
+    def testEarlyClose(self):
+        closed = threading.Event()
+
+        def produce():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        it = prefetch(produce(), page_size=10, depth=2)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertTrue(closed.is_set())
+
+    def testMemoryBudget(self):
+        produced = []
+
+        def produce():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        budget = MemoryBudget(max_rss=1)
+        with patch.object(budget, "exceeded", return_value=True):
+            it = prefetch(produce(), page_size=2, depth=3, memory_budget=budget)
+            self.assertEqual(next(it), 0)
+            time.sleep(0.5)
+            # over the budget, a page is only fetched once the queue is empty
+            self.assertLessEqual(len(produced), 6)
+            self.assertEqual(list(it), list(range(1, 100)))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,155 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from rucio.client.didclient import DIDClient
+from rucio.client.replicaclient import ReplicaClient
+from rucio.common.exception import DataIdentifierNotFound, RucioException
+
+import lsst.utils.tests
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.fake_rucio import FakeRucioServer
+from lsst.rucio.register.rate_limiter import RateLimiter, is_overload
+from lsst.rucio.register.rucio_interface import RucioInterface
+
+
+@patch("lsst.rucio.register.rate_limiter.time.sleep")
+class RateLimiterTestCase(unittest.TestCase):
+    def testRequestRate(self, mock_sleep):
+        limiter = RateLimiter(requests_per_sec=10, burst=0.5)
+        waits = [limiter.acquire() for _ in range(8)]
+        # the first five fit in the burst, the others wait their turn
+        self.assertEqual(waits[:5], [0.0] * 5)
+        for i, wait in enumerate(waits[5:], 1):
+            self.assertAlmostEqual(wait, i / 10, delta=0.01)
+        self.assertEqual(mock_sleep.call_count, 3)
+        self.assertEqual(limiter.metrics.snapshot()["stages"]["rate_limit_wait"]["count"], 3)
+
+    def testDIDRate(self, mock_sleep):
+        limiter = RateLimiter(dids_per_sec=100)
+        self.assertEqual(limiter.acquire(100), 0.0)
+        # a request larger than the burst waits for all its DIDs
+        self.assertAlmostEqual(limiter.acquire(300), 3.0, delta=0.01)
+        # requests themselves are not limited
+        self.assertEqual(RateLimiter(dids_per_sec=1).acquire(), 0.0)
+
+    def testBackoff(self, mock_sleep):
+        limiter = RateLimiter(requests_per_sec=10, min_scale=0.2, increase=0.1)
+        limiter.throttled()
+        self.assertEqual(limiter.scale, 0.5)
+        # requests in flight during the cooldown back off only once
+        limiter.throttled()
+        self.assertEqual(limiter.scale, 0.5)
+        limiter.succeeded()
+        self.assertAlmostEqual(limiter.scale, 0.6)
+        limiter.cooldown = 0.0
+        for _ in range(3):
+            limiter.throttled()
+        self.assertEqual(limiter.scale, 0.2)
+        self.assertEqual(limiter.metrics.snapshot()["counters"]["rate_limit_backoffs"], 4)
+        # at a lower rate, debts take longer to repay
+        for _ in range(10):
+            limiter.acquire()
+        self.assertAlmostEqual(limiter.acquire(), 0.5, delta=0.01)
+
+    def testLockFile(self, mock_sleep):
+        root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        lock_file = os.path.join(root, "rucio.lock")
+        first = RateLimiter(requests_per_sec=10, lock_file=lock_file)
+        second = RateLimiter(requests_per_sec=10, lock_file=lock_file)
+        for _ in range(10):
+            self.assertEqual(first.acquire(), 0.0)
+        # the buckets are shared, so the second limiter waits too
+        self.assertGreater(second.acquire(), 0.0)
+        first.throttled()
+        self.assertEqual(second.scale, 0.5)
+
+    def testStateWrittenOnChange(self, mock_sleep):
+        root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        lock_file = os.path.join(root, "rucio.lock")
+        first = RateLimiter(requests_per_sec=10, lock_file=lock_file, increase=0.1)
+        second = RateLimiter(requests_per_sec=10, lock_file=lock_file)
+        first.acquire()
+        with patch("lsst.rucio.register.rate_limiter.open", wraps=open, create=True) as mock_open:
+            # nothing to raise, so the state is not even read
+            first.succeeded()
+            mock_open.assert_not_called()
+            with patch("json.dumps") as mock_dumps:
+                self.assertEqual(first.scale, 1.0)
+            mock_dumps.assert_not_called()
+        # once another process backs off, successes raise the rate again
+        second.throttled()
+        first.acquire()
+        first.succeeded()
+        self.assertAlmostEqual(second.scale, 0.6)
+
+    def testIsOverload(self, mock_sleep):
+        self.assertTrue(is_overload(RucioException("no error information passed (http status code: 429)")))
+        self.assertTrue(is_overload(RucioException("no error information passed (http status code: 503)")))
+        self.assertFalse(is_overload(RucioException("no error information passed (http status code: 500)")))
+        self.assertFalse(is_overload(DataIdentifierNotFound("not found")))
+
+
+class RateLimitedInterfaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRucioServer(rses=["DRR1"]).start()
+        self.addCleanup(self.server.stop)
+        client_kwargs = self.server.client_kwargs()
+        self.limiter = RateLimiter(requests_per_sec=1000, dids_per_sec=10000)
+        self.ri = RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            "/rse",
+            "root://xrd1:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=ReplicaClient(**client_kwargs),
+            did_client=DIDClient(**client_kwargs),
+            rate_limiter=self.limiter,
+        )
+
+    @patch.object(RucioInterface, "_sleep")
+    def testOverload(self, mock_sleep):
+        dids = self.ri.make_dids(["/rse/test/a.fits", "/rse/test/b.fits"], [10, 20], ["00000001", "00000002"])
+        self.ri.did_client.add_dataset("test", "mydataset")
+        self.server.inject(None, status=429, path="/dids/test/mydataset/dids")
+        self.assertEqual(self.ri.register_dids("mydataset", dids), 2)
+        self.assertEqual(self.server.requests["POST /dids/{scope}/{name}/dids"], 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(self.limiter.metrics.snapshot()["counters"]["rate_limit_backoffs"], 1)
+        # halved, then raised by the replicas and the retried attachment
+        self.assertAlmostEqual(self.limiter.scale, 0.51)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,194 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow
+import pyarrow.parquet
+from rucio.client.didclient import DIDClient
+from rucio.client.replicaclient import ReplicaClient
+
+import lsst.utils.tests
+from lsst.resources import ResourcePath
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.fake_rucio import FakeRucioServer
+from lsst.rucio.register.manifest import register_manifest
+from lsst.rucio.register.multi_rse import MultiRseInterface
+from lsst.rucio.register.rse_profiles import RseProfile, RseSelector
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.rucio_register_config import RucioRegisterConfig
+
+
+def _profile(rse, root, scope="test"):
+    return RseProfile(rucio_rse=rse, scope=scope, rse_root=root, dtn_url=f"root://{rse.lower()}//rucio")
+
+
+class RseSelectorTestCase(unittest.TestCase):
+    def testSelect(self):
+        selector = RseSelector([_profile("A", "/data"), _profile("B", "/data/b/"), _profile("C", "/other")])
+        self.assertEqual(selector.select("/data/test/a.fits"), 0)
+        # the longest root wins
+        self.assertEqual(selector.select("/data/b/test/a.fits"), 1)
+        self.assertEqual(selector.select("/data/bb/test/a.fits"), 0)
+        self.assertEqual(selector.select("/other/test/a.fits"), 2)
+        with self.assertRaises(ValueError):
+            selector.select("/elsewhere/a.fits")
+
+    def testSameRoot(self):
+        with self.assertRaises(ValueError):
+            RseSelector([_profile("A", "/data"), _profile("B", "/data/")])
+
+    def testConfig(self):
+        root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        config_file = os.path.join(root, "config.yaml")
+        with open(config_file, "w") as f:
+            f.write(
+                "rucio_rse: A\nscope: test\nrse_root: /data\ndtn_url: root://a//rucio\n"
+                "rse_profiles:\n"
+                "  - {rucio_rse: B, rse_root: /data/b, dtn_url: 'root://b//rucio'}\n"
+                "  - {rucio_rse: C, scope: other, rse_root: /other, dtn_url: 'root://c//rucio'}\n"
+            )
+        config = RucioRegisterConfig(config_file)
+        self.assertEqual([profile.rucio_rse for profile in config.rse_profiles], ["A", "B", "C"])
+        self.assertEqual([profile.scope for profile in config.rse_profiles], ["test", "test", "other"])
+
+
+class MultiRseInterfaceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.server = FakeRucioServer(rses=["DRR1", "DRR2"]).start()
+        self.addCleanup(self.server.stop)
+        client_kwargs = self.server.client_kwargs()
+        self.ri = MultiRseInterface(
+            [
+                RucioInterface(
+                    None,
+                    rse,
+                    "test",
+                    root,
+                    f"root://{rse.lower()}:1094//rucio",
+                    DataType.ZIP_FILE,
+                    replica_client=ReplicaClient(**client_kwargs),
+                    did_client=DIDClient(**client_kwargs),
+                )
+                for rse, root in [("DRR1", self.root), ("DRR2", os.path.join(self.root, "drr2"))]
+            ]
+        )
+        self.paths = []
+        for rse_root in (self.root, os.path.join(self.root, "drr2")):
+            for i in range(2):
+                path = os.path.join(rse_root, "test", "zips", f"{len(self.paths)}.zip")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(bytes([len(self.paths)]) * 10)
+                self.paths.append(path)
+
+    def testRegisterZips(self):
+        self.assertEqual(self.ri.register_zips("zips", [ResourcePath(path) for path in self.paths]), 4)
+        self.assertEqual(
+            {name: list(replicas) for (_, name), replicas in self.server.replicas.items()},
+            {"zips/0.zip": ["DRR1"], "zips/1.zip": ["DRR1"], "zips/2.zip": ["DRR2"], "zips/3.zip": ["DRR2"]},
+        )
+        self.assertEqual(
+            self.server.replicas[("test", "zips/2.zip")]["DRR2"], "root://drr2:1094//rucio/test/zips/2.zip"
+        )
+        self.assertEqual(len(self.server.dids[("test", "zips")]["children"]), 4)
+        self.assertEqual(self.ri.datasets_used, {"zips"})
+        # the dataset is closed once
+        self.assertEqual(self.ri.close_datasets(), 1)
+        self.assertFalse(self.server.dids[("test", "zips")]["open"])
+
+    def testCloseByScope(self):
+        client_kwargs = self.server.client_kwargs()
+        ri = MultiRseInterface(
+            [
+                RucioInterface(
+                    None,
+                    rse,
+                    scope,
+                    root,
+                    f"root://{rse.lower()}:1094//rucio",
+                    DataType.ZIP_FILE,
+                    replica_client=ReplicaClient(**client_kwargs),
+                    did_client=DIDClient(**client_kwargs),
+                )
+                for rse, scope, root in [
+                    ("DRR1", "test", self.root),
+                    ("DRR2", "other", os.path.join(self.root, "drr2")),
+                ]
+            ]
+        )
+        path = os.path.join(self.root, "drr2", "other", "zips", "4.zip")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"other")
+        ri.register_zips("zips", [ResourcePath(p) for p in [self.paths[0], path]])
+        ri.interfaces[0].did_client.add_dataset("test", "empty")
+
+        # each dataset is closed in the scope files were attached in
+        self.assertEqual(ri.close_datasets(["zips", "empty"]), 3)
+        self.assertFalse(self.server.dids[("test", "zips")]["open"])
+        self.assertFalse(self.server.dids[("other", "zips")]["open"])
+        self.assertFalse(self.server.dids[("test", "empty")]["open"])
+
+    def testNoFallback(self):
+        # attributes of a single RSE are not taken from the first one
+        with self.assertRaises(AttributeError):
+            self.ri.rse_root
+        self.assertIs(self.ri.metrics, self.ri.interfaces[0].metrics)
+
+    def testWithDataType(self):
+        dim_ri = self.ri.with_data_type(DataType.DIM_FILE)
+        dim_ri.register_dims("dims", [self.paths[3]])
+        self.assertEqual(dim_ri.interfaces[1].rubin_butler_type, DataType.DIM_FILE)
+        self.assertEqual(self.ri.datasets_used, {"dims"})
+
+    def testManifest(self):
+        manifest = os.path.join(self.root, "manifest.parquet")
+        hashes = [self.ri.compute_hashes(ResourcePath(path)) for path in self.paths]
+        table = pyarrow.table(
+            {
+                "path": self.paths,
+                "size": [size for size, _ in hashes],
+                "adler32": [adler32 for _, adler32 in hashes],
+            }
+        )
+        pyarrow.parquet.write_table(table, manifest)
+        self.assertEqual(register_manifest(self.ri, manifest, "manifest", 10), 4)
+        self.assertEqual(
+            sorted(rse for replicas in self.server.replicas.values() for rse in replicas),
+            ["DRR1", "DRR1", "DRR2", "DRR2"],
+        )
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["files_registered"], 4)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
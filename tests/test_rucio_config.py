@@ -36,6 +36,9 @@ class RucioRegisterConfigTestCase(unittest.TestCase):
         self.assertEqual(rrc.scope, "testscope")
         self.assertEqual(rrc.rse_root, "/rse/root")
         self.assertEqual(rrc.dtn_url, "root://rse1:1094//rucio")
+        self.assertIsNone(rrc.requests_per_sec)
+        self.assertIsNone(rrc.dids_per_sec)
+        self.assertEqual(rrc.rate_limit_burst, 1.0)
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
@@ -0,0 +1,107 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+from unittest.mock import MagicMock
+
+from rucio.common.exception import DuplicateRule
+
+import lsst.utils.tests
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient, LatencyRuleClient
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.rules import ReplicationRule
+
+
+class RulesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rules = [
+            ReplicationRule(rse_expression="USDF", copies=2, lifetime=86400, pattern="DP1_"),
+            ReplicationRule(rse_expression="IN2P3", data_types=[DataType.RAW_FILE]),
+        ]
+        self.rule_client = LatencyRuleClient()
+
+    def makeInterface(self, rubin_butler_type, rule_client=None):
+        return RucioInterface(
+            None,
+            "DRR1",
+            "test",
+            "/rse",
+            "root://xrd1:1094//rucio",
+            rubin_butler_type,
+            replica_client=LatencyReplicaClient(),
+            did_client=LatencyDIDClient(),
+            replication_rules=self.rules,
+            rule_client=rule_client or self.rule_client,
+        )
+
+    def testAppliesTo(self):
+        self.assertTrue(self.rules[0].applies_to("DP1_raw", DataType.DATA_PRODUCT))
+        self.assertFalse(self.rules[0].applies_to("DP2_raw", DataType.DATA_PRODUCT))
+        self.assertTrue(self.rules[1].applies_to("DP2_raw", DataType.RAW_FILE))
+        self.assertFalse(self.rules[1].applies_to("DP2_raw", DataType.ZIP_FILE))
+
+    def testBulkRules(self):
+        ri = self.makeInterface(DataType.RAW_FILE)
+        dids = ri.make_dids(["/rse/test/a.fits"], [10], ["00000001"])
+        ri.attach({"DP1_a": dids, "DP1_b": dids, "other": dids})
+        # one request per rule, covering all the datasets it applies to
+        self.assertEqual(self.rule_client.requests, 2)
+        self.assertEqual(
+            [name for name, _ in self.rule_client.rules], ["DP1_a", "DP1_b", "DP1_a", "DP1_b", "other"]
+        )
+        options = self.rule_client.rules[0][1]
+        self.assertEqual(
+            (options["rse_expression"], options["copies"], options["lifetime"]), ("USDF", 2, 86400)
+        )
+        self.assertEqual(options["grouping"], "DATASET")
+
+        # rules are created once per dataset
+        ri.register_dids("DP1_a", dids)
+        self.assertEqual(self.rule_client.requests, 2)
+        self.assertEqual(ri.metrics.snapshot()["counters"]["rules_created"], 5)
+
+    def testDataTypes(self):
+        ri = self.makeInterface(DataType.DIM_FILE)
+        ri.register_dids("other", ri.make_dids(["/rse/test/a.yaml"], [10], ["00000001"]))
+        self.assertEqual(self.rule_client.rules, [])
+
+    def testDuplicateRule(self):
+        rule_client = MagicMock()
+        rule_client.add_replication_rule.side_effect = [
+            DuplicateRule("exists"),
+            DuplicateRule("exists"),
+            ["id"],
+        ]
+        ri = self.makeInterface(DataType.DATA_PRODUCT, rule_client)
+        ri.add_rules(["DP1_a", "DP1_b"])
+        self.assertEqual(rule_client.add_replication_rule.call_count, 3)
+        counters = ri.metrics.snapshot()["counters"]
+        self.assertEqual((counters["rules_created"], counters["rules_existing"]), (1, 1))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,330 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+import lsst.utils.tests
+from lsst.daf.butler import Butler, DatasetRef, DatasetType, FileDataset, InvalidQueryError
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient, make_synthetic_repo
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.metrics import Metrics
+from lsst.rucio.register.multi_rse import MultiRseInterface
+from lsst.rucio.register.query import iter_datasets
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.script import _get_config, _register_with_export, _stream_refs, main
+
+
+class ScriptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.butler = make_synthetic_repo(self.root, "bench", 5, 10)
+        self.rc = LatencyReplicaClient()
+        self.dc = LatencyDIDClient()
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def makeInterface(self, rubin_butler_type, butler=None):
+        return RucioInterface(
+            butler,
+            "BENCH",
+            "bench",
+            self.root,
+            "root://bench:1094//rucio",
+            rubin_butler_type,
+            replica_client=self.rc,
+            did_client=self.dc,
+            metrics=self.metrics,
+        )
+
+    def testRegisterWithExport(self):
+        ri = self.makeInterface(DataType.DATA_PRODUCT, self.butler)
+        dim_ri = self.makeInterface(DataType.DIM_FILE)
+        refs = self.butler.query_datasets("rucio_register_bench", "bench/run", with_dimension_records=True)
+        export_file = os.path.join(self.root, "bench", "export.yaml")
+
+        # the export is written from the locations found for registration
+        with patch.object(Butler, "export", side_effect=AssertionError):
+            _register_with_export(ri, dim_ri, refs, 2, "mydataset", export_file)
+
+        with open(export_file) as f:
+            self.assertEqual(f.read().count("dataset_id:"), 5)
+        # five data products and the export file
+        self.assertEqual(self.rc.replicas, 6)
+        self.assertEqual(self.dc.attached, 6)
+        self.assertEqual(self.metrics.snapshot()["counters"]["files_registered"], 6)
+
+    def testExportOutsideScope(self):
+        ri = self.makeInterface(DataType.DATA_PRODUCT, self.butler)
+        dim_ri = self.makeInterface(DataType.DIM_FILE)
+        with self.assertRaises(RuntimeError):
+            _register_with_export(ri, dim_ri, [], 2, "mydataset", os.path.join(self.root, "export.yaml"))
+
+    def invoke(self, *args, config_extra="", interfaces=None, exit_code=0):
+        config = os.path.join(self.root, "config.yaml")
+        with open(config, "w") as f:
+            f.write(
+                f"rucio_rse: BENCH\nscope: bench\nrse_root: {self.root}\ndtn_url: root://bench:1094//rucio\n"
+            )
+            f.write(config_extra)
+        interface = functools.partial(RucioInterface, replica_client=self.rc, did_client=self.dc)
+        if interfaces is not None:
+
+            def interface(*args, **kwargs):
+                interfaces.append(RucioInterface(*args, replica_client=self.rc, did_client=self.dc, **kwargs))
+                return interfaces[-1]
+
+        with patch("lsst.rucio.register.script.RucioInterface", interface):
+            result = CliRunner().invoke(
+                main,
+                [
+                    args[0],
+                    "--repo",
+                    os.path.join(self.root, "bench", "repo"),
+                    "--rucio-dataset",
+                    "mydataset",
+                    "--rucio-register-config",
+                    config,
+                    "--collections",
+                    "bench/run",
+                    *args[1:],
+                ],
+            )
+        self.assertEqual(result.exit_code, exit_code, result.output)
+        return result
+
+    def testRaws(self):
+        self.invoke("raws", "--page-size", "2", "--chunk-size", "3", "rucio_register_bench")
+        self.assertEqual(self.rc.replicas, 5)
+        self.assertEqual(self.dc.attached, 5)
+
+    def testDataProducts(self):
+        self.invoke("data-products", "--prefetch-depth", "0", "--dataset-type", "rucio_register_bench")
+        self.assertEqual(self.rc.replicas, 5)
+
+    def testAttachMode(self):
+        self.invoke("raws", "--mode", "attach", "rucio_register_bench")
+        self.assertEqual(self.rc.replicas, 0)
+        self.assertEqual(self.dc.attached, 5)
+        self.assertNotIn("bytes_hashed", self.metrics.snapshot()["counters"])
+
+    def testContainers(self):
+        config_extra = (
+            'containers:\n  - pattern: my\n    containers: [bench, "bench_{dataset}"]\nclose_datasets: true\n'
+        )
+        self.invoke("raws", "rucio_register_bench", config_extra=config_extra)
+        self.assertEqual(self.dc.dids["bench_mydataset"], "CONTAINER")
+        self.assertEqual(self.dc.children, {"bench": ["bench_mydataset"], "bench_mydataset": ["mydataset"]})
+        self.assertEqual(self.dc.closed, {"mydataset"})
+
+    def testRseProfiles(self):
+        config_extra = f"rse_profiles:\n  - {{rucio_rse: OTHER, rse_root: {self.root}/bench, dtn_url: 'root://other//rucio'}}\n"
+        interfaces = []
+        self.invoke("raws", "rucio_register_bench", config_extra=config_extra, interfaces=interfaces)
+        self.assertEqual([ri.rse for ri in interfaces], ["BENCH", "OTHER"])
+        # the files are below the root of the second RSE
+        self.assertEqual(self.rc.replicas, 5)
+        self.assertEqual(interfaces[0].datasets_used, set())
+        self.assertEqual(interfaces[1].datasets_used, {"mydataset"})
+
+    def testRseProfilesShareResolver(self):
+        config_extra = (
+            f"rse_profiles:\n  - {{rucio_rse: OTHER, rse_root: {self.root}/bench, dtn_url: 'root://other//rucio'}}\n"
+            f"path_template_root: {self.root}/bench/repo\npath_templates:\n  other_type: '{{run}}/{{id}}'\n"
+        )
+        interfaces = []
+        self.invoke("raws", "rucio_register_bench", config_extra=config_extra, interfaces=interfaces)
+        # every RSE resolves the locations of the datasets it registers
+        self.assertIsNotNone(interfaces[0].path_resolver)
+        self.assertIs(interfaces[1].path_resolver, interfaces[0].path_resolver)
+
+    def testRseProfilesWalk(self):
+        path = os.path.join(self.root, "other", "scratch", "zips", "a.zip")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("a")
+        config_extra = (
+            "rse_profiles:\n"
+            f"  - {{rucio_rse: OTHER, scope: scratch, rse_root: {self.root}/other, dtn_url: 'root://other//rucio'}}\n"
+        )
+        interfaces = []
+        self.invoke("walk", "--exclude", "repo", config_extra=config_extra, interfaces=interfaces)
+        # the scope of each RSE is walked, and its files registered there
+        self.assertEqual(self.rc.replicas, 6)
+        self.assertEqual(interfaces[0].datasets_used, {"mydataset"})
+        self.assertEqual(interfaces[1].datasets_used, {"mydataset"})
+        self.assertEqual(self.dc.attached, 6)
+
+    def testExportInOtherScope(self):
+        ri = MultiRseInterface(
+            [
+                self.makeInterface(DataType.DATA_PRODUCT, self.butler),
+                RucioInterface(
+                    self.butler,
+                    "OTHER",
+                    "scratch",
+                    os.path.join(self.root, "other"),
+                    "root://other:1094//rucio",
+                    DataType.DATA_PRODUCT,
+                    replica_client=self.rc,
+                    did_client=self.dc,
+                    metrics=self.metrics,
+                ),
+            ]
+        )
+        export_file = os.path.join(self.root, "other", "scratch", "export.yaml")
+        os.makedirs(os.path.dirname(export_file))
+        refs = self.butler.query_datasets("rucio_register_bench", "bench/run", with_dimension_records=True)
+
+        # the export may be below the scope of any RSE
+        _register_with_export(ri, ri.with_data_type(DataType.DIM_FILE), refs, 2, "mydataset", export_file)
+        self.assertEqual(self.rc.replicas, 6)
+        self.assertEqual(ri.interfaces[1].datasets_used, {"mydataset"})
+        with self.assertRaises(RuntimeError):
+            _register_with_export(ri, ri, [], 2, "mydataset", os.path.join(self.root, "export.yaml"))
+
+    def testMemoryBounded(self):
+        with patch("lsst.rucio.register.script.QueryDatasets") as mock_query:
+            self.invoke("raws", "--max-records", "10", "--chunk-size", "3", "rucio_register_bench")
+            self.invoke(
+                "data-products",
+                "--max-records",
+                "10",
+                "--max-rss",
+                "100000",
+                "--chunk-size",
+                "3",
+                "--dataset-type",
+                "rucio_register_bench",
+            )
+        # the results were streamed rather than listed
+        mock_query.assert_not_called()
+        self.assertEqual(self.rc.replicas, 10)
+        self.assertEqual(self.dc.attached, 10)
+        result = self.invoke(
+            "raws", "--max-records", "3", "--chunk-size", "3", "rucio_register_bench", exit_code=2
+        )
+        self.assertIn("record budget", result.output)
+
+    def testQueryOverlapsRegistration(self):
+        registered = threading.Event()
+        add_replicas = self.rc.add_replicas
+        waited = []
+
+        def register(*args, **kwargs):
+            registered.set()
+            return add_replicas(*args, **kwargs)
+
+        def paged(*args, **kwargs):
+            for i, ref in enumerate(iter_datasets(*args, **kwargs)):
+                if i == 4:
+                    # the query is not finished until a chunk is registered
+                    waited.append(registered.wait(10))
+                yield ref
+
+        with (
+            patch.object(self.rc, "add_replicas", side_effect=register),
+            patch("lsst.rucio.register.script.iter_datasets", side_effect=paged),
+        ):
+            self.invoke(
+                "raws",
+                "--page-size",
+                "2",
+                "--prefetch-depth",
+                "1",
+                "--chunk-size",
+                "2",
+                "rucio_register_bench",
+            )
+        self.assertEqual(waited, [True])
+        self.assertEqual(self.rc.replicas, 5)
+
+    def testConnectOnFirstUse(self):
+        connections = []
+
+        def butler(*args, **kwargs):
+            connections.append((threading.current_thread().name, self.rc.replicas))
+            return Butler(*args, **kwargs)
+
+        with patch("lsst.rucio.register.lazy_butler.Butler", side_effect=butler):
+            self.invoke("raws", "rucio_register_bench")
+        # the query connects once, on the prefetch thread
+        self.assertEqual(connections, [("prefetch", 0)])
+        self.assertEqual(self.rc.replicas, 5)
+
+    def testStreamLimit(self):
+        dataset_type = DatasetType(
+            "bench_other", ["instrument", "detector"], "StructuredDataDict", universe=self.butler.dimensions
+        )
+        self.butler.registry.registerDatasetType(dataset_type)
+        file_datasets = []
+        for i in range(5):
+            path = os.path.join(self.root, "bench", f"other_{i}.json")
+            with open(path, "w") as f:
+                f.write("{}")
+            ref = DatasetRef(dataset_type, {"instrument": "BenchCam", "detector": i}, run="bench/run")
+            file_datasets.append(FileDataset(path=path, refs=[ref]))
+        self.butler.ingest(*file_datasets, transfer="direct")
+
+        def stream(collections, limit, find_first=False):
+            return list(_stream_refs(self.butler, ["*"], collections, "", find_first, limit, ()))
+
+        # the limit, and its warning, apply once across dataset types
+        with self.assertLogs("lsst.rucio.register.script", "WARNING") as cm:
+            self.assertEqual(len(stream(["bench/run"], -7)), 7)
+        self.assertEqual(len(cm.output), 1)
+        self.assertEqual(len(stream(["bench/run"], 7)), 7)
+        with self.assertNoLogs("lsst.rucio.register.script", "WARNING"):
+            self.assertEqual(len(stream(["bench/run"], -10)), 10)
+        for collections in ([], ["bench/*"]):
+            with self.assertRaises(InvalidQueryError):
+                stream(collections, -10, find_first=True)
+
+    def testConfigCache(self):
+        config = os.path.join(self.root, "config.yaml")
+        with open(config, "w") as f:
+            f.write(
+                f"rucio_rse: BENCH\nscope: bench\nrse_root: {self.root}\ndtn_url: root://bench:1094//rucio\n"
+            )
+        self.assertIs(_get_config(config), _get_config(config))
+        stat = os.stat(config)
+        with open(config, "a") as f:
+            f.write("close_datasets: true\n")
+        os.utime(config, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertTrue(_get_config(config).close_datasets)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
@@ -0,0 +1,105 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lsst.utils.tests
+from lsst.daf.butler import DatasetRef, DimensionUniverse
+from lsst.rucio.register.benchmark import make_synthetic_repo
+from lsst.rucio.register.sidecar import SidecarBuilder, decode_sidecar, encode_sidecar
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class SidecarTestCase(unittest.TestCase):
+    def setUp(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(test_dir, "data", "dataset_ref.json")) as f:
+            self.sidecar = f.readline().strip()
+
+    def testJson(self):
+        self.assertEqual(encode_sidecar(self.sidecar), self.sidecar)
+        self.assertEqual(decode_sidecar(self.sidecar), self.sidecar)
+
+    def testZlib(self):
+        encoded = encode_sidecar(self.sidecar, "zlib")
+        self.assertTrue(encoded.startswith("zlib:"))
+        self.assertLess(len(encoded), len(self.sidecar))
+        self.assertEqual(decode_sidecar(encoded), self.sidecar)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def testZstd(self):
+        encoded = encode_sidecar(self.sidecar, "zstd")
+        self.assertTrue(encoded.startswith("zstd:"))
+        self.assertEqual(decode_sidecar(encoded), self.sidecar)
+
+    def testEmpty(self):
+        self.assertEqual(encode_sidecar("", "zlib"), "")
+        self.assertEqual(decode_sidecar(None), "")
+
+    def testUnknown(self):
+        with self.assertRaises(ValueError):
+            encode_sidecar(self.sidecar, "bz2")
+
+
+class SidecarBuilderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.butler = make_synthetic_repo(self.root, "bench", 4, 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def testSharedRecords(self):
+        refs = self.butler.query_datasets("rucio_register_bench", "bench/run", with_dimension_records=True)
+        builder = SidecarBuilder()
+        for ref in refs + refs:
+            self.assertEqual(builder.to_json(ref), ref.to_json())
+        # one instrument and four detector records
+        self.assertEqual(builder.misses, 5)
+        self.assertEqual(builder.hits, 11)
+
+    def testLimit(self):
+        refs = self.butler.query_datasets("rucio_register_bench", "bench/run", with_dimension_records=True)
+        builder = SidecarBuilder(max_records=2)
+        self.assertEqual([builder.to_json(ref) for ref in refs], [ref.to_json() for ref in refs])
+        self.assertLessEqual(len(builder._records), 2)
+
+    def testWithoutRecords(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(test_dir, "data", "dataset_ref.json")) as f:
+            ref = DatasetRef.from_json(f.readline(), DimensionUniverse())
+        self.assertEqual(SidecarBuilder().to_json(ref), ref.to_json())
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
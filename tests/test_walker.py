@@ -0,0 +1,162 @@
+# This file is part of rucio_register
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import lsst.utils.tests
+from lsst.daf.butler import DatasetRef, DatasetType, FileDataset
+from lsst.rucio.register.benchmark import LatencyDIDClient, LatencyReplicaClient, make_synthetic_repo
+from lsst.rucio.register.data_type import DataType
+from lsst.rucio.register.rucio_interface import RucioInterface
+from lsst.rucio.register.walker import ButlerPathIndex, classify, register_tree, scan_tree
+
+
+class _RecordingReplicaClient(LatencyReplicaClient):
+    def __init__(self):
+        super().__init__()
+        self.files = []
+
+    def add_replicas(self, rse, files, ignore_availability=True):
+        self.files.extend(files)
+        return super().add_replicas(rse, files, ignore_availability)
+
+
+class WalkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir="/tmp")
+        self.butler = make_synthetic_repo(self.root, "bench", 5, 10)
+        self.scope_dir = os.path.join(self.root, "bench")
+        for name in ["raw/LATISS/raw_1.fits", "zips/a.zip", "exports/dims.yaml"]:
+            path = os.path.join(self.scope_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(name)
+        self.rc = _RecordingReplicaClient()
+        self.ri = RucioInterface(
+            self.butler,
+            "BENCH",
+            "bench",
+            self.root,
+            "root://bench:1094//rucio",
+            DataType.DATA_PRODUCT,
+            replica_client=self.rc,
+            did_client=LatencyDIDClient(),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def testClassify(self):
+        self.assertEqual(classify("a/b.zip"), DataType.ZIP_FILE)
+        self.assertEqual(classify("exports/dims.yaml"), DataType.DIM_FILE)
+        self.assertEqual(classify("LATISS/raw/all/raw/x.fits"), DataType.RAW_FILE)
+        self.assertEqual(classify("LATISS/runs/calexp/x.fits"), DataType.DATA_PRODUCT)
+        # YAML Butler datasets are not dimension files
+        self.assertEqual(classify("runs/config/x.yaml", butler_dataset=True), DataType.DATA_PRODUCT)
+        self.assertEqual(classify("LATISS/raw/x.yaml", butler_dataset=True), DataType.RAW_FILE)
+
+    def testScan(self):
+        files = dict(scan_tree(self.scope_dir, jobs=3, exclude=["repo"]))
+        self.assertEqual(len(files), 8)
+        self.assertEqual(files[os.path.join(self.scope_dir, "zips", "a.zip")], len("zips/a.zip"))
+        self.assertFalse(any("/repo/" in path for path in files))
+
+    def testScanBounded(self):
+        many = os.path.join(self.scope_dir, "many")
+        for i in range(20):
+            os.makedirs(os.path.join(many, f"d{i}"))
+            with open(os.path.join(many, f"d{i}", "f"), "w") as f:
+                f.write("f")
+        with patch("lsst.rucio.register.walker.os.scandir", wraps=os.scandir) as mock_scandir:
+            files = scan_tree(self.scope_dir, jobs=2, exclude=["repo"])
+            for path, _ in files:
+                if path.startswith(many):
+                    break
+            time.sleep(0.5)
+            # while files are not consumed, at most jobs directories are
+            # scanned ahead, rather than all 20 found below many
+            self.assertLess(mock_scandir.call_count, 20)
+            files.close()
+
+    def testRegister(self):
+        path_index = ButlerPathIndex(self.butler, ["bench/run"])
+        self.addCleanup(path_index.close)
+        counts = register_tree(
+            self.ri, self.scope_dir, "mydataset", 3, jobs=2, exclude=["repo"], path_index=path_index
+        )
+        self.assertEqual(
+            counts,
+            {DataType.DATA_PRODUCT: 5, DataType.RAW_FILE: 1, DataType.ZIP_FILE: 1, DataType.DIM_FILE: 1},
+        )
+        sidecars = {did["name"]: did["meta"]["rubin_sidecar"] for did in self.rc.files}
+        self.assertIn('"datasetType"', sidecars["bench/rucio_register_bench_000000.json"])
+        self.assertEqual(sidecars["raw/LATISS/raw_1.fits"], "")
+        self.assertEqual(sidecars["zips/a.zip"], "")
+        self.assertEqual(self.ri.metrics.snapshot()["counters"]["sidecars_missing"], 1)
+
+    def testYamlDataset(self):
+        path = os.path.join(self.scope_dir, "products", "config.yaml")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("a: 1\n")
+        dataset_type = DatasetType(
+            "bench_config", ["instrument"], "StructuredDataDict", universe=self.butler.dimensions
+        )
+        self.butler.registry.registerDatasetType(dataset_type)
+        ref = DatasetRef(dataset_type, {"instrument": "BenchCam"}, run="bench/run")
+        self.butler.ingest(
+            FileDataset(path=path, refs=[ref], formatter="lsst.daf.butler.formatters.yaml.YamlFormatter"),
+            transfer="direct",
+        )
+        path_index = ButlerPathIndex(self.butler, ["bench/run"])
+        self.addCleanup(path_index.close)
+        counts = register_tree(
+            self.ri, self.scope_dir, "mydataset", 100, exclude=["repo"], path_index=path_index
+        )
+        self.assertEqual(counts[DataType.DATA_PRODUCT], 6)
+        self.assertEqual(counts[DataType.DIM_FILE], 1)
+        sidecars = {did["name"]: did["meta"]["rubin_sidecar"] for did in self.rc.files}
+        self.assertIn('"bench_config"', sidecars["products/config.yaml"])
+
+    def testLookup(self):
+        path_index = ButlerPathIndex(self.butler, ["bench/run"])
+        self.addCleanup(path_index.close)
+        paths = [os.path.join(self.scope_dir, "bench", f"rucio_register_bench_00000{i}.json") for i in (1, 3)]
+        refs = path_index.lookup(paths + [os.path.join(self.scope_dir, "zips", "a.zip")])
+        # only the files asked for are looked up, with their records
+        self.assertEqual(sorted(refs), paths)
+        self.assertEqual(refs[paths[1]].dataId["detector"], 3)
+        self.assertTrue(refs[paths[0]].dataId.hasRecords())
+        self.assertEqual(path_index.lookup([]), {})
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()